@@ -2,8 +2,11 @@ from pydantic_settings import BaseSettings
 from functools import lru_cache
 from typing import Optional
 from pathlib import Path
+import logging
 import os
 
+logger = logging.getLogger(__name__)
+
 class Settings(BaseSettings):
     """应用配置"""
     
@@ -79,9 +82,7 @@ def get_settings():
         print(f"   - Cognito Client ID: {settings.cognito_client_id[:20] if settings.cognito_client_id else 'N/A'}...")
         return settings
     except Exception as e:
-        print(f"❌ 配置加载失败: {str(e)}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("❌ 配置加载失败: %s", str(e))
         # 在 Lambda 环境中，尝试从环境变量直接读取
         print(f"⚠️ 尝试从环境变量直接读取配置...")
         return Settings(
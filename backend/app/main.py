@@ -1,3 +1,6 @@
+import logging
+import os
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.security import HTTPBearer
@@ -5,15 +8,23 @@ from fastapi.openapi.utils import get_openapi
 from datetime import datetime  # 用于健康检查的时间戳
 from .routers import diary, auth, account  # 新增 auth 路由
 from .config import get_settings
+from .services.openai_service import get_openai_service
+from .utils.http_client import close_http_client
+
+logger = logging.getLogger(__name__)
+
+# 日志级别：默认 INFO，DEBUG 级别的调试输出（惰性格式化）只在 LOG_LEVEL=DEBUG 时产生开销
+# Lambda 运行时已为根 logger 挂好 handler，basicConfig 不生效，所以这里显式 setLevel
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+logging.basicConfig(level=LOG_LEVEL)
+logging.getLogger().setLevel(LOG_LEVEL)
 
 # 获取配置（延迟初始化，避免启动时失败）
 try:
     settings=get_settings()
     print(f"✅ 配置加载成功 - 表名: {settings.dynamodb_table_name}, 区域: {settings.aws_region}")
 except Exception as e:
-    print(f"❌ 配置加载失败: {str(e)}")
-    import traceback
-    traceback.print_exc()
+    logger.exception("❌ 配置加载失败: %s", str(e))
     # 设置默认值，避免应用无法启动
     class DefaultSettings:
         app_name = "Gratitude Diary API"
@@ -31,8 +42,20 @@ security = HTTPBearer(
     description="输入从Cognito获取的JWT token"
 )
 
+# 应用生命周期：启动时预热 AI 服务，关闭时释放共享 HTTP 连接池
+# （本地 uvicorn；Lambda 中 lifespan 关闭，由 lambda_handler 导入时预热）
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    try:
+        get_openai_service()
+    except Exception:
+        logger.warning("⚠️ AI 服务预热失败（首个请求时再初始化）", exc_info=True)
+    yield
+    await close_http_client()
+
 # 创建FastAPI应用, 配置标题和描述
 app=FastAPI(
+    lifespan=lifespan,
     title=settings.app_name,
     description="感恩日记后端API - 记录生活中的美好时刻",
     version="1.0.0",
@@ -141,12 +164,15 @@ async def health_check():
         return {
             "status": "healthy",
             "config": config_status,
+            # 任务进度缓存：evictions 持续增长说明上限偏小，或有任务没有走到终态
+            "task_cache": {
+                "entries": len(diary.task_progress),
+                "evictions": diary.task_progress_evictions
+            },
             "timestamp": datetime.now(timezone.utc).isoformat()
         }
     except Exception as e:
-        print(f"❌ 健康检查失败: {str(e)}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("❌ 健康检查失败: %s", str(e))
         return {
             "status": "unhealthy",
             "error": str(e)
@@ -1,4 +1,4 @@
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, field_validator
 from typing import Optional, List
 from datetime import datetime
 
@@ -41,6 +41,27 @@ class PresignedUrlRequest(BaseModel):
             }
         }
 
+class AudioPresignRequest(BaseModel):
+    """请求音频直传预签名 URL 的数据（以表单字段提交）"""
+    file_name: str = Field("recording.m4a", min_length=1, max_length=255, description="音频文件名")
+    content_type: str = Field("audio/m4a", description="音频 MIME 类型（必须是 audio/*）")
+
+    @field_validator("content_type")
+    @classmethod
+    def _must_be_audio(cls, value: str) -> str:
+        # ✅ 在进入路由函数之前就拒绝非音频类型，FastAPI 直接返回 422
+        if not value.startswith("audio/"):
+            raise ValueError(f"Invalid content type: {value}. Must be audio/*")
+        return value
+
+    class Config:
+        json_schema_extra = {
+            "example": {
+                "file_name": "recording.m4a",
+                "content_type": "audio/m4a"
+            }
+        }
+
 class ImageOnlyDiaryCreate(BaseModel):
     """创建图片日记的请求数据（支持可选文字）"""
     image_urls: List[str] = Field(..., min_items=1, max_items=9, description="图片URL列表（最多9张）")
@@ -76,6 +97,7 @@ class DiaryResponse(BaseModel):
     audio_duration: Optional[int] = Field(None, description="音频时长(秒)")
     image_urls: Optional[List[str]] = None  # List of image URLs (max 9)
     emotion_data: Optional[dict] = Field(None, description="情感分析结果")
+    version: Optional[int] = Field(None, description="版本号（编辑时通过 If-Match 传回，用于乐观锁）")
 
 
     class Config:
@@ -2,19 +2,22 @@
 
 from fastapi import APIRouter, Depends, HTTPException
 from typing import Dict
+import asyncio
+import logging
 import boto3
 from botocore.exceptions import ClientError
 
 from ..utils.cognito_auth import get_current_user
-from ..services.dynamodb_service import DynamoDBService
-from ..services.s3_service import S3Service
+from ..services.dynamodb_service import get_dynamodb_service
+from ..services.s3_service import get_s3_service
 from ..config import get_settings, get_boto3_kwargs
 
+logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
-db_service = DynamoDBService()
-s3_service = S3Service()
+db_service = get_dynamodb_service()
+s3_service = get_s3_service()
 
 
 def _get_cognito_client():
@@ -38,21 +41,19 @@ async def delete_account(user: Dict = Depends(get_current_user)):
     if not user_id or not username:
         raise HTTPException(status_code=400, detail="用户信息缺失，无法删除账号")
 
-    print(f"🗑️ 收到账号删除请求 - user_id: {user_id}, username: {username}")
+    logger.info("🗑️ 收到账号删除请求 - user_id: %s, username: %s", user_id, username)
 
     try:
-        audio_urls = db_service.delete_user_data(user_id)
-        print(
-            f"🧹 已删除用户日记，共 {len(audio_urls)} 条音频记录需要清理"
-        )
+        audio_urls = await asyncio.to_thread(db_service.delete_user_data, user_id)
+        logger.info("🧹 已删除用户日记，共 %s 条音频记录需要清理", len(audio_urls))
     except Exception as e:
-        print(f"❌ 删除用户日记失败: {e}")
+        logger.exception("❌ 删除用户日记失败: %s", e)
         raise HTTPException(status_code=500, detail="删除用户内容失败")
 
     try:
-        s3_service.delete_objects_by_urls(audio_urls)
+        await asyncio.to_thread(s3_service.delete_objects_by_urls, audio_urls)
     except Exception as e:
-        print(f"⚠️ 删除S3文件失败: {e}")
+        logger.exception("⚠️ 删除S3文件失败: %s", e)
         raise HTTPException(status_code=500, detail="删除用户存储文件失败")
 
     try:
@@ -61,16 +62,16 @@ async def delete_account(user: Dict = Depends(get_current_user)):
             UserPoolId=settings.cognito_user_pool_id,
             Username=username,
         )
-        print("✅ Cognito 用户删除成功")
+        logger.info("✅ Cognito 用户删除成功")
     except ClientError as e:
         error_code = e.response.get("Error", {}).get("Code", "")
         if error_code == "UserNotFoundException":
-            print("⚠️ Cognito 中未找到用户，视为已删除")
+            logger.warning("⚠️ Cognito 中未找到用户，视为已删除")
         else:
-            print(f"❌ 删除 Cognito 用户失败: {error_code} - {e}")
+            logger.exception("❌ 删除 Cognito 用户失败: %s - %s", error_code, e)
             raise HTTPException(status_code=500, detail="删除用户账号失败")
     except Exception as e:
-        print(f"❌ Cognito 删除过程异常: {e}")
+        logger.exception("❌ Cognito 删除过程异常: %s", e)
         raise HTTPException(status_code=500, detail="删除用户账号失败")
 
     return {"success": True}
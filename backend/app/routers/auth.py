@@ -16,19 +16,23 @@
 from fastapi import APIRouter, HTTPException, Depends
 from pydantic import BaseModel
 from typing import Dict, Optional
+import asyncio
 import boto3
 import json
+import logging
 from jose import jwt
 from botocore.exceptions import ClientError
 import uuid
 from datetime import datetime
 from ..utils.cognito_auth import get_current_user
-from ..services.dynamodb_service import DynamoDBService
+from ..services.dynamodb_service import get_dynamodb_service
 from ..config import get_settings, get_boto3_kwargs
 
+logger = logging.getLogger(__name__)
+
 # 创建路由器
 router = APIRouter()
-db_service = DynamoDBService()
+db_service = get_dynamodb_service()
 
 # AWS Cognito 配置
 COGNITO_USER_POOL_ID = "us-east-1_1DgDNffb0"
@@ -361,9 +365,7 @@ async def refresh_token(request: RefreshTokenRequest):
         print(f"❌ Cognito错误: [{error_code}] {error_msg}")
         raise HTTPException(status_code=401, detail="登录已过期")
     except Exception as e:
-        print(f"❌ 未知错误: {str(e)}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("❌ 未知错误: %s", str(e))
         raise HTTPException(status_code=500, detail="服务错误")
 
 
@@ -1326,7 +1328,7 @@ async def update_user_name(
             print(f"✅ 用户姓名更新成功")
 
             try:
-                db_service.upsert_user_profile(user_id=username, name=request.name)
+                await asyncio.to_thread(db_service.upsert_user_profile, user_id=username, name=request.name)
             except Exception as profile_error:
                 print(f"⚠️ 更新用户档案失败: {profile_error}")
                 # 不抛出异常，以免影响主流程
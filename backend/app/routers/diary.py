@@ -8,11 +8,23 @@
 """
 
 from fastapi import APIRouter, UploadFile, File, HTTPException, Depends, Form, Request, Query, Body, Header
-from fastapi.responses import StreamingResponse
-from typing import List, Dict, Optional, AsyncGenerator
+from fastapi.responses import ORJSONResponse, StreamingResponse, Response
+from starlette.background import BackgroundTask
+from typing import Annotated, List, Dict, Optional, AsyncGenerator, BinaryIO, Tuple, Union
+from collections import OrderedDict
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass
+from types import MappingProxyType
 import asyncio
+import base64
+import hashlib
+import io
+import math
+import os
 import re
-import json
+import shutil
+import tempfile
+import orjson
 import uuid
 import time
 import logging
@@ -20,26 +32,29 @@ from datetime import datetime, timezone
 
 logger = logging.getLogger(__name__)
 
-from ..models.diary import DiaryCreate, DiaryResponse, DiaryUpdate, ImageOnlyDiaryCreate, PresignedUrlRequest
-from ..services.openai_service import OpenAIService
-from ..services.dynamodb_service import DynamoDBService
-from ..services.s3_service import S3Service
+from ..models.diary import AudioPresignRequest, DiaryCreate, DiaryResponse, DiaryUpdate, ImageOnlyDiaryCreate, PresignedUrlRequest
+from ..services.openai_service import get_openai_service, resolve_language, LANGUAGE_CODES
+from ..services.dynamodb_service import TERMINAL_TASK_STATUSES, get_dynamodb_service
+from ..services.s3_service import get_s3_service
 try:
     from ..services.circle_service import CircleDBService
 except Exception:
     CircleDBService = None
-    print("⚠️ circle_service 不可用：circle 功能将被禁用（缺少 app.services.circle_service）")
+    logger.warning("⚠️ circle_service 不可用：circle 功能将被禁用（缺少 app.services.circle_service）")
 from ..utils.cognito_auth import get_current_user
 from ..utils.transcription import validate_audio_quality, validate_transcription
-from boto3.dynamodb.conditions import Attr  # ✅ 用于DynamoDB条件表达式
+from ..utils.concurrency import spawn_background, structured_tasks
+from ..utils.http_client import get_http_client
+from botocore.exceptions import ClientError
 
 # ============================================================================
 # 初始化
 # ============================================================================
 
-router = APIRouter()
-db_service = DynamoDBService()
-s3_service = S3Service()
+# 🚀 JSON 响应统一用 orjson 渲染（C 实现，日记列表这类大响应序列化更快）
+router = APIRouter(default_response_class=ORJSONResponse)
+db_service = get_dynamodb_service()
+s3_service = get_s3_service()
 if CircleDBService:
     circle_service = CircleDBService()
 else:
@@ -60,14 +75,137 @@ else:
 
 # ✅ 全局任务状态（改为仅用于局部缓存，实际存储使用 DynamoDB）
 # 这是为了解决 Lambda 多实例导致内存不冲突、任务 404 的问题
-task_progress = {}
+# 🔥 有界 LRU：超过上限时 O(1) 淘汰最久未访问的任务，防止长寿命容器内存无限增长
+TASK_PROGRESS_MAX_ENTRIES = 10_000
+task_progress: "OrderedDict[str, dict]" = OrderedDict()
+# 容量淘汰计数，通过 /health 的 task_cache 暴露（持续增长说明上限偏小，或有任务没有走到终态）
+task_progress_evictions = 0
+
+def get_cached_task(task_id: str) -> Optional[dict]:
+    """从内存缓存读取任务进度（命中时标记为最近使用）"""
+    task_data = task_progress.get(task_id)
+    if task_data is not None:
+        task_progress.move_to_end(task_id)
+    return task_data
+
+def cache_task(task_id: str, task_data: dict) -> None:
+    """写入内存缓存，超出上限时淘汰最旧的任务"""
+    global task_progress_evictions
+    task_progress[task_id] = task_data
+    task_progress.move_to_end(task_id)
+    while len(task_progress) > TASK_PROGRESS_MAX_ENTRIES:
+        evicted_id, _ = task_progress.popitem(last=False)
+        task_progress_evictions += 1
+        logger.debug("🧹 任务缓存已满，淘汰最久未访问的任务: %s (累计 %s)", evicted_id, task_progress_evictions)
+
+# 终态任务（带完整 diary）只需在内存里保留到客户端轮询拿到结果；之后的冷读取走 DynamoDB
+TERMINAL_TASK_CACHE_TTL = 60
+
+def _expire_cached_task_later(task_id: str) -> None:
+    """终态任务在 TERMINAL_TASK_CACHE_TTL 秒后移出内存缓存（不在事件循环中时交给 LRU 上限兜底）"""
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        return
+    loop.call_later(TERMINAL_TASK_CACHE_TTL, task_progress.pop, task_id, None)
+
+# 🔥 进度写入合并：进度的持久化只标记为 dirty，由单个后台协程每 250ms 写一次最新状态
+# 刷盘协程在线程池里执行写入，进度更新本身只是内存操作，不在事件循环上等待 DynamoDB 往返；
+# 过期的 processing 快照由 DynamoDB 条件写入拦截（见 TASK_NOT_TERMINAL_CONDITION），不需要进程内的锁
+PROGRESS_FLUSH_INTERVAL = 0.25
+_dirty_progress: Dict[str, str] = {}  # task_id -> user_id
+_progress_flusher: Optional[asyncio.Task] = None
+_flush_wakeup: Optional[asyncio.Event] = None
+
+def _snapshot_dirty_progress() -> List[Tuple[str, Dict, str]]:
+    """在事件循环线程里取出 dirty 任务的状态快照（之后交给线程写入，避免跨线程读写同一个 dict）"""
+    pending = list(_dirty_progress.items())
+    _dirty_progress.clear()
+    snapshots = []
+    for task_id, user_id in pending:
+        if task_id in task_progress:
+            snapshots.append((task_id, dict(task_progress[task_id]), user_id))
+    return snapshots
+
+def _write_progress_snapshots(snapshots: List[Tuple[str, Dict, str]]) -> None:
+    """写入进度快照：终态整条写入（带 diary / error），processing 只更新进度字段"""
+    for task_id, task_data, user_id in snapshots:
+        if task_data.get("status") in TERMINAL_TASK_STATUSES:
+            db_service.save_task_progress(task_id, task_data, user_id=user_id)
+        else:
+            db_service.update_task_fields(task_id, task_data, user_id=user_id)
+
+def flush_task_progress() -> None:
+    """把所有 dirty 任务的最新状态写入 DynamoDB"""
+    _write_progress_snapshots(_snapshot_dirty_progress())
+
+async def _flush_progress_loop(wakeup: asyncio.Event) -> None:
+    """后台刷盘协程：有 dirty 任务时运行，全部写完后自动退出；步骤切换时被立即唤醒"""
+    while _dirty_progress:
+        try:
+            await asyncio.wait_for(wakeup.wait(), timeout=PROGRESS_FLUSH_INTERVAL)
+        except asyncio.TimeoutError:
+            pass
+        wakeup.clear()
+        await asyncio.to_thread(_write_progress_snapshots, _snapshot_dirty_progress())
+
+def _schedule_progress_flush(task_id: str, user_id: str, immediate: bool = False) -> None:
+    """标记任务待持久化，必要时启动刷盘协程；immediate=True 时不等待合并窗口"""
+    global _progress_flusher, _flush_wakeup
+    _dirty_progress[task_id] = user_id
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        # 不在事件循环中（如同步脚本），直接写入
+        flush_task_progress()
+        return
+    if _progress_flusher is None or _progress_flusher.done():
+        _flush_wakeup = asyncio.Event()
+        _progress_flusher = loop.create_task(_flush_progress_loop(_flush_wakeup))
+    if immediate:
+        _flush_wakeup.set()
+
+async def register_new_task(task_id: str, task_data: Dict, user_id: str) -> None:
+    """
+    缓存新建任务，并在返回 task_id 前写入 DynamoDB（整条 PutItem）
+    
+    初始记录必须先落库：其他实例查询进度时才不会 404，写入失败也会直接报错给客户端；
+    之后的进度更新才交给刷盘协程（UpdateItem）
+    """
+    cache_task(task_id, task_data)
+    await asyncio.to_thread(db_service.save_task_progress, task_id, dict(task_data), user_id=user_id)
+
+# 📸 等待补充图片：同实例内 add_images_to_task 通过 Event 直接唤醒处理协程；
+# 请求落到其他 Lambda 实例时，靠低频 DynamoDB 轮询兜底
+IMAGE_WAIT_TIMEOUT = 30
+IMAGE_WAIT_DB_POLL_INTERVAL = 2.0
+IMAGE_WAIT_DB_POLL_MAX_INTERVAL = 8.0
+pending_image_events: Dict[str, asyncio.Event] = {}
+
+def _task_image_urls(task_data: Dict) -> Optional[List[str]]:
+    """读取任务里的图片URL（兼容 image_urls / imageUrls 两种键名）"""
+    urls = task_data.get("image_urls")
+    if urls is None:
+        urls = task_data.get("imageUrls")
+    return urls
+
+async def _tick_image_wait_progress(task_id: str, user_id: str) -> None:
+    """等待图片期间每秒推进一次进度（93% → 97%），避免用户感觉卡住"""
+    waited = 0
+    while True:
+        await asyncio.sleep(1)
+        waited += 1
+        update_task_progress(
+            task_id, "processing", min(93 + waited * 4 // IMAGE_WAIT_TIMEOUT, 97), 5,
+            "等待图片", f"正在等待图片上传... ({waited}秒)", user_id=user_id
+        )
 
 def _log_timing(label: str, start_time: float, task_id: Optional[str] = None) -> None:
     elapsed = time.perf_counter() - start_time
     if task_id:
-        print(f"⏱️ [Task:{task_id}] {label}: {elapsed:.2f} 秒")
+        logger.debug("⏱️ [Task:%s] %s: %.2f 秒", task_id, label, elapsed)
     else:
-        print(f"⏱️ {label}: {elapsed:.2f} 秒")
+        logger.debug("⏱️ %s: %.2f 秒", label, elapsed)
 
 def get_display_name(user: Dict, request: Request = None) -> Optional[str]:
     """
@@ -107,42 +245,137 @@ def get_user_language(request: Optional[Request] = None) -> str:
             user_language = custom_lang
     return user_language
 
-def cleanup_old_tasks():
-    """清理超过1小时的任务（防止内存泄漏）"""
-    current_time = datetime.now(timezone.utc)
-    expired_tasks = []
-    for task_id, task_data in task_progress.items():
-        created_at_str = task_data.get("created_at")
-        if created_at_str:
-            try:
-                # 将 ISO 格式字符串转换回 datetime 对象
-                created_at = datetime.fromisoformat(created_at_str.replace('Z', '+00:00'))
-                age = (current_time - created_at).total_seconds()
-                if age > 3600:  # 1小时
-                    expired_tasks.append(task_id)
-            except (ValueError, TypeError):
-                # 如果时间格式异常，也标记为过期以便清理
-                expired_tasks.append(task_id)
-    for task_id in expired_tasks:
-        task_progress.pop(task_id, None)
+async def user_language_dep(request: Request) -> str:
+    """
+    FastAPI 依赖：用户语言
+    
+    Depends 默认 use_cache=True，同一请求内只解析一次请求头；
+    声明为 async，避免简单依赖被丢进线程池执行
+    """
+    return get_user_language(request)
+
+@dataclass(slots=True)
+class UserContext:
+    """
+    单次请求的用户上下文（在路由入口计算一次，传给后台任务）
+    
+    后台任务不再持有 Request 对象，也不会在各个子任务里重复解析请求头
+    """
+    user_id: str
+    display_name: Optional[str]
+    lang: str
 
+@dataclass(slots=True)
+class TaskProgress:
+    """
+    新建任务的初始进度载荷（三个异步入口共用同一份字段定义）
+    
+    内存缓存与 DynamoDB 仍然使用 dict（后续进度更新会原地 update 并追加 diary / error），
+    这里只保证初始字段齐全、类型一致，由 to_dict() 统一转换
+    """
+    status: str
+    progress: int
+    step: int
+    step_name: str
+    message: str
+    user_id: str
+    image_urls: Optional[List[str]]
+    pending_image_upload: bool
+    created_at: str
+    updated_at: str
+    start_time: float
+    user_name: Optional[str]
+    audio_url: Optional[str] = None
 
-# 🔥 单例模式：确保连接池在 Lambda 容器生命周期内复用
-_openai_service_instance: Optional[OpenAIService] = None
+    def to_dict(self) -> Dict:
+        data = asdict(self)
+        if data["audio_url"] is None:
+            del data["audio_url"]  # 未上传音频的任务不写入该字段，与原有载荷保持一致
+        return data
+
+def build_user_context(user: Dict, request: Optional[Request] = None, lang: Optional[str] = None) -> UserContext:
+    """从当前用户和请求头构建 UserContext（lang 优先使用 user_language_dep 注入的值）"""
+    return UserContext(
+        user_id=user['user_id'],
+        display_name=get_display_name(user, request),
+        lang=lang or get_user_language(request)
+    )
 
-def get_openai_service():
+# ValueError → HTTPException 的映射表
+# ERROR_PREFIX_TO_CODE: error code 前缀 → HTTP 状态码（detail 直接返回 error code，前端 i18n 翻译）
+# LEGACY_MARKERS: 旧版中文错误信息 → 对应的 error code
+ERROR_PREFIX_TO_CODE: Dict[str, int] = {"TRANSCRIPTION_": 400}
+LEGACY_MARKERS: Dict[str, str] = {"空内容": "TRANSCRIPTION_CONTENT_TOO_SHORT"}
+
+def dispatch_value_error(exc: ValueError) -> Optional[HTTPException]:
+    """把已知的 ValueError 转成 HTTPException；未识别的返回 None，由调用方决定兜底"""
+    error_str = str(exc)
+    for prefix, status_code in ERROR_PREFIX_TO_CODE.items():
+        if error_str.startswith(prefix):
+            return HTTPException(status_code=status_code, detail=error_str)
+    for marker, code in LEGACY_MARKERS.items():
+        if marker in error_str:
+            return HTTPException(status_code=400, detail=code)
+    return None
+
+# 音频来源：内存中的 bytes，或可 seek 的文件对象（UploadFile 底层临时文件的独立句柄）
+AudioSource = Union[bytes, BinaryIO]
+
+def open_independent_reader(source: Union[UploadFile, BinaryIO]) -> BinaryIO:
     """
-    获取 OpenAI 服务单例实例
+    为 UploadFile（或已打开的文件）打开一个拥有独立读取位置的只读句柄
     
-    🔥 连接池优化关键：
-    - 使用单例模式，确保 httpx 连接池在整个 Lambda 容器生命周期内复用
-    - 配合 EventBridge 5 分钟 warmup，可以保持热连接
-    - 预期性能提升：10秒 → 1-2秒
+    S3 上传和 Whisper 需要并行读取同一个上传文件，共用一个文件句柄会互相移动 offset。
+    - 仍在内存中的 SpooledTemporaryFile：复制为 BytesIO（调用 fileno() 会强制落盘，所以不走重新打开）
+    - 已落盘的文件：Linux 下通过 /proc/self/fd 重新打开（不复制内容）
+    - 其他平台或重新打开失败：分块复制到新的临时文件
+    新句柄在请求结束、UploadFile 被关闭之后仍然有效，可以交给后台任务使用。
     """
-    global _openai_service_instance
-    if _openai_service_instance is None:
-        _openai_service_instance = OpenAIService()
-    return _openai_service_instance
+    fileobj = getattr(source, "file", source)  # UploadFile → 底层 SpooledTemporaryFile
+    position = fileobj.tell()
+    if isinstance(fileobj, tempfile.SpooledTemporaryFile) and not getattr(fileobj, "_rolled", True):
+        fileobj.seek(0)
+        reader: BinaryIO = io.BytesIO(fileobj.read())
+        fileobj.seek(position)
+        return reader
+    try:
+        return open(f"/proc/self/fd/{fileobj.fileno()}", "rb")
+    except (OSError, io.UnsupportedOperation):
+        pass
+    fileobj.seek(0)
+    reader = tempfile.TemporaryFile()
+    shutil.copyfileobj(fileobj, reader, 1024 * 1024)
+    fileobj.seek(position)
+    reader.seek(0)
+    return reader
+
+def upload_source_size(source: Union[bytes, BinaryIO]) -> int:
+    """上传内容（音频或图片）的大小（字节），文件对象通过 seek/tell 获取，不读取内容"""
+    if isinstance(source, (bytes, bytearray)):
+        return len(source)
+    position = source.tell()
+    source.seek(0, os.SEEK_END)
+    size = source.tell()
+    source.seek(position)
+    return size
+
+@contextmanager
+def independent_audio_reader(source: AudioSource):
+    """bytes 原样返回；文件对象打开一个独立读取位置的句柄，用完自动关闭"""
+    if isinstance(source, (bytes, bytearray)):
+        yield source
+        return
+    reader = open_independent_reader(source)
+    try:
+        yield reader
+    finally:
+        reader.close()
+
+def close_audio_source(source: AudioSource) -> None:
+    """后台任务结束时关闭音频文件句柄（bytes 无需处理）"""
+    if not isinstance(source, (bytes, bytearray)):
+        source.close()
+
 
 def update_task_progress(task_id: str, status: str, progress: int = 0, 
                         step: int = 0, step_name: str = "", message: str = "",
@@ -154,12 +387,18 @@ def update_task_progress(task_id: str, status: str, progress: int = 0,
     
     ✅ Phase 1.3 优化：添加 persist 参数
     - persist=True（默认）：写入 DynamoDB，用于关键节点（开始、完成、错误、步骤变化）
+      processing 状态由刷盘协程合并写入，completed/failed 立即写入
     - persist=False：只更新内存缓存，用于虚拟进度循环（减少 DynamoDB 写入开销）
     
     🔥 性能提升：虚拟进度循环不再频繁写入 DynamoDB，显著降低延迟
+    
+    ⚠️ 各阶段之间不插入 sleep 做 UI 节奏控制；前端在两次进度推送之间自行线性插值
     """
+    # 本次更新统一使用同一个时间戳（created_at 默认值与 updated_at 共用）
+    now_iso = datetime.now(timezone.utc).isoformat()
+    
     # 优先从内存缓存获取（减少 DynamoDB 读取）
-    current_task_data = task_progress.get(task_id)
+    current_task_data = get_cached_task(task_id)
     
     # 只有在关键节点需要持久化时才从 DynamoDB 读取（确保数据一致性）
     if not current_task_data and persist:
@@ -173,12 +412,13 @@ def update_task_progress(task_id: str, status: str, progress: int = 0,
             "step_name": "",
             "message": "",
             "user_id": user_id,
-            "created_at": datetime.now(timezone.utc).isoformat()
+            "created_at": now_iso
         }
     
     # 🔥 关键优化：进度保护逻辑 - 进度只能增加，不能减少（除非状态改变）
+    previous_step = current_task_data.get("step", 0)
     new_progress = max(current_task_data.get("progress", 0), progress)
-    new_step = max(current_task_data.get("step", 0), step)
+    new_step = max(previous_step, step)
 
     current_task_data.update({
         "status": status,
@@ -186,7 +426,7 @@ def update_task_progress(task_id: str, status: str, progress: int = 0,
         "step": new_step,
         "step_name": step_name if step >= current_task_data.get("step", 0) else current_task_data.get("step_name"),
         "message": message if step >= current_task_data.get("step", 0) else current_task_data.get("message"),
-        "updated_at": datetime.now(timezone.utc).isoformat()
+        "updated_at": now_iso
     })
     
     if diary:
@@ -194,12 +434,49 @@ def update_task_progress(task_id: str, status: str, progress: int = 0,
     if error:
         current_task_data["error"] = error
 
+    # 始终更新内存缓存（用于快速查询，刷盘协程也从这里读取最新状态）
+    cache_task(task_id, current_task_data)
+    
+    if status in TERMINAL_TASK_STATUSES:
+        pending_image_events.pop(task_id, None)
+        _expire_cached_task_later(task_id)
+    
     # ✅ Phase 1.3: 仅在 persist=True 时写入 DynamoDB
     if persist:
-        db_service.save_task_progress(task_id, current_task_data, user_id=user_id)
+        # processing 状态合并写入：250ms 内多次更新只写最后一次
+        # 终态和步骤切换立即唤醒刷盘协程，其他实例轮询时能及时看到结果和阶段变化
+        immediate = status in TERMINAL_TASK_STATUSES or new_step > previous_step
+        _schedule_progress_flush(task_id, user_id, immediate=immediate)
+
+
+async def virtual_progress(task_id: str, start_pct: int, end_pct: int,
+                           done_event: asyncio.Event, duration_hint: float,
+                           step: int, step_name: str, messages: List[str],
+                           user_id: str, tick: float = 0.5) -> int:
+    """
+    虚拟进度时钟：在真实工作完成前平滑推进进度
     
-    # 始终更新内存缓存（用于快速查询）
-    task_progress[task_id] = current_task_data
+    - 进度按 p = start + (end - start) * (1 - e^(-t/duration_hint)) 随时间计算，不依赖循环计数
+    - 每个 tick 只在整数进度变化时更新内存缓存，跨越 5% 边界时才持久化到 DynamoDB
+    - done_event 被 set 后立即退出，返回最后一次上报的进度
+    """
+    start = time.monotonic()
+    last_pct = start_pct
+    while not done_event.is_set():
+        try:
+            await asyncio.wait_for(done_event.wait(), timeout=tick)
+            break
+        except asyncio.TimeoutError:
+            pass
+        elapsed = time.monotonic() - start
+        pct = int(start_pct + (end_pct - start_pct) * (1 - math.exp(-elapsed / duration_hint)))
+        if pct <= last_pct:
+            continue
+        msg_idx = min((pct - start_pct) * len(messages) // max(end_pct - start_pct, 1), len(messages) - 1)
+        persist = pct // 5 != last_pct // 5
+        last_pct = pct
+        update_task_progress(task_id, "processing", pct, step, step_name, messages[msg_idx], user_id=user_id, persist=persist)
+    return last_pct
 
 
 # ============================================================================
@@ -224,19 +501,20 @@ async def create_text_diary(
         openai_service = get_openai_service()
         
         # ✅ 修复：添加 await
-        print(f"✨ 开始处理文字日记...")
+        logger.debug("✨ 开始处理文字日记...")
         # 获取用户名字用于个性化反馈
         user_display_name = get_display_name(user, request)
-        print(f"👤 用户信息: user_id={user.get('user_id')}, display_name={user_display_name}")
+        logger.debug("👤 用户信息: user_id=%s, display_name=%s", user.get('user_id'), user_display_name)
         ai_result = await openai_service.polish_content_multilingual(diary.content, user_name=user_display_name)
-        print(f"✅ AI 处理完成 - 标题: {ai_result['title']}")
+        logger.info("✅ AI 处理完成 - 标题: %s", ai_result['title'])
         
         # ✅ 调试：检查emotion_data
         emotion_data = ai_result.get("emotion_data")
-        print(f"🔍 [DEBUG] emotion_data from AI: {emotion_data}")
+        logger.debug("🔍 [DEBUG] emotion_data from AI: %s", emotion_data)
         
         # 保存到数据库
-        diary_obj = db_service.create_diary(
+        diary_obj = await asyncio.to_thread(
+            db_service.create_diary,
             user_id=user['user_id'],
             original_content=diary.content,
             polished_content=ai_result["polished_content"],
@@ -247,15 +525,15 @@ async def create_text_diary(
         )
         
         # ✅ 调试：检查保存后的数据
-        print(f"🔍 [DEBUG] diary_obj emotion_data: {diary_obj.get('emotion_data')}")
+        logger.debug("🔍 [DEBUG] diary_obj emotion_data: %s", diary_obj.get('emotion_data'))
         
-        print(f"✅ 文字日记创建成功 - ID: {diary_obj['diary_id']}")
+        logger.info("✅ 文字日记创建成功 - ID: %s", diary_obj['diary_id'])
         return diary_obj
         
     except HTTPException:
         raise
     except Exception as e:
-        print(f"❌ 创建文字日记失败: {str(e)}")
+        logger.error("❌ 创建文字日记失败: %s", str(e))
         raise HTTPException(
             status_code=500,
             detail=f"创建日记失败: {str(e)}"
@@ -267,6 +545,7 @@ async def create_voice_diary(
     audio: UploadFile = File(...),
     duration: int = Form(...),
     user: Dict = Depends(get_current_user),
+    user_lang: str = Depends(user_language_dep),
     request: Request = None  # ✅ 添加 Request 参数以获取请求头
 ):
     """
@@ -296,111 +575,101 @@ async def create_voice_diary(
                 detail="请上传音频文件"
             )
         
-        audio_content = await audio.read()
-        user_lang = get_user_language(request)
-        validate_audio_quality(duration, len(audio_content), language=user_lang)
+        # 🔥 不再 await audio.read()：音频始终留在 UploadFile 的临时文件里，按需流式读取
+        if audio.size is not None:
+            audio_size = audio.size
+        else:
+            audio.file.seek(0, os.SEEK_END)
+            audio_size = audio.file.tell()
+        ctx = build_user_context(user, request, user_lang)
+        validate_audio_quality(duration, audio_size, language=ctx.lang)
         
         # ============================================
         # Step 2: 并行处理（提升速度）
         # ============================================
-        print(f"📤 开始并行处理：上传 S3 + 语音转文字...")
+        logger.debug("📤 开始并行处理：上传 S3 + 语音转文字...")
         
         async def upload_to_s3_async():
-            """异步上传到 S3"""
-            return await asyncio.to_thread(
-                s3_service.upload_audio,
-                file_content=audio_content,
-                file_name=audio.filename or "recording.m4a",
-                content_type=audio.content_type or "audio/m4a"
-            )
+            """异步上传到 S3（独立句柄流式上传，不与 Whisper 争用 offset；瞬时错误由 botocore 自动重试）"""
+            reader = open_independent_reader(audio)
+            try:
+                return await s3_service.upload_audio_async(
+                    file_content=reader,
+                    file_name=audio.filename or "recording.m4a",
+                    content_type=audio.content_type or "audio/m4a"
+                )
+            except Exception as upload_error:
+                logger.error("❌ S3上传失败（已用尽重试）: %s", upload_error)
+                raise HTTPException(status_code=500, detail="音频上传失败，请重试")
+            finally:
+                reader.close()
         
         async def transcribe_async():
-            """异步语音转文字 - ✅ 添加 await"""
+            """异步语音转文字 - 直接流式读取 UploadFile"""
             return await openai_service.transcribe_audio(
-                audio_content,
+                audio.file,
                 audio.filename or "recording.m4a",
                 expected_duration=duration
             )
         
-        # 并行执行（同时进行，节省时间）- ✅ 添加容错
-        results = await asyncio.gather(
-            upload_to_s3_async(),
-            transcribe_async(),
-            return_exceptions=True  # ✅ S3失败不影响转录
-        )
-        
-        # 检查结果
-        audio_url_result = results[0]
-        transcription_result = results[1]
+        async with structured_tasks() as tg:
+            # 🚀 上传在后台继续：转录一完成就开始验证和 AI 处理，写库前才等待 audio_url
+            # 结构化并发：转录/AI 失败时上传任务会被一并取消
+            s3_upload_task = tg.create_task(upload_to_s3_async())
+            try:
+                transcription_result = await transcribe_async()
+            except Exception as e:
+                logger.error("❌ Whisper转录失败: %s", e)
+                raise  # 转录失败必须抛出
         
-        # 处理转录结果（优先检查，因为是核心功能）
-        if isinstance(transcription_result, Exception):
-            print(f"❌ Whisper转录失败: {transcription_result}")
-            raise transcription_result  # 转录失败必须抛出
+            # 🔥 提取转录文本和检测到的语言
+            transcription = transcription_result["text"]
+            detected_language = transcription_result.get("detected_language")
         
-        # 🔥 提取转录文本和检测到的语言
-        transcription = transcription_result["text"]
-        detected_language = transcription_result.get("detected_language")
+            logger.info("✅ 转录完成")
+            logger.debug("  - 转录结果: %s...", transcription[:50])
+            logger.debug("  - 检测语言: %s", detected_language)
         
-        # 处理S3上传结果
-        if isinstance(audio_url_result, Exception):
-            print(f"⚠️ S3并行上传失败，转录后重试: {audio_url_result}")
-            # 重试上传（此时转录已完成，不影响总时间）
-            try:
-                audio_url = await asyncio.to_thread(
-                    s3_service.upload_audio,
-                    file_content=audio_content,
-                    file_name=audio.filename or "recording.m4a",
-                    content_type=audio.content_type or "audio/m4a"
-                )
-                print(f"✅ S3重试上传成功: {audio_url}")
-            except Exception as retry_error:
-                print(f"❌ S3重试上传仍失败: {retry_error}")
-                raise HTTPException(status_code=500, detail="音频上传失败，请重试")
-        else:
-            audio_url = audio_url_result
-
+            # ============================================
+            # Step 3: 验证转录内容
+            # ============================================
+            validate_transcription(transcription, duration)
         
-        print(f"✅ 并行处理完成")
-        print(f"  - 音频 URL: {audio_url}")
-        print(f"  - 转录结果: {transcription[:50]}...")
-        print(f"  - 检测语言: {detected_language}")
+            # ============================================
+            # Step 4: AI 处理 - ✅ 添加 await
+            # ============================================
+            logger.debug("✨ 开始 AI 处理...")
+            # 获取用户名字用于个性化反馈
+            user_display_name = ctx.display_name
         
-        # ============================================
-        # Step 3: 验证转录内容
-        # ============================================
-        validate_transcription(transcription, duration)
+            logger.debug("👤 用户信息提取:")
+            logger.debug("   user_id: %s", user.get('user_id'))
+            logger.debug("   name字段: '%s'", user.get('name'))
+            logger.debug("   given_name字段: '%s'", user.get('given_name'))
+            logger.debug("   nickname字段: '%s'", user.get('nickname'))
+            logger.debug("   最终使用的名字: '%s'", user_display_name)
         
-        # ============================================
-        # Step 4: AI 处理 - ✅ 添加 await
-        # ============================================
-        print(f"✨ 开始 AI 处理...")
-        # 获取用户名字用于个性化反馈
-        user_display_name = get_display_name(user, request)
+            ai_result = await openai_service.polish_content_multilingual(
+                transcription, 
+                user_name=user_display_name,
+                whisper_detected_language=detected_language  # 🔥 传递 Whisper 检测的语言
+            )
+            logger.info("✅ AI 处理完成")
+            logger.debug("  - 标题: %s", ai_result['title'])
+            logger.debug("  - 语言: %s", ai_result.get('language', 'zh'))
         
-        print(f"👤 用户信息提取:")
-        print(f"   user_id: {user.get('user_id')}")
-        print(f"   name字段: '{user.get('name')}'")
-        print(f"   given_name字段: '{user.get('given_name')}'")
-        print(f"   nickname字段: '{user.get('nickname')}'")
-        print(f"   最终使用的名字: '{user_display_name}'")
-        
-        ai_result = await openai_service.polish_content_multilingual(
-            transcription, 
-            user_name=user_display_name,
-            whisper_detected_language=detected_language  # 🔥 传递 Whisper 检测的语言
-        )
-        print(f"✅ AI 处理完成")
-        print(f"  - 标题: {ai_result['title']}")
-        print(f"  - 语言: {ai_result.get('language', 'zh')}")
+            # 处理S3上传结果（上传与 AI 处理重叠执行；失败时 TaskGroup 会直接取消本流程）
+            audio_url = await s3_upload_task
+            logger.debug("  - 音频 URL: %s", audio_url)
         
         # ============================================
         # Step 5: 保存到数据库
         # ============================================
-        print(f"📝 准备保存日记到数据库...")
+        logger.debug("📝 准备保存日记到数据库...")
         
-        diary_obj = db_service.create_diary(
-            user_id=user['user_id'],
+        diary_obj = await asyncio.to_thread(
+            db_service.create_diary,
+            user_id=ctx.user_id,
             original_content=transcription,
             polished_content=ai_result["polished_content"],
             ai_feedback=ai_result["feedback"],
@@ -411,50 +680,41 @@ async def create_voice_diary(
             emotion_data=ai_result.get("emotion_data") # ✅ 传递情感数据
         )
         
-        print(f"✅ 语音日记创建成功 - ID: {diary_obj['diary_id']}")
+        logger.info("✅ 语音日记创建成功 - ID: %s", diary_obj['diary_id'])
         return diary_obj
         
-    except HTTPException as e:
-        # 检查是否是 EMPTY_TRANSCRIPT 错误（保持原错误格式）
-        if e.status_code == 400:
-            try:
-                error_detail = json.loads(e.detail) if isinstance(e.detail, str) else e.detail
-                if isinstance(error_detail, dict) and error_detail.get("code") == "EMPTY_TRANSCRIPT":
-                    # 保持 EMPTY_TRANSCRIPT 错误码，让前端识别
-                    raise e
-            except (json.JSONDecodeError, AttributeError, TypeError):
-                pass
-        # 其他 HTTPException 直接抛出
+    except HTTPException:
+        # HTTPException（包括 EMPTY_TRANSCRIPT 等 error code）原样抛出，前端按 detail 识别
         raise
     except ValueError as e:
-        error_str = str(e)
-        # ✅ 识别新的 error code 格式（TRANSCRIPTION_xxx）
-        if error_str.startswith("TRANSCRIPTION_"):
-            raise HTTPException(
-                status_code=400,
-                detail=error_str  # 直接返回 error code，前端使用 i18n 翻译
-            )
-        # 兼容旧逻辑（空内容错误）
-        elif "空内容" in error_str:
-            raise HTTPException(
-                status_code=400,
-                detail="TRANSCRIPTION_CONTENT_TOO_SHORT"
-            )
-        else:
-            print(f"❌ ValueError 详情: {error_str}")
-            raise HTTPException(status_code=500, detail="TRANSCRIPTION_FAILED")
+        http_error = dispatch_value_error(e)
+        if http_error is not None:
+            raise http_error
+        logger.error("❌ ValueError 详情: %s", e)
+        raise HTTPException(status_code=500, detail="TRANSCRIPTION_FAILED")
     except Exception as e:
         # 其他未预期的错误
-        print(f"❌ 创建语音日记失败: {str(e)}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("❌ 创建语音日记失败: %s", str(e))
         raise HTTPException(
             status_code=500,
             detail="TRANSCRIPTION_FAILED"
         )
 
 
-async def send_sse_event(event_type: str, data: Dict) -> str:
+# SSE 固定事件的帧头预先编码好，每条消息只剩 orjson.dumps 一次序列化
+_SSE_EVENT_PREFIXES: Dict[str, bytes] = {
+    event: b"event: " + event.encode() + b"\ndata: "
+    for event in ("progress", "error", "complete")
+}
+
+# SSE 响应头（只读常量，所有流式响应共用；X-Accel-Buffering 禁用 nginx 缓冲）
+_SSE_HEADERS = MappingProxyType({
+    "Cache-Control": "no-cache",
+    "Connection": "keep-alive",
+    "X-Accel-Buffering": "no"
+})
+
+def send_sse_event(event_type: str, data: Dict) -> bytes:
     """
     发送SSE事件格式的数据
     
@@ -467,20 +727,23 @@ async def send_sse_event(event_type: str, data: Dict) -> str:
     event: progress
     data: {"step": 1, "progress": 20}
     
+    🚀 直接用 orjson 生成 UTF-8 bytes，省去 json.dumps + str→bytes 编码；
+    纯 CPU 操作，定义为普通函数，避免每条消息多分配一个协程
     """
-    event_line = f"event: {event_type}\n" if event_type else ""
-    data_json = json.dumps(data, ensure_ascii=False)
-    return f"{event_line}data: {data_json}\n\n"
+    prefix = _SSE_EVENT_PREFIXES.get(event_type)
+    if prefix is None:
+        prefix = (b"event: " + event_type.encode() + b"\n" if event_type else b"") + b"data: "
+    return prefix + orjson.dumps(data) + b"\n\n"
 
 
 async def process_pure_voice_diary_async(
     task_id: str,
-    audio_content: bytes,
+    audio_content: AudioSource,
     audio_filename: str,
     audio_content_type: str,
     duration: int,
     user: Dict,
-    request: Optional[Request],
+    ctx: UserContext,
     audio_url: Optional[str] = None
 ):
     """
@@ -493,6 +756,7 @@ async def process_pure_voice_diary_async(
     2. AI 处理：润色 + 反馈 (50% → 85%)
     3. 保存到数据库 (85% → 100%)
     """
+    user_id = ctx.user_id
     total_start = time.perf_counter()
     try:
         openai_service = get_openai_service()
@@ -501,64 +765,41 @@ async def process_pure_voice_diary_async(
         # Step 0: 初始化 (5% → 10%)
         # ============================================
         # ✅ 专家优化：进度对齐 (前端上传完音频已经是 20%)
-        update_task_progress(task_id, "processing", 22, 0, "验证中", "正在验证音频...", user_id=user['user_id'])
+        update_task_progress(task_id, "processing", 22, 0, "验证中", "正在验证音频...", user_id=user_id)
         
         # 验证音频质量
-        user_lang = get_user_language(request)
-        validate_audio_quality(duration, len(audio_content), language=user_lang)
+        validate_audio_quality(duration, upload_source_size(audio_content), language=ctx.lang)
         
         # ✅ 验证完成，立即跳到 15%（Demo优化：给转录更多进度空间）
-        update_task_progress(task_id, "processing", 15, 1, "处理中", "准备正式开始处理...", user_id=user['user_id'])
-        await asyncio.sleep(0.1)  # 短暂延迟，让前端看到进度变化
+        update_task_progress(task_id, "processing", 15, 1, "处理中", "准备正式开始处理...", user_id=user_id)
         
         # ============================================
         # Step 1: 并行处理 S3 上传 + 语音转文字 (15% → 60%) ← Demo优化
         # ============================================
-        update_task_progress(task_id, "processing", 18, 1, "转录中", "正在努力识别你的声音...", user_id=user['user_id'])
+        update_task_progress(task_id, "processing", 18, 1, "转录中", "正在努力识别你的声音...", user_id=user_id)
         
         async def upload_to_s3_async():
             if audio_url:
                 return audio_url
             s3_start = time.perf_counter()
-            result = await asyncio.to_thread(
-                s3_service.upload_audio,
-                file_content=audio_content,
-                file_name=audio_filename,
-                content_type=audio_content_type
-            )
+            with independent_audio_reader(audio_content) as upload_source:
+                result = await s3_service.upload_audio_async(
+                    file_content=upload_source,
+                    file_name=audio_filename,
+                    content_type=audio_content_type
+                )
             _log_timing("S3 上传完成", s3_start, task_id)
             return result
         
         # 🚀 优化：增加虚拟进度，防止转录期间卡死
         async def transcribe_with_progress():
-            # ============================================
-            # ✅ 2026-01-27 优化: 虚拟进度循环（行业最佳实践）
-            # - 每5%持久化一次，确保前端能看到进度
-            # - 两阶段速度：快速启动 + 平稳等待
-            # ============================================
-            async def smooth_progress():
-                current_p = 18  # 从 18% 开始
-                last_persisted = 18
-                
-                # Phase 1: 快速增长 (18% → 42%)
-                while current_p < 42:
-                    await asyncio.sleep(0.3)
-                    current_p += 1
-                    should_persist = (current_p - last_persisted) >= 5
-                    if should_persist:
-                        last_persisted = current_p
-                    update_task_progress(task_id, "processing", current_p, 1, "转录中", "正在努力识别你的声音...", user_id=user['user_id'], persist=should_persist)
-                
-                # Phase 2: 缓慢增长 (42% → 55%)
-                while current_p < 55:
-                    await asyncio.sleep(0.8)
-                    current_p += 1
-                    should_persist = (current_p - last_persisted) >= 5
-                    if should_persist:
-                        last_persisted = current_p
-                    update_task_progress(task_id, "processing", current_p, 1, "转录中", "语音识别中，请稍候...", user_id=user['user_id'], persist=should_persist)
-            
-            progress_task = asyncio.create_task(smooth_progress())
+            transcription_done = asyncio.Event()
+            progress_task = asyncio.create_task(virtual_progress(
+                task_id, 18, 55, transcription_done, duration_hint=8.0,
+                step=1, step_name="转录中",
+                messages=["正在努力识别你的声音...", "语音识别中，请稍候..."],
+                user_id=user_id
+            ))
             try:
                 transcribe_start = time.perf_counter()
                 result = await openai_service.transcribe_audio(
@@ -569,198 +810,162 @@ async def process_pure_voice_diary_async(
                 _log_timing("Whisper 转录完成(含重试)", transcribe_start, task_id)
                 return result
             finally:
-                progress_task.cancel()
+                transcription_done.set()
+                await progress_task
 
-        # 并行执行
-        audio_url, transcription_result = await asyncio.gather(
-            upload_to_s3_async(),
-            transcribe_with_progress()
-        )
+        async with structured_tasks() as tg:
+            # 🚀 上传在后台继续，转录一完成就进入 AI 处理，只有写库时才等待 audio_url
+            # 结构化并发：转录/AI 失败时上传任务会被一并取消
+            s3_upload_task = tg.create_task(upload_to_s3_async())
+            transcription_result = await transcribe_with_progress()
         
-        # 🔥 提取转录文本和检测到的语言
-        transcription = transcription_result["text"]
-        detected_language = transcription_result.get("detected_language")
-        print(f"🌍 Whisper 检测到的语言: {detected_language}")
+            # 🔥 提取转录文本和检测到的语言
+            transcription = transcription_result["text"]
+            detected_language = transcription_result.get("detected_language")
+            logger.debug("🌍 Whisper 检测到的语言: %s", detected_language)
         
-        update_task_progress(task_id, "processing", 58, 1, "处理中", "语音识别完成", user_id=user['user_id'])
+            update_task_progress(task_id, "processing", 58, 1, "处理中", "语音识别完成", user_id=user_id)
         
-        # 验证转录内容
-        validate_transcription(transcription, duration)
-        
-        # ============================================
-        # Step 2: AI 处理 - 润色 + 反馈 (58% → 90%)
-        # ✅ 2026-01-27 修复: 为 AI 处理添加虚拟进度，减少停顿感
-        # ============================================
-        update_task_progress(task_id, "processing", 60, 2, "AI润色", "正在美化文字...", user_id=user['user_id'])
+            # 验证转录内容
+            validate_transcription(transcription, duration)
         
-        # 获取用户名字（优先使用 X-User-Name header）
-        user_display_name = get_display_name(user, request)
+            # ============================================
+            # Step 2: AI 处理 - 润色 + 反馈 (58% → 90%)
+            # ✅ 2026-01-27 修复: 为 AI 处理添加虚拟进度，减少停顿感
+            # ============================================
+            update_task_progress(task_id, "processing", 60, 2, "AI润色", "正在美化文字...", user_id=user_id)
         
-        # ============================================
-        # ✅ 2026-01-27 重构: AI处理期间的虚拟进度循环
-        # 行业最佳实践：
-        # 1. 平滑进度更新（每400ms增加1%）
-        # 2. 关键节点持久化（每5%写入一次DynamoDB，确保多实例环境下一致性）
-        # 3. 进度保护（不会倒退，只会前进）
-        # 4. 详细的进度消息，提升用户体验
-        # ============================================
-        async def ai_with_progress():
-            # 使用 nonlocal 变量跟踪当前进度，便于在 finally 中获取
-            current_progress = 60
-            ai_start = time.perf_counter()
-            
-            async def smooth_ai_progress():
-                nonlocal current_progress
-                # ✅ 丰富的进度消息，让用户感知到"真实"的处理过程
-                messages = [
-                    "正在美化文字...",      # 60-65%
-                    "AI正在润色中...",       # 66-70%
-                    "精心打磨语句...",       # 71-75%
-                    "生成温暖反馈...",       # 76-80%
-                    "最后检查中...",         # 81-85%
-                    "即将完成..."            # 86-88%
-                ]
-                last_persisted = 60  # 上次持久化的进度
-                
-                while current_progress < 88:
-                    await asyncio.sleep(0.35)  # ✅ 优化：稍快一点，更流畅
-                    current_progress += 1
-                    
-                    # 计算消息索引（每5%切换一次消息）
-                    msg_idx = min((current_progress - 60) // 5, len(messages) - 1)
-                    
-                    # ✅ 关键优化：每5%持久化一次到DynamoDB，确保进度可见
-                    should_persist = (current_progress - last_persisted) >= 5
-                    if should_persist:
-                        last_persisted = current_progress
-                        print(f"📊 [Progress] AI处理虚拟进度: {current_progress}% (已持久化)")
-                    
+            # ============================================
+            # ✅ AI处理期间的虚拟进度（按时间曲线推进，每5%持久化一次）
+            # ============================================
+            async def ai_with_progress():
+                ai_start = time.perf_counter()
+                ai_done = asyncio.Event()
+                progress_task = asyncio.create_task(virtual_progress(
+                    task_id, 60, 88, ai_done, duration_hint=10.0,
+                    step=2, step_name="AI润色",
+                    messages=[
+                        "正在美化文字...",
+                        "AI正在润色中...",
+                        "精心打磨语句...",
+                        "生成温暖反馈...",
+                        "最后检查中...",
+                        "即将完成..."
+                    ],
+                    user_id=user_id
+                ))
+                try:
+                    return await openai_service.polish_content_multilingual(
+                        transcription, 
+                        user_name=ctx.display_name,
+                        whisper_detected_language=detected_language
+                    )
+                finally:
+                    ai_done.set()
+                    current_progress = await progress_task
+                    _log_timing("AI 处理完成(润色/反馈/情绪)", ai_start, task_id)
+                    # ✅ 确保最终进度被持久化（防止AI处理太快导致进度没更新）
+                    final_progress = max(current_progress, 85)  # 至少到85%
+                    logger.debug("📊 [Progress] AI处理完成，最终虚拟进度: %s%%", final_progress)
                     update_task_progress(
-                        task_id, "processing", current_progress, 2, "AI润色", 
-                        messages[msg_idx], 
-                        user_id=user['user_id'], 
-                        persist=should_persist  # ✅ 关键节点持久化
+                        task_id, "processing", final_progress, 2, "AI润色", 
+                        "AI处理完成", 
+                        user_id=user_id, 
+                        persist=True
                     )
-            
-            progress_task = asyncio.create_task(smooth_ai_progress())
-            try:
-                return await openai_service.polish_content_multilingual(
-                    transcription, 
-                    user_name=user_display_name,
-                    whisper_detected_language=detected_language
-                )
-            finally:
-                progress_task.cancel()
-                _log_timing("AI 处理完成(润色/反馈/情绪)", ai_start, task_id)
-                # ✅ 确保最终进度被持久化（防止AI处理太快导致进度没更新）
-                final_progress = max(current_progress, 85)  # 至少到85%
-                print(f"📊 [Progress] AI处理完成，最终虚拟进度: {final_progress}%")
-                update_task_progress(
-                    task_id, "processing", final_progress, 2, "AI润色", 
-                    "AI处理完成", 
-                    user_id=user['user_id'], 
-                    persist=True
-                )
         
-        ai_result = await ai_with_progress()
+            ai_result = await ai_with_progress()
         
-        # ============================================
-        # Step 3: 保存到数据库 (88% → 100%)
-        # ✅ 2026-01-27 优化：平滑的保存进度过渡
-        # ============================================
-        print(f"📊 [Progress] 开始保存阶段 (88% → 100%)")
-        
-        # 88% → 90%: 准备保存
-        update_task_progress(task_id, "processing", 88, 3, "保存中", "准备保存日记...", user_id=user['user_id'])
-        await asyncio.sleep(0.2)  # 短暂延迟，让进度可见
-        
-        # 90%: 处理情绪数据
-        update_task_progress(task_id, "processing", 90, 3, "保存中", "整理情绪数据...", user_id=user['user_id'])
-        
-        # --------------------------------------------------------
-        # 🔥 情绪分析结果 (Pure Text Analysis)
-        # --------------------------------------------------------
-        text_emotion = ai_result.get("emotion_data", {})
-        final_emotion_data = {
-            "emotion": text_emotion.get("emotion", "Reflective"),
-            "confidence": text_emotion.get("confidence", 0.0),
-            "rationale": text_emotion.get("rationale", ""),
-            "source": "text_only",
-            "meta": {
-                "text": text_emotion
+            # ============================================
+            # Step 3: 保存到数据库 (88% → 100%)
+            # ✅ 2026-01-27 优化：平滑的保存进度过渡
+            # ============================================
+            logger.debug("📊 [Progress] 开始保存阶段 (88% → 100%)")
+        
+            # 88% → 90%: 准备保存
+            update_task_progress(task_id, "processing", 88, 3, "保存中", "准备保存日记...", user_id=user_id)
+        
+            # 90%: 处理情绪数据
+            update_task_progress(task_id, "processing", 90, 3, "保存中", "整理情绪数据...", user_id=user_id)
+        
+            # --------------------------------------------------------
+            # 🔥 情绪分析结果 (Pure Text Analysis)
+            # --------------------------------------------------------
+            text_emotion = ai_result.get("emotion_data", {})
+            final_emotion_data = {
+                "emotion": text_emotion.get("emotion", "Reflective"),
+                "confidence": text_emotion.get("confidence", 0.0),
+                "rationale": text_emotion.get("rationale", ""),
+                "source": "text_only",
+                "meta": {
+                    "text": text_emotion
+                }
             }
-        }
         
-        await asyncio.sleep(0.15)  # 短暂延迟，让进度可见
         
-        # 93%: 写入数据库
-        update_task_progress(task_id, "processing", 93, 3, "保存中", "写入数据库...", user_id=user['user_id'])
+            # 93%: 写入数据库
+            update_task_progress(task_id, "processing", 93, 3, "保存中", "写入数据库...", user_id=user_id)
 
+            # 🚀 diary_id 在写库前生成，completed 事件直接携带完整日记对象
+            item, diary_obj = db_service.build_diary_record(
+                user_id=user_id,
+                original_content=transcription,
+                polished_content=ai_result["polished_content"],
+                ai_feedback=ai_result["feedback"],
+                language=ai_result.get("language", "zh"),
+                title=ai_result["title"],
+                audio_url=await s3_upload_task,  # ✅ 等待上传完成
+                audio_duration=duration,
+                emotion_data=final_emotion_data
+            )
+        
+        # 先等写库成功再推送 completed；写库失败由下方 except 把任务标记为 failed
         db_start = time.perf_counter()
-        diary_obj = db_service.create_diary(
-            user_id=user['user_id'],
-            original_content=transcription,
-            polished_content=ai_result["polished_content"],
-            ai_feedback=ai_result["feedback"],
-            language=ai_result.get("language", "zh"),
-            title=ai_result["title"],
-            audio_url=audio_url,
-            audio_duration=duration,
-            emotion_data=final_emotion_data
-        )
+        await asyncio.to_thread(db_service.put_diary_item, item)
         _log_timing("DynamoDB 写入完成", db_start, task_id)
         
-        # 96%: 数据库写入完成
-        update_task_progress(task_id, "processing", 96, 3, "保存中", "数据保存成功...", user_id=user['user_id'])
-        await asyncio.sleep(0.15)  # 短暂延迟，让进度可见
-        
-        # 98%: 最终验证
-        update_task_progress(task_id, "processing", 98, 3, "完成中", "最终验证...", user_id=user['user_id'])
-        await asyncio.sleep(0.1)  # 短暂延迟，让进度可见
-        
         # ============================================
         # Step 4: 完成 (100%)
         # ============================================
-        print(f"📊 [Progress] 任务完成: {task_id}")
-        update_task_progress(task_id, "completed", 100, 4, "完成", "日记创建成功", diary=diary_obj, user_id=user['user_id'])
+        logger.debug("📊 [Progress] 任务完成: %s", task_id)
+        update_task_progress(task_id, "completed", 100, 4, "完成", "日记创建成功", diary=diary_obj, user_id=user_id)
         _log_timing("纯语音全流程完成", total_start, task_id)
         
     except HTTPException as e:
-        update_task_progress(task_id, "failed", 0, 0, "错误", str(e.detail), error=str(e.detail), user_id=user['user_id'])
+        update_task_progress(task_id, "failed", 0, 0, "错误", str(e.detail), error=str(e.detail), user_id=user_id)
     except Exception as e:
-        print(f"❌ 纯语音日记处理失败: {str(e)}")
-        import traceback
-        traceback.print_exc()
-        update_task_progress(task_id, "failed", 0, 0, "错误", f"处理失败: {str(e)}", error=str(e), user_id=user['user_id'])
+        logger.exception("❌ 纯语音日记处理失败: %s", str(e), extra={"task_id": task_id})
+        update_task_progress(task_id, "failed", 0, 0, "错误", f"处理失败: {str(e)}", error=str(e), user_id=user_id)
+    finally:
+        close_audio_source(audio_content)
 
 
 async def process_voice_diary_async(
     task_id: str,
-    audio_content: bytes,
+    audio_content: AudioSource,
     audio_filename: str,
     audio_content_type: str,
     duration: int,
     user: Dict,
-    request: Optional[Request],
+    ctx: UserContext,
     image_urls: Optional[List[str]] = None,  # ✅ 新增：图片URL列表
     content: Optional[str] = None,  # ✅ 新增：用户手动输入的文字内容
     audio_url: Optional[str] = None
 ):
     """异步处理语音日记（后台任务）"""
+    user_id = ctx.user_id
     try:
         total_start = time.perf_counter()
         openai_service = get_openai_service()
         
         # ✅ 专家优化：进度对齐 (前端上传完音频已经是 20%)
-        update_task_progress(task_id, "processing", 22, 0, "验证中", "正在验证音频...", user_id=user['user_id'])
+        update_task_progress(task_id, "processing", 22, 0, "验证中", "正在验证音频...", user_id=user_id)
         
         # 验证音频质量
-        user_lang = get_user_language(request)
-        validate_audio_quality(duration, len(audio_content), language=user_lang)
+        validate_audio_quality(duration, upload_source_size(audio_content), language=ctx.lang)
         
         # ✅ 验证完成，跳过较低进度，直接到 25%
-        update_task_progress(task_id, "processing", 25, 0, "准备处理", "准备开始处理...", user_id=user['user_id'])
-        await asyncio.sleep(0.1)  # 短暂延迟，让前端看到进度变化
+        update_task_progress(task_id, "processing", 25, 0, "准备处理", "准备开始处理...", user_id=user_id)
         
         # ============================================
         # Step 1: 启动 S3 上传 (后台并行)
@@ -770,301 +975,305 @@ async def process_voice_diary_async(
             if audio_url:
                 return audio_url
             s3_start = time.perf_counter()
-            result = await asyncio.to_thread(
-                s3_service.upload_audio,
-                file_content=audio_content,
-                file_name=audio_filename,
-                content_type=audio_content_type
-            )
+            with independent_audio_reader(audio_content) as upload_source:
+                result = await s3_service.upload_audio_async(
+                    file_content=upload_source,
+                    file_name=audio_filename,
+                    content_type=audio_content_type
+                )
             _log_timing("S3 上传完成", s3_start, task_id)
             return result
         
-        # 启动上传任务
-        s3_upload_task = asyncio.create_task(upload_to_s3_async())
+        async with structured_tasks() as tg:
+            # 启动上传任务（结构化并发：后续任一步骤失败时上传/转录任务会被一并取消）
+            s3_upload_task = tg.create_task(upload_to_s3_async())
 
-        # ✅ Demo优化：移除无用的音频情绪分析（已改用文本情绪分析）
+            # ✅ Demo优化：移除无用的音频情绪分析（已改用文本情绪分析）
         
         
-        # ============================================
-        # Step 2 & 4: 并行处理 (18% → 70%) ← Demo优化
-        # ============================================
-        update_task_progress(task_id, "processing", 18, 2, "并行处理", "正在同时处理语音和内容...", user_id=user['user_id'])  # Demo优化：18%
-        
-        # 预先下载并编码图片（如果存在）
-        # 🚀 优化：不再下载和分析图片，避免 AI 被图片内容误导（如生成日文标题）
-        # encoded_images = []
-        # if image_urls and len(image_urls) > 0:
-        #     update_task_progress(task_id, "processing", 28, 2, "图片处理", "正在预处理图片...")
-        #     download_tasks = [openai_service._download_and_encode_image(url) for url in image_urls]
-        #     img_results = await asyncio.gather(*download_tasks, return_exceptions=True)
-        #     for i, img_data in enumerate(img_results):
-        #         if not isinstance(img_data, Exception):
-        #             encoded_images.append(img_data)
-        # 获取用户名字
-        user_display_name = get_display_name(user, request)
-
-        # 检测语言
-        user_language = get_user_language(request)
-        
-        print(f"🌐 检测到用户语言: {user_language}")
-
-        # 🚀 优化并行逻辑：转录任务独占 30% -> 50% 进度
-        async def do_transcription():
-            update_task_progress(task_id, "processing", 20, 2, "语音识别", "正在倾听你的故事...", user_id=user['user_id'])  # Demo优化：20%
-            
             # ============================================
-            # ✅ 2026-01-27 优化: 虚拟进度循环（行业最佳实践）
-            # - 每5%持久化一次，确保前端能看到进度
-            # - 两阶段速度：快速启动 + 平稳等待
+            # Step 2 & 4: 并行处理 (18% → 70%) ← Demo优化
             # ============================================
-            async def smooth_progress():
-                current_p = 20
-                last_persisted = 20
-                
-                # Phase 1: 快速增长 (20% → 42%)
-                while current_p < 42:
-                    await asyncio.sleep(0.3)
-                    current_p += 1
-                    should_persist = (current_p - last_persisted) >= 5
-                    if should_persist:
-                        last_persisted = current_p
-                    update_task_progress(task_id, "processing", current_p, 2, "语音识别", "正在将语音转为文字...", user_id=user['user_id'], persist=should_persist)
-                
-                # Phase 2: 缓慢增长 (42% → 55%)
-                while current_p < 55:
-                    await asyncio.sleep(0.8)
-                    current_p += 1
-                    should_persist = (current_p - last_persisted) >= 5
-                    if should_persist:
-                        last_persisted = current_p
-                    update_task_progress(task_id, "processing", current_p, 2, "语音识别", "语音识别中，请稍候...", user_id=user['user_id'], persist=should_persist)
-            
-            progress_task = asyncio.create_task(smooth_progress())
-            try:
-                transcribe_start = time.perf_counter()
-                transcription_result = await openai_service.transcribe_audio(
-                    audio_content,
-                    audio_filename,
-                    expected_duration=duration
-                )
-                _log_timing("Whisper 转录完成(含重试)", transcribe_start, task_id)
-                # 🔥 提取转录文本和检测到的语言
-                text = transcription_result["text"]
-                detected_lang = transcription_result.get("detected_language")
-                print(f"🌍 Whisper 检测到的语言: {detected_lang}")
-                return {"text": text, "detected_language": detected_lang}
-            finally:
-                progress_task.cancel()
-                update_task_progress(task_id, "processing", 58, 2, "语音识别", "识别完成", user_id=user['user_id'])
-        
-        # 立即启动转录任务
-        transcription_task = asyncio.create_task(do_transcription())
-
-        # 🚀 专家小组重构：实现三路彻底并行 (润色 | 情绪 | 反馈)
-        async def task_polish():
-            """任务 A: 润色 & 标题"""
-            trans_data = await transcription_task
-            text = trans_data["text"]
-            lang = "English" if trans_data.get("detected_language") in ["en", "en-US"] else ("Chinese" if user_lang == "zh" else user_lang)
-            
-            update_task_progress(task_id, "processing", 55, 3, "文字美化", "正在打磨每一个措辞...", user_id=user['user_id'])
-            
-            combined = text
-            if content and content.strip():
-                combined = f"{content.strip()}\n{text}"
-            
-            polish_start = time.perf_counter()
-            res = await openai_service._call_gpt4o_for_polish_and_title(combined, lang, None)
-            _log_timing("AI 润色+标题完成", polish_start, task_id)
-            update_task_progress(task_id, "processing", 75, 3, "文字美化", "文字美化已完成", user_id=user['user_id'])
-            return res
-
-        async def task_emotion():
-            """任务 B: 独立的情绪分析"""
-            trans_data = await transcription_task
-            text = trans_data["text"]
-            lang = "English" if trans_data.get("detected_language") in ["en", "en-US"] else ("Chinese" if user_lang == "zh" else user_lang)
+            update_task_progress(task_id, "processing", 18, 2, "并行处理", "正在同时处理语音和内容...", user_id=user_id)  # Demo优化：18%
+        
+            # 预先下载并编码图片（如果存在）
+            # 🚀 优化：不再下载和分析图片，避免 AI 被图片内容误导（如生成日文标题）
+            # encoded_images = []
+            # if image_urls and len(image_urls) > 0:
+            #     update_task_progress(task_id, "processing", 28, 2, "图片处理", "正在预处理图片...")
+            #     download_tasks = [openai_service._download_and_encode_image(url) for url in image_urls]
+            #     img_results = await asyncio.gather(*download_tasks, return_exceptions=True)
+            #     for i, img_data in enumerate(img_results):
+            #         if not isinstance(img_data, Exception):
+            #             encoded_images.append(img_data)
+            logger.debug("🌐 检测到用户语言: %s", ctx.lang)
+
+            # 🚀 优化并行逻辑：转录任务独占 30% -> 50% 进度
+            async def do_transcription():
+                update_task_progress(task_id, "processing", 20, 2, "语音识别", "正在倾听你的故事...", user_id=user_id)  # Demo优化：20%
             
-            update_task_progress(task_id, "processing", 58, 3, "情绪感应", "正在用心倾听你的心情...", user_id=user['user_id'])
-            
-            combined = text
-            if content and content.strip():
-                combined = f"{content.strip()}\n{text}"
-            
-            emotion_start = time.perf_counter()
-            res = await openai_service.analyze_emotion_only(combined, lang, None)
-            _log_timing("情绪分析完成", emotion_start, task_id)
-            update_task_progress(task_id, "processing", 78, 3, "情绪感应", "情绪感应已完成", user_id=user['user_id'])
-            return res
-
-        async def task_feedback():
-            """任务 C: 独立的反馈生成"""
-            trans_data = await transcription_task
-            text = trans_data["text"]
-            lang = "English" if trans_data.get("detected_language") in ["en", "en-US"] else ("Chinese" if user_lang == "zh" else user_lang)
-            
-            update_task_progress(task_id, "processing", 60, 3, "生成回应", "正在为你准备温暖的话语...", user_id=user['user_id'])
-            
-            combined = text
-            if content and content.strip():
-                combined = f"{content.strip()}\n{text}"
+                transcription_done = asyncio.Event()
+                progress_task = asyncio.create_task(virtual_progress(
+                    task_id, 20, 55, transcription_done, duration_hint=8.0,
+                    step=2, step_name="语音识别",
+                    messages=["正在将语音转为文字...", "语音识别中，请稍候..."],
+                    user_id=user_id
+                ))
+                try:
+                    transcribe_start = time.perf_counter()
+                    transcription_result = await openai_service.transcribe_audio(
+                        audio_content,
+                        audio_filename,
+                        expected_duration=duration
+                    )
+                    _log_timing("Whisper 转录完成(含重试)", transcribe_start, task_id)
+                    # 🔥 提取转录文本和检测到的语言
+                    text = transcription_result["text"]
+                    detected_lang = transcription_result.get("detected_language")
+                    logger.debug("🌍 Whisper 检测到的语言: %s", detected_lang)
+                    return {"text": text, "detected_language": detected_lang}
+                finally:
+                    transcription_done.set()
+                    await progress_task
+                    update_task_progress(task_id, "processing", 58, 2, "语音识别", "识别完成", user_id=user_id)
+        
+            # 立即启动转录任务
+            transcription_task = tg.create_task(do_transcription())
+
+            # 转录结果只 await 一次；输入文本和语言在这里统一算好，后续直接复用
+            trans_info = await transcription_task
+            transcription_final = trans_info["text"]
+            detected_language = trans_info.get("detected_language")
+            lang = resolve_language(detected_language, ctx.lang)
+            stripped_content = content.strip() if content else ""
+            combined_text = f"{stripped_content}\n{transcription_final}" if stripped_content else transcription_final
+
+            # 🚀 合并调用：润色 + 标题 + 情绪 + 反馈 一次 GPT-4o 请求完成
+            # 转录文本和提示词只发送一次，省去三路并行时重复的输入 token 和长尾等待
+            async def task_combined(combined_text: str, lang: str):
+                update_task_progress(task_id, "processing", 60, 3, "AI处理", "正在打磨文字、感受你的心情...", user_id=user_id)
             
-            feedback_start = time.perf_counter()
-            res = await openai_service._call_gpt4o_for_feedback(combined, lang, user_display_name, None)
-            _log_timing("AI 反馈完成", feedback_start, task_id)
-            update_task_progress(task_id, "processing", 80, 4, "生成回应", "温暖回应已准备就绪", user_id=user['user_id'])
-            return res
-
-        # 🔥 🔥 🔥 三路 Agent 同时开工！
-        # 即使其中一个 Agent 出现非致命错误，也不应阻塞主日记对象的创建
-        print(f"🚀 [Task:{task_id}] 启动高度并发 Agent 编排 (Polish & Emotion & Feedback)...")
-        tasks = [task_polish(), task_emotion(), task_feedback()]
-        results = await asyncio.gather(*tasks, return_exceptions=True)
-        
-        # 结果解构与错误兜底
-        polish_result = results[0] if not isinstance(results[0], Exception) else {"title": "我的日记", "polished_content": (await transcription_task)["text"]}
-        emotion_result = results[1] if not isinstance(results[1], Exception) else {"emotion": "Thoughtful", "confidence": 0.5, "rationale": "未能识别"}
-        feedback_data = results[2] if not isinstance(results[2], Exception) else "感谢分享你的故事。"
-
-        # 提取结果供后续使用
-        trans_info = await transcription_task
-        transcription_final = trans_info["text"]
-        detected_language = trans_info.get("detected_language")
-        
-        # 提取反馈内容
-        if isinstance(feedback_data, dict):
-            feedback_text = feedback_data.get("reply", "")
-        else:
-            feedback_text = feedback_data
-        
-        # ✅ 使用专门Emotion Agent的结果
-        emotion_data = {
-            "emotion": emotion_result.get("emotion", "Thoughtful"),
-            "confidence": emotion_result.get("confidence", 0.0),
-            "rationale": emotion_result.get("rationale", ""),
-            "source": "text_only",
-            "meta": {
-                "text": emotion_result
+                combined_start = time.perf_counter()
+                res = await openai_service.polish_emotion_feedback_combined(combined_text, lang, ctx.display_name)
+                _log_timing("AI 合并处理完成(润色/标题/情绪/反馈)", combined_start, task_id)
+                update_task_progress(task_id, "processing", 80, 4, "生成回应", "温暖回应已准备就绪", user_id=user_id)
+                return res
+
+            # 即使 AI 调用失败，也不应阻塞主日记对象的创建
+            logger.debug("🚀 [Task:%s] 启动合并 Agent (Polish + Emotion + Feedback)...", task_id)
+            try:
+                combined_result = await task_combined(combined_text, lang)
+                polish_result = combined_result["polish"]
+                emotion_result = combined_result["emotion"]
+                feedback_data = combined_result["feedback"]
+            except Exception as e:
+                logger.warning("⚠️ [Task:%s] 合并 Agent 失败，使用兜底结果: %s", task_id, e)
+                polish_result = {"title": "我的日记", "polished_content": transcription_final}
+                emotion_result = {"emotion": "Thoughtful", "confidence": 0.5, "rationale": "未能识别"}
+                feedback_data = "感谢分享你的故事。"
+        
+            # 提取反馈内容
+            if isinstance(feedback_data, dict):
+                feedback_text = feedback_data.get("reply", "")
+            else:
+                feedback_text = feedback_data
+        
+            # ✅ 使用专门Emotion Agent的结果
+            emotion_data = {
+                "emotion": emotion_result.get("emotion", "Thoughtful"),
+                "confidence": emotion_result.get("confidence", 0.0),
+                "rationale": emotion_result.get("rationale", ""),
+                "source": "text_only",
+                "meta": {
+                    "text": emotion_result
+                }
             }
-        }
         
-        ai_result = {
-            "title": polish_result['title'],
-            "polished_content": polish_result['polished_content'],
-            "feedback": feedback_text,
-            "emotion_data": emotion_data,
-            "transcription": transcription_final, # ✅ 使用最终的转录内容
-            "detected_language": detected_language
-        }
+            ai_result = {
+                "title": polish_result['title'],
+                "polished_content": polish_result['polished_content'],
+                "feedback": feedback_text,
+                "emotion_data": emotion_data,
+                "transcription": transcription_final, # ✅ 使用最终的转录内容
+                "detected_language": detected_language,
+                # 🌍 存库语言代码由 Whisper 结果决定，不依赖模型输出
+                "language": LANGUAGE_CODES.get(lang, "zh")
+            }
         
-        update_task_progress(task_id, "processing", 82, 3, "AI处理", "全部处理完成", user_id=user['user_id'])
+            update_task_progress(task_id, "processing", 82, 3, "AI处理", "全部处理完成", user_id=user_id)
         
-        update_task_progress(task_id, "processing", 88, 4, "整理内容", "正在为你整理日记...", user_id=user['user_id'])
-        await asyncio.sleep(0.1)
-        update_task_progress(task_id, "processing", 92, 5, "保存数据", "正在保存到数据库...", user_id=user['user_id'])
-        await asyncio.sleep(0.2)
+            update_task_progress(task_id, "processing", 88, 4, "整理内容", "正在为你整理日记...", user_id=user_id)
+            update_task_progress(task_id, "processing", 92, 5, "保存数据", "正在保存到数据库...", user_id=user_id)
         
-        # ✅ 专家优化：合并并验证图片URL
-        print(f"🔍 [Task:{task_id}] 开始汇总图片. 初始参数图片: {len(image_urls) if image_urls else 0}")
-        final_image_urls = image_urls if image_urls is not None else []
+            # ✅ 专家优化：合并并验证图片URL
+            logger.debug("🔍 [Task:%s] 开始汇总图片. 初始参数图片: %s", task_id, len(image_urls) if image_urls else 0)
+            final_image_urls = image_urls if image_urls is not None else []
         
-        # ✅ 关键修复：从任务进度中获取最新图片URL（考虑并行补充的情况）
-        task_data_from_db = db_service.get_task_progress(task_id, user_id=user['user_id'])
-        if task_data_from_db:
-            # 兼容多种可能的键名
-            db_urls = task_data_from_db.get("image_urls")
-            if db_urls is None:
-                db_urls = task_data_from_db.get("imageUrls")
-            
-            if db_urls is not None:
-                # 只要数据库里有（哪怕是空列表），就以数据库为准，因为那是最新的状态
-                final_image_urls = db_urls
-                print(f"✅ [Task:{task_id}] 从任务数据中同步图片URL，共 {len(final_image_urls)} 张")
+            # ✅ 关键修复：从任务进度中获取最新图片URL（考虑并行补充的情况）
+            # 本进程是任务的主要写入方，优先读内存缓存；缓存未命中才读 DynamoDB
+            task_data_from_db = get_cached_task(task_id) or await asyncio.to_thread(db_service.get_task_progress, task_id, user_id=user_id)
+            if task_data_from_db:
+                db_urls = _task_image_urls(task_data_from_db)
+                if db_urls is not None:
+                    # 只要数据库里有（哪怕是空列表），就以数据库为准，因为那是最新的状态
+                    final_image_urls = db_urls
+                    logger.info("✅ [Task:%s] 从任务数据中同步图片URL，共 %s 张", task_id, len(final_image_urls))
             
-            # 如果目前还是没图片，但标记了等待上传，则进入等待逻辑
-            if not final_image_urls and task_data_from_db.get("pending_image_upload"):
-                print(f"⏳ [Task:{task_id}] 检测到 pending_image_upload=True，开始等待图片上传...")
-                update_task_progress(task_id, "processing", 93, 5, "等待图片", "正在等待图片上传...", user_id=user['user_id'])
-                # 等待最多30秒
-                max_wait_time = 30
-                wait_interval = 0.5
-                progress_update_interval = 1
-                waited_time = 0
-                last_progress_update = 0
-                while waited_time < max_wait_time:
-                    # 重新获取任务数据
-                    task_data_from_db = db_service.get_task_progress(task_id, user_id=user['user_id'])
-                    if task_data_from_db:
-                        db_urls = task_data_from_db.get("image_urls")
-                        if db_urls is None:
-                            db_urls = task_data_from_db.get("imageUrls")
-                            
-                        if db_urls is not None:
-                            final_image_urls = db_urls
-                            print(f"✅ [Task:{task_id}] 图片异步补充完成: {len(final_image_urls)} 张")
-                            break
-                        
-                        if not task_data_from_db.get("pending_image_upload"):
-                            print(f"✅ [Task:{task_id}] 标记位已重置(False)，停止等待")
-                            break
-                    
-                    # ✅ 定期更新进度，避免用户感觉卡住（93% -> 94% -> 95%）
-                    if waited_time - last_progress_update >= progress_update_interval:
-                        progress_value = min(93 + int((waited_time / max_wait_time) * 4), 97)
-                        update_task_progress(
-                            task_id,
-                            "processing",
-                            progress_value,
-                            5,
-                            "等待图片",
-                            f"正在等待图片上传... ({int(waited_time)}秒)",
-                            user_id=user['user_id']
-                        )
-                        last_progress_update = waited_time
-                    
-                    await asyncio.sleep(wait_interval)
-                    waited_time += wait_interval
+                # 如果目前还是没图片，但标记了等待上传，则进入等待逻辑
+                if not final_image_urls and task_data_from_db.get("pending_image_upload"):
+                    logger.debug("⏳ [Task:%s] 检测到 pending_image_upload=True，开始等待图片上传...", task_id)
+                    update_task_progress(task_id, "processing", 93, 5, "等待图片", "正在等待图片上传...", user_id=user_id)
+                    image_event = pending_image_events.get(task_id) or asyncio.Event()
+                    ticker = asyncio.create_task(_tick_image_wait_progress(task_id, user_id))
+                    deadline = time.monotonic() + IMAGE_WAIT_TIMEOUT
+                    poll_interval = IMAGE_WAIT_DB_POLL_INTERVAL
+                    try:
+                        while (remaining := deadline - time.monotonic()) > 0:
+                            try:
+                                await asyncio.wait_for(image_event.wait(), timeout=min(poll_interval, remaining))
+                            except asyncio.TimeoutError:
+                                # 跨实例兜底轮询按指数退避，30 秒内最多读几次 DynamoDB
+                                poll_interval = min(poll_interval * 2, IMAGE_WAIT_DB_POLL_MAX_INTERVAL)
+                            # 被 Event 唤醒时内存缓存已是最新；否则读 DynamoDB（可能由其他实例补充）
+                            if image_event.is_set():
+                                latest = get_cached_task(task_id)
+                            else:
+                                latest = await asyncio.to_thread(db_service.get_task_progress, task_id, user_id=user_id)
+                            if not latest:
+                                continue
+                            db_urls = _task_image_urls(latest)
+                            if db_urls is not None:
+                                final_image_urls = db_urls
+                                logger.info("✅ [Task:%s] 图片异步补充完成: %s 张", task_id, len(final_image_urls))
+                                break
+                            if not latest.get("pending_image_upload"):
+                                logger.info("✅ [Task:%s] 标记位已重置(False)，停止等待", task_id)
+                                break
+                    finally:
+                        ticker.cancel()
+                        pending_image_events.pop(task_id, None)
                 
-                if not final_image_urls:
-                    print("⚠️ 图片上传超时，继续保存（无图片）")
+                    if not final_image_urls:
+                        logger.warning("⚠️ 图片上传超时，继续保存（无图片）")
         
-        # ✅ 确保 final_image_urls 是列表而不是 None
-        if final_image_urls is None:
-            final_image_urls = []
+            # ✅ 确保 final_image_urls 是列表而不是 None
+            if final_image_urls is None:
+                final_image_urls = []
         
-        print(f"📸 保存日记，图片数量: {len(final_image_urls)}, URLs: {final_image_urls}")
+            logger.debug("📸 保存日记，图片数量: %s, URLs: %s", len(final_image_urls), final_image_urls)
         
-        # 保存到数据库
-        db_start = time.perf_counter()
-        diary_obj = db_service.create_diary(
-            user_id=user['user_id'],
-            original_content=transcription_final,
-            polished_content=ai_result["polished_content"],
-            ai_feedback=ai_result["feedback"],
-            language=ai_result.get("detected_language", "zh"),
-            title=ai_result["title"],
-            audio_url=await s3_upload_task,  # ✅ 等待上传完成
-            audio_duration=duration,
-            image_urls=final_image_urls,  # ✅ 使用最终图片URL（确保是列表）
-            emotion_data=ai_result["emotion_data"] # ✅ 传递情绪数据
-        )
-        _log_timing("DynamoDB 写入完成", db_start, task_id)
+            item, diary_obj = db_service.build_diary_record(
+                user_id=user_id,
+                original_content=transcription_final,
+                polished_content=ai_result["polished_content"],
+                ai_feedback=ai_result["feedback"],
+                language=ai_result["language"],
+                title=ai_result["title"],
+                audio_url=await s3_upload_task,  # ✅ 等待上传完成
+                audio_duration=duration,
+                image_urls=final_image_urls,  # ✅ 使用最终图片URL（确保是列表）
+                emotion_data=ai_result["emotion_data"] # ✅ 传递情绪数据
+            )
         
-        # 更新进度：完成（分两步，让进度更平滑）
-        update_task_progress(task_id, "processing", 96, 5, "保存数据", "数据保存中...", user_id=user['user_id'])
-        await asyncio.sleep(0.2)
-        update_task_progress(task_id, "processing", 98, 5, "完成", "数据保存成功", user_id=user['user_id'])
-        await asyncio.sleep(0.2)
-        update_task_progress(task_id, "completed", 100, 5, "完成", "日记创建成功", diary=diary_obj, user_id=user['user_id'])
+        # 🚀 日记写入 + 任务完成合并为一次 TransactWriteItems（前端自行补齐 93% → 100% 的过渡）
+        # completed 状态先构建为独立快照，事务提交成功后才进入缓存；写库失败时缓存仍是 processing，
+        # 由下方 except 标记为 failed
+        completed_task = {
+            **(get_cached_task(task_id) or {"user_id": user_id}),
+            "status": "completed",
+            "progress": 100,
+            "step": 5,
+            "step_name": "完成",
+            "message": "日记创建成功",
+            "updated_at": datetime.now(timezone.utc).isoformat(),
+            "diary": diary_obj,
+        }
+        _dirty_progress.pop(task_id, None)
+        db_start = time.perf_counter()
+        # 已排队的 processing 快照晚于事务写入时，由 DynamoDB 条件写入拦截；缓存只在事件循环上修改
+        await asyncio.to_thread(db_service.create_diary_and_complete_task, item, task_id, completed_task, user_id)
+        cache_task(task_id, completed_task)
+        pending_image_events.pop(task_id, None)
+        _expire_cached_task_later(task_id)
+        _log_timing("DynamoDB 写入完成(日记+任务)", db_start, task_id)
         _log_timing("混合流程全流程完成", total_start, task_id)
         
     except HTTPException as e:
-        update_task_progress(task_id, "failed", 0, 0, "错误", str(e.detail), error=str(e.detail), user_id=user['user_id'])
+        update_task_progress(task_id, "failed", 0, 0, "错误", str(e.detail), error=str(e.detail), user_id=user_id)
     except Exception as e:
-        print(f"❌ 异步处理失败: {str(e)}")
-        import traceback
-        traceback.print_exc()
-        update_task_progress(task_id, "failed", 0, 0, "错误", f"处理失败: {str(e)}", error=str(e), user_id=user['user_id'])
+        logger.exception("❌ 异步处理失败: %s", str(e), extra={"task_id": task_id})
+        update_task_progress(task_id, "failed", 0, 0, "错误", f"处理失败: {str(e)}", error=str(e), user_id=user_id)
+    finally:
+        close_audio_source(audio_content)
+
+
+# 🔥 已下载音频的 LRU 缓存（按字节数限额）：同一个 audio_url 在任务处理期间只 GET 一次
+# 任务进入终态（completed / failed）后立即释放对应条目，不长期占用 Lambda 内存
+AUDIO_CACHE_MAX_BYTES = 100 * 1024 * 1024
+_audio_cache: "OrderedDict[str, bytes]" = OrderedDict()
+_audio_cache_bytes = 0
+
+def _get_cached_audio(audio_url: str) -> Optional[bytes]:
+    audio_content = _audio_cache.get(audio_url)
+    if audio_content is not None:
+        _audio_cache.move_to_end(audio_url)
+    return audio_content
+
+def _cache_audio(audio_url: str, audio_content: bytes) -> None:
+    """写入音频缓存，超出字节上限时淘汰最久未使用的条目"""
+    global _audio_cache_bytes
+    if len(audio_content) > AUDIO_CACHE_MAX_BYTES:
+        return
+    release_cached_audio(audio_url)
+    _audio_cache[audio_url] = audio_content
+    _audio_cache_bytes += len(audio_content)
+    while _audio_cache_bytes > AUDIO_CACHE_MAX_BYTES:
+        _, evicted = _audio_cache.popitem(last=False)
+        _audio_cache_bytes -= len(evicted)
+
+def release_cached_audio(audio_url: str) -> None:
+    """释放某个音频的缓存条目"""
+    global _audio_cache_bytes
+    evicted = _audio_cache.pop(audio_url, None)
+    if evicted is not None:
+        _audio_cache_bytes -= len(evicted)
+
+async def fetch_uploaded_audio(task_id: str, audio_url: str, label: str,
+                               timeout: Optional[float] = None) -> bytes:
+    """
+    获取已上传到 S3 的音频
+    
+    先查进程内缓存；未命中时优先通过 S3 API 下载（IAM 凭证，复用 boto3 连接池），
+    失败时降级为公网 URL，用共享 httpx 连接池按 64KB 分块流式读取
+    """
+    cached = _get_cached_audio(audio_url)
+    if cached is not None:
+        logger.debug("📥 [Task:%s] 命中音频缓存: %s", task_id, audio_url)
+        return cached
+
+    download_start = time.perf_counter()
+    try:
+        audio_content = await asyncio.to_thread(s3_service.download_object_by_url, audio_url)
+        _log_timing(f"下载音频完成({label},S3内网)", download_start, task_id)
+    except Exception as e:
+        logger.warning("⚠️ [Task:%s] S3内网下载失败，降级公网URL: %s: %s", task_id, type(e).__name__, e)
+        buffer = bytearray()
+        request_kwargs = {"timeout": timeout} if timeout is not None else {}
+        async with get_http_client().stream("GET", audio_url, **request_kwargs) as response:
+            response.raise_for_status()
+            async for chunk in response.aiter_bytes(64 * 1024):
+                buffer += chunk
+        audio_content = bytes(buffer)
+        _log_timing(f"下载音频完成({label},公网)", download_start, task_id)
+
+    _cache_audio(audio_url, audio_content)
+    return audio_content
+
+def _release_audio_if_terminal(task_id: str, audio_url: str) -> None:
+    """任务进入终态（completed / failed）后释放音频缓存"""
+    task_data = get_cached_task(task_id)
+    if task_data and task_data.get("status") in TERMINAL_TASK_STATUSES:
+        release_cached_audio(audio_url)
 
 
 async def process_pure_voice_diary_with_url_async(
@@ -1072,27 +1281,13 @@ async def process_pure_voice_diary_with_url_async(
     audio_url: str,
     duration: int,
     user: Dict,
-    request: Optional[Request]
+    ctx: UserContext
 ):
     """优化版纯语音日记处理函数 - 使用已上传URL"""
     try:
         # 下载音频内容用于转录（优先S3内网下载）
-        download_start = time.perf_counter()
-        print(f"📥 [Task:{task_id}] 正在获取音频内容: {audio_url}", flush=True)
-        try:
-            audio_content = await asyncio.to_thread(
-                s3_service.download_object_by_url,
-                audio_url
-            )
-            _log_timing("下载音频完成(纯语音URL,S3内网)", download_start, task_id)
-        except Exception as e:
-            print(f"⚠️ [Task:{task_id}] S3内网下载失败，降级公网URL: {type(e).__name__}: {e}")
-            import httpx
-            async with httpx.AsyncClient(timeout=60.0) as client:
-                response = await client.get(audio_url)
-                response.raise_for_status()
-                audio_content = response.content
-            _log_timing("下载音频完成(纯语音URL,公网)", download_start, task_id)
+        logger.debug("📥 [Task:%s] 正在获取音频内容: %s", task_id, audio_url)
+        audio_content = await fetch_uploaded_audio(task_id, audio_url, "纯语音URL", timeout=60.0)
         
         # 调用核心处理函数
         await process_pure_voice_diary_async(
@@ -1102,12 +1297,14 @@ async def process_pure_voice_diary_with_url_async(
             audio_content_type="audio/m4a",
             duration=duration,
             user=user,
-            request=request,
+            ctx=ctx,
             audio_url=audio_url
         )
     except Exception as e:
-        print(f"❌ 获取已上传音频失败: {str(e)}")
-        update_task_progress(task_id, "failed", 0, 0, "错误", f"下载音频失败: {str(e)}", error=str(e), user_id=user['user_id'])
+        logger.error("❌ 获取已上传音频失败: %s", str(e))
+        update_task_progress(task_id, "failed", 0, 0, "错误", f"下载音频失败: {str(e)}", error=str(e), user_id=ctx.user_id)
+    finally:
+        _release_audio_if_terminal(task_id, audio_url)
 
 
 async def process_voice_diary_with_url_async(
@@ -1115,45 +1312,99 @@ async def process_voice_diary_with_url_async(
     audio_url: str,
     duration: int,
     user: Dict,
-    request: Optional[Request],
+    ctx: UserContext,
     image_urls: Optional[List[str]] = None,
     content: Optional[str] = None
 ):
     """优化版混合媒体处理函数 - 使用已上传URL"""
     try:
-        update_task_progress(task_id, "processing", 18, 1, "下载资源", "正在获取音频...", user_id=user["user_id"])
-        download_start = time.perf_counter()
-        print(f"📥 [Task:{task_id}] 正在下载音频: {audio_url}", flush=True)
-        try:
-            audio_content = await asyncio.to_thread(
-                s3_service.download_object_by_url,
-                audio_url
-            )
-            _log_timing("下载音频完成(混合URL,S3内网)", download_start, task_id)
-        except Exception as e:
-            print(f"⚠️ [Task:{task_id}] S3内网下载失败，降级公网URL: {type(e).__name__}: {e}")
-            import httpx
-            timeout = httpx.Timeout(30.0, connect=10.0)
-            async with httpx.AsyncClient(timeout=timeout) as client:
-                response = await client.get(audio_url)
-                response.raise_for_status()
-                audio_content = response.content
-            _log_timing("下载音频完成(混合URL,公网)", download_start, task_id)
+        update_task_progress(task_id, "processing", 18, 1, "下载资源", "正在获取音频...", user_id=ctx.user_id)
+        logger.debug("📥 [Task:%s] 正在下载音频: %s", task_id, audio_url)
+        audio_content = await fetch_uploaded_audio(task_id, audio_url, "混合URL")
         await process_voice_diary_async(
             task_id=task_id, audio_content=audio_content, audio_filename="recording.m4a",
             audio_content_type="audio/m4a", duration=duration, user=user,
-            request=request, image_urls=image_urls, content=content, audio_url=audio_url
+            ctx=ctx, image_urls=image_urls, content=content, audio_url=audio_url
         )
     except Exception as e:
-        print(f"❌ [Task:{task_id}] 后台任务异常: {str(e)}", flush=True)
-        import traceback
-        traceback.print_exc()
-        update_task_progress(task_id, "failed", 0, 0, "错误", f"处理任务失败: {str(e)}", error=str(e), user_id=user["user_id"])
+        logger.exception("❌ [Task:%s] 后台任务异常: %s", task_id, str(e), extra={"task_id": task_id})
+        update_task_progress(task_id, "failed", 0, 0, "错误", f"处理任务失败: {str(e)}", error=str(e), user_id=ctx.user_id)
+    finally:
+        _release_audio_if_terminal(task_id, audio_url)
+
+
+async def process_chunked_upload_async(
+    task_id: str,
+    session_id: str,
+    chunk_count: int,
+    duration: int,
+    user: Dict,
+    ctx: UserContext,
+    image_urls: Optional[List[str]] = None,
+    content: Optional[str] = None,
+    pure_voice: bool = False
+):
+    """
+    分块上传的后台处理：先合并 chunks，再进入对应的 URL 处理流程
+    
+    🚀 合并不在 /audio/chunk-complete 的请求路径上，客户端立即拿到 task_id 开始轮询，
+    合并耗时被进度轮询覆盖（5% 合并中 → 15% 音频已准备）
+    """
+    try:
+        merge_start = time.perf_counter()
+
+        async def read_last_chunk() -> Optional[bytes]:
+            # 🚀 合并结果就是最后一个 chunk 的副本：与 CopyObject 并行读取它，
+            # 后续转录命中音频缓存，不再额外读一次合并后的文件；读取失败时由处理流程自行下载
+            try:
+                return await asyncio.to_thread(s3_service.download_chunk, session_id, chunk_count - 1)
+            except Exception as e:
+                logger.warning("⚠️ [Task:%s] 预读最后一个 chunk 失败: %s: %s", task_id, type(e).__name__, e)
+                return None
+
+        async with structured_tasks() as tg:
+            merge_task = tg.create_task(asyncio.to_thread(
+                s3_service.merge_chunks,
+                session_id=session_id,
+                chunk_count=chunk_count,
+                output_filename="recording.m4a"
+            ))
+            prefetch_task = tg.create_task(read_last_chunk())
+        audio_url = merge_task.result()
+        if (prefetched_audio := prefetch_task.result()) is not None:
+            _cache_audio(audio_url, prefetched_audio)
+        # 临时 chunks 在后台线程清理
+        spawn_background(asyncio.to_thread(s3_service.cleanup_chunks, session_id, chunk_count), name=f"cleanup-chunks-{session_id}")
+        _log_timing("合并 chunks 完成", merge_start, task_id)
+        logger.info("✅ [Task:%s] 音频合并完成: %s", task_id, audio_url)
+    except Exception as e:
+        logger.exception("❌ [Task:%s] 合并 chunks 失败: %s", task_id, str(e), extra={"task_id": task_id})
+        update_task_progress(task_id, "failed", 0, 0, "错误", "音频合并失败", error="CHUNK_MERGE_FAILED", user_id=ctx.user_id)
+        return
+
+    # audio_url 属于 TASK_PROGRESS_FIELDS，随下面这次步骤切换的刷盘写入 DynamoDB
+    cached_task = get_cached_task(task_id)
+    if cached_task is not None:
+        cached_task["audio_url"] = audio_url
+    update_task_progress(task_id, "processing", 15, 1, "音频已准备", "音频已准备就绪，开始处理...", user_id=ctx.user_id)
+
+    if pure_voice:
+        await process_pure_voice_diary_with_url_async(
+            task_id=task_id, audio_url=audio_url, duration=duration, user=user, ctx=ctx
+        )
+    else:
+        await process_voice_diary_with_url_async(
+            task_id=task_id, audio_url=audio_url, duration=duration, user=user,
+            ctx=ctx, image_urls=image_urls, content=content
+        )
+
+
 @router.post("/voice/stream", summary="创建语音日记（实时进度版）")
 async def create_voice_diary_stream(
     audio: UploadFile = File(...),
     duration: int = Form(...),
     user: Dict = Depends(get_current_user),
+    user_lang: str = Depends(user_language_dep),
     request: Request = None  # FastAPI 会自动注入 Request 对象（与旧端点保持一致）
 ):
     """
@@ -1180,218 +1431,234 @@ async def create_voice_diary_stream(
     try:
         # 验证文件类型
         if not audio.content_type.startswith("audio/"):
-            async def error_stream() -> AsyncGenerator[str, None]:
+            async def error_stream() -> AsyncGenerator[bytes, None]:
                 error_data = {"error": "请上传音频文件"}
-                yield await send_sse_event("error", error_data)
+                yield send_sse_event("error", error_data)
             
             return StreamingResponse(
                 error_stream(),
                 media_type="text/event-stream",
-                headers={
-                    "Cache-Control": "no-cache",
-                    "Connection": "keep-alive",
-                    "X-Accel-Buffering": "no"
-                }
+                headers=_SSE_HEADERS
             )
         
-        # 读取音频内容（必须在生成器外部）
-        audio_content = await audio.read()
+        # 🔥 不读入内存：生成器在请求处理函数返回后才执行，此时 UploadFile 已被关闭，
+        # 所以在外部为上传和转录各打开一个独立句柄；生成器从未执行（客户端提前断开）时
+        # 由响应的 background 兜底关闭，关闭操作可重复执行
         audio_filename = audio.filename or "recording.m4a"
         audio_content_type = audio.content_type or "audio/m4a"
         
         # 验证音频质量
-        user_lang = get_user_language(request)
-        validate_audio_quality(duration, len(audio_content), language=user_lang)
+        ctx = build_user_context(user, request, user_lang)
+        audio_size = audio.size if audio.size is not None else upload_source_size(audio.file)
+        validate_audio_quality(duration, audio_size, language=ctx.lang)
+        upload_reader = open_independent_reader(audio)
+        try:
+            transcribe_reader = open_independent_reader(audio)
+        except Exception:
+            upload_reader.close()
+            raise
         
     except HTTPException as e:
         # 验证失败，返回错误流
-        async def error_stream() -> AsyncGenerator[str, None]:
+        async def error_stream() -> AsyncGenerator[bytes, None]:
             error_data = {"error": str(e.detail), "status_code": e.status_code}
-            yield await send_sse_event("error", error_data)
+            yield send_sse_event("error", error_data)
         
         return StreamingResponse(
             error_stream(),
             media_type="text/event-stream",
-            headers={
-                "Cache-Control": "no-cache",
-                "Connection": "keep-alive",
-                "X-Accel-Buffering": "no"
-            }
+            headers=_SSE_HEADERS
         )
     except Exception as e:
         # 其他错误
-        async def error_stream() -> AsyncGenerator[str, None]:
+        async def error_stream() -> AsyncGenerator[bytes, None]:
             error_data = {"error": f"读取音频文件失败: {str(e)}", "status_code": 500}
-            yield await send_sse_event("error", error_data)
+            yield send_sse_event("error", error_data)
         
         return StreamingResponse(
             error_stream(),
             media_type="text/event-stream",
-            headers={
-                "Cache-Control": "no-cache",
-                "Connection": "keep-alive",
-                "X-Accel-Buffering": "no"
-            }
+            headers=_SSE_HEADERS
         )
     
-    async def process_and_stream() -> AsyncGenerator[str, None]:
+    async def process_and_stream() -> AsyncGenerator[bytes, None]:
         """异步生成器：处理语音并推送进度"""
-        try:
-            openai_service = get_openai_service()
+        # 🔥 处理流程在独立任务中运行，通过队列把进度事件交给生成器推送；
+        # TaskGroup 不能跨越 yield（生成器挂起时取消会作用到错误的任务上）
+        events: asyncio.Queue = asyncio.Queue()
+
+        def emit(event_type: str, data: Dict) -> None:
+            events.put_nowait(send_sse_event(event_type, data))
+
+        async def run_pipeline() -> None:
+            try:
+                openai_service = get_openai_service()
             
-            # ============================================
-            # Step 1: 开始处理（音频内容已在外部读取）
-            # ============================================
-            yield await send_sse_event("progress", {
-                "step": 0,
-                "step_name": "开始处理",
-                "progress": 0,
-                "message": "正在验证音频..."
-            })
+                # ============================================
+                # Step 1: 开始处理（音频内容已在外部读取）
+                # ============================================
+                emit("progress", {
+                    "step": 0,
+                    "step_name": "开始处理",
+                    "progress": 0,
+                    "message": "正在验证音频..."
+                })
             
-            # ============================================
-            # Step 2 & 3: 并行处理 (上传S3 + 语音转文字)
-            # ============================================
-            yield await send_sse_event("progress", {
-                "step": 1,
-                "step_name": "处理中",
-                "progress": 20,
-                "message": "正在上传音频并识别内容..."
-            })
+                # ============================================
+                # Step 2 & 3: 并行处理 (上传S3 + 语音转文字)
+                # ============================================
+                emit("progress", {
+                    "step": 1,
+                    "step_name": "处理中",
+                    "progress": 20,
+                    "message": "正在上传音频并识别内容..."
+                })
             
-            async def upload_to_s3_async():
-                return await asyncio.to_thread(
-                    s3_service.upload_audio,
-                    file_content=audio_content,
-                    file_name=audio_filename,
-                    content_type=audio_content_type
-                )
+                async def upload_to_s3_async():
+                    try:
+                        return await s3_service.upload_audio_async(
+                            file_content=upload_reader,
+                            file_name=audio_filename,
+                            content_type=audio_content_type
+                        )
+                    finally:
+                        upload_reader.close()
             
-            async def transcribe_async():
-                return await openai_service.transcribe_audio(
-                    audio_content,
-                    audio_filename,
-                    expected_duration=duration
-                )
+                async def transcribe_async():
+                    return await openai_service.transcribe_audio(
+                        transcribe_reader,
+                        audio_filename,
+                        expected_duration=duration
+                    )
 
-            # 并行执行
-            audio_url, transcription = await asyncio.gather(
-                upload_to_s3_async(),
-                transcribe_async()
-            )
+                # 🚀 上传在后台继续，转录完成后立即进入 AI 处理；
+                # TaskGroup 保证任一步失败时上传会被取消，不会在后台空跑
+                async with structured_tasks() as tg:
+                    s3_upload_task = tg.create_task(upload_to_s3_async())
+                    transcription = (await transcribe_async())["text"]
             
-            yield await send_sse_event("progress", {
-                "step": 2,
-                "step_name": "语音转文字",
-                "progress": 50,
-                "message": "语音识别完成"
-            })
+                    emit("progress", {
+                        "step": 2,
+                        "step_name": "语音转文字",
+                        "progress": 50,
+                        "message": "语音识别完成"
+                    })
             
-            # ============================================
-            # Step 4: 验证转录内容
-            # ============================================
-            validate_transcription(transcription, duration)
+                    # ============================================
+                    # Step 4: 验证转录内容
+                    # ============================================
+                    validate_transcription(transcription, duration)
             
-            # ============================================
-            # Step 5: AI处理 - 润色 (70%)
-            # ============================================
-            yield await send_sse_event("progress", {
-                "step": 3,
-                "step_name": "AI润色",
-                "progress": 55,
-                "message": "正在美化文字..."
-            })
-            
-            # 获取用户名字
-            user_display_name = get_display_name(user, request)
+                    # ============================================
+                    # Step 5: AI处理 - 润色 (70%)
+                    # ============================================
+                    emit("progress", {
+                        "step": 3,
+                        "step_name": "AI润色",
+                        "progress": 55,
+                        "message": "正在美化文字..."
+                    })
             
-            ai_result = await openai_service.polish_content_multilingual(
-                transcription, 
-                user_name=user_display_name
-            )
+                    ai_result = await openai_service.polish_content_multilingual(
+                        transcription, 
+                        user_name=ctx.display_name
+                    )
+                    audio_url = await s3_upload_task
             
-            yield await send_sse_event("progress", {
-                "step": 3,
-                "step_name": "AI润色",
-                "progress": 70,
-                "message": "文字润色完成"
-            })
+                emit("progress", {
+                    "step": 3,
+                    "step_name": "AI润色",
+                    "progress": 70,
+                    "message": "文字润色完成"
+                })
             
-            # ============================================
-            # Step 6: 生成标题和反馈 (85% -> 95%)
-            # ============================================
-            yield await send_sse_event("progress", {
-                "step": 4,
-                "step_name": "生成标题",
-                "progress": 85,
-                "message": "正在生成标题..."
-            })
+                # ============================================
+                # Step 6: 生成标题和反馈 (85% -> 95%)
+                # ============================================
+                emit("progress", {
+                    "step": 4,
+                    "step_name": "生成标题",
+                    "progress": 85,
+                    "message": "正在生成标题..."
+                })
             
-            yield await send_sse_event("progress", {
-                "step": 5,
-                "step_name": "生成反馈",
-                "progress": 95,
-                "message": "正在生成AI反馈..."
-            })
+                emit("progress", {
+                    "step": 5,
+                    "step_name": "生成反馈",
+                    "progress": 95,
+                    "message": "正在生成AI反馈..."
+                })
             
-            # ============================================
-            # Step 7: 保存到数据库
-            # ============================================
-            diary_obj = db_service.create_diary(
-                user_id=user['user_id'],
-                original_content=transcription,
-                polished_content=ai_result["polished_content"],
-                ai_feedback=ai_result["feedback"],
-                language=ai_result.get("language", "zh"),
-                title=ai_result["title"],
-                audio_url=audio_url,
-                audio_duration=duration,
-                emotion_data=ai_result.get("emotion_data") # ✅ 传递情感数据
-            )
+                # ============================================
+                # Step 7: 保存到数据库
+                # ============================================
+                diary_obj = await asyncio.to_thread(
+                    db_service.create_diary,
+                    user_id=ctx.user_id,
+                    original_content=transcription,
+                    polished_content=ai_result["polished_content"],
+                    ai_feedback=ai_result["feedback"],
+                    language=ai_result.get("language", "zh"),
+                    title=ai_result["title"],
+                    audio_url=audio_url,
+                    audio_duration=duration,
+                    emotion_data=ai_result.get("emotion_data") # ✅ 传递情感数据
+                )
             
-            # ============================================
-            # Step 8: 推送最终结果
-            # ============================================
-            yield await send_sse_event("progress", {
-                "step": 5,
-                "step_name": "完成",
-                "progress": 100,
-                "message": "处理完成"
-            })
+                # ============================================
+                # Step 8: 推送最终结果
+                # ============================================
+                emit("progress", {
+                    "step": 5,
+                    "step_name": "完成",
+                    "progress": 100,
+                    "message": "处理完成"
+                })
             
-            # 推送最终结果
-            yield await send_sse_event("complete", {
-                "diary": diary_obj,
-                "progress": 100
-            })
+                # 推送最终结果
+                emit("complete", {
+                    "diary": diary_obj,
+                    "progress": 100
+                })
             
-        except HTTPException as e:
-            # HTTP异常（如验证失败）
-            error_data = {
-                "error": e.detail,
-                "status_code": e.status_code
-            }
-            yield await send_sse_event("error", error_data)
-        except Exception as e:
-            # 其他异常
-            print(f"❌ 流式处理失败: {str(e)}")
-            import traceback
-            traceback.print_exc()
-            error_data = {
-                "error": f"处理语音失败: {str(e)}",
-                "status_code": 500
-            }
-            yield await send_sse_event("error", error_data)
+            except HTTPException as e:
+                # HTTP异常（如验证失败）
+                error_data = {
+                    "error": e.detail,
+                    "status_code": e.status_code
+                }
+                emit("error", error_data)
+            except Exception as e:
+                # 其他异常
+                logger.exception("❌ 流式处理失败: %s", str(e))
+                error_data = {
+                    "error": f"处理语音失败: {str(e)}",
+                    "status_code": 500
+                }
+                emit("error", error_data)
+            finally:
+                events.put_nowait(None)
+
+        pipeline = asyncio.create_task(run_pipeline())
+        try:
+            while (event := await events.get()) is not None:
+                yield event
+        finally:
+            # 客户端断开时取消处理流程，避免继续消耗转录和 AI 调用
+            if not pipeline.done():
+                pipeline.cancel()
+            transcribe_reader.close()
+    
+    def close_readers() -> None:
+        upload_reader.close()
+        transcribe_reader.close()
     
     # 返回流式响应
     return StreamingResponse(
         process_and_stream(),
         media_type="text/event-stream",
-        headers={
-            "Cache-Control": "no-cache",
-            "Connection": "keep-alive",
-            "X-Accel-Buffering": "no"  # 禁用nginx缓冲
-        }
+        headers=_SSE_HEADERS,
+        background=BackgroundTask(close_readers)
     )
 
 
@@ -1403,6 +1670,7 @@ async def create_voice_diary_async(
     content: Optional[str] = Form(None),  # ✅ 新增：用户手动输入的文字内容
     expect_images: bool = Form(False),  # ✅ 是否后续补充图片URL（并行上传场景）
     user: Dict = Depends(get_current_user),
+    user_lang: str = Depends(user_language_dep),
     request: Request = None
 ):
     """
@@ -1425,26 +1693,27 @@ async def create_voice_diary_async(
         if not audio.content_type.startswith("audio/"):
             raise HTTPException(status_code=400, detail="请上传音频文件")
         
-        # 读取音频内容
-        audio_content = await audio.read()
+        # 🔥 不读入内存：打开上传临时文件的独立句柄交给后台任务（请求结束后 UploadFile 关闭也不影响）
         audio_filename = audio.filename or "recording.m4a"
         audio_content_type = audio.content_type or "audio/m4a"
         
+        # 🔥 请求上下文只计算一次，后台任务直接使用
+        ctx = build_user_context(user, request, user_lang)
+        
         # 验证音频质量
-        user_lang = get_user_language(request)
-        validate_audio_quality(duration, len(audio_content), language=user_lang)
+        audio_size = audio.size if audio.size is not None else upload_source_size(audio.file)
+        validate_audio_quality(duration, audio_size, language=ctx.lang)
         
         # ✅ 解析图片URL列表（如果有）
         parsed_image_urls = None
         if image_urls:
             try:
-                import json
-                parsed_image_urls = json.loads(image_urls)
+                parsed_image_urls = orjson.loads(image_urls)
                 if not isinstance(parsed_image_urls, list):
                     parsed_image_urls = None
-                print(f"📸 图片+语音模式，图片数量: {len(parsed_image_urls) if parsed_image_urls else 0}")
+                logger.debug("📸 图片+语音模式，图片数量: %s", len(parsed_image_urls) if parsed_image_urls else 0)
             except Exception as e:
-                print(f"⚠️ 解析图片URL失败: {e}")
+                logger.warning("⚠️ 解析图片URL失败: %s", e)
                 parsed_image_urls = None
         
         # 生成任务ID
@@ -1453,23 +1722,28 @@ async def create_voice_diary_async(
         # ✅ 优化：初始化任务进度时立即设置为5%，避免前端长时间停留在0%
         pending_image_upload = bool(expect_images) and not parsed_image_urls
         # 初始化进度
-        task_data = {
-            "status": "processing",
-            "progress": 5,
-            "step": 0,
-            "step_name": "初始化",
-            "message": "任务已接收，开始处理...",
-            "user_id": user['user_id'],
-            "image_urls": parsed_image_urls,
-            "pending_image_upload": pending_image_upload,
-            "created_at": datetime.now(timezone.utc).isoformat(), # 存储为 ISO 格式
-            "updated_at": datetime.now(timezone.utc).isoformat(), # 存储为 ISO 格式
-            "start_time": time.time(),
-            "user_name": get_display_name(user, request) # 保存用户名到任务中
-        }
-        db_service.save_task_progress(task_id, task_data, user_id=user['user_id'])
-        # 同时更新内存缓存
-        task_progress[task_id] = task_data
+        now = datetime.now(timezone.utc)  # created_at / updated_at / start_time 共用同一个时间点
+        now_iso = now.isoformat()
+        task_data = TaskProgress(
+            status="processing",
+            progress=5,
+            step=0,
+            step_name="初始化",
+            message="任务已接收，开始处理...",
+            user_id=ctx.user_id,
+            image_urls=parsed_image_urls,
+            pending_image_upload=pending_image_upload,
+            created_at=now_iso, # 存储为 ISO 格式
+            updated_at=now_iso, # 存储为 ISO 格式
+            start_time=now.timestamp(),
+            user_name=ctx.display_name # 保存用户名到任务中
+        ).to_dict()
+        await register_new_task(task_id, task_data, ctx.user_id)
+        if pending_image_upload:
+            pending_image_events[task_id] = asyncio.Event()
+        
+        # 句柄在交给后台任务之前才打开，之前的步骤失败时不会泄漏；后台任务结束时负责关闭
+        audio_content = open_independent_reader(audio)
         
         # 启动后台异步任务（根据是否有图片选择处理函数）
         has_images = parsed_image_urls and len(parsed_image_urls) > 0
@@ -1479,8 +1753,8 @@ async def create_voice_diary_async(
         # ✅ 关键修复：如果有图片、文字内容，或者正在等待图片上传，都使用完整处理流程
         if has_images or has_text_content or pending_images:
             # 混合媒体模式：使用完整处理流程（支持等待图片上传）
-            print(f"📸 混合媒体模式 - 图片: {len(parsed_image_urls) if parsed_image_urls else 0}, 文字: {bool(has_text_content)}, 等待图片: {pending_images}")
-            asyncio.create_task(
+            logger.debug("📸 混合媒体模式 - 图片: %s, 文字: %s, 等待图片: %s", len(parsed_image_urls) if parsed_image_urls else 0, bool(has_text_content), pending_images)
+            spawn_background(
                 process_voice_diary_async(
                     task_id=task_id,
                     audio_content=audio_content,
@@ -1488,15 +1762,15 @@ async def create_voice_diary_async(
                     audio_content_type=audio_content_type,
                     duration=duration,
                     user=user,
-                    request=request,
+                    ctx=ctx,
                     image_urls=parsed_image_urls,  # 可能为 None，后续会通过 add_images_to_task 补充
                     content=content
                 )
             )
         else:
             # 纯语音模式：使用快速通道 ⚡
-            print(f"🎤 纯语音模式 - 使用快速通道")
-            asyncio.create_task(
+            logger.debug("🎤 纯语音模式 - 使用快速通道")
+            spawn_background(
                 process_pure_voice_diary_async(
                     task_id=task_id,
                     audio_content=audio_content,
@@ -1504,11 +1778,11 @@ async def create_voice_diary_async(
                     audio_content_type=audio_content_type,
                     duration=duration,
                     user=user,
-                    request=request
+                    ctx=ctx
                 )
             )
         
-        print(f"✅ 任务已创建: {task_id}")
+        logger.info("✅ 任务已创建: %s", task_id)
         
         return {
             "task_id": task_id,
@@ -1519,9 +1793,7 @@ async def create_voice_diary_async(
     except HTTPException:
         raise
     except Exception as e:
-        print(f"❌ 创建任务失败: {str(e)}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("❌ 创建任务失败: %s", str(e))
         raise HTTPException(status_code=500, detail=f"创建任务失败: {str(e)}")
 
 
@@ -1536,6 +1808,7 @@ async def create_voice_diary_async_with_url(
     content: Optional[str] = Form(None),
     expect_images: bool = Form(False),
     user: Dict = Depends(get_current_user),
+    user_lang: str = Depends(user_language_dep),
     request: Request = None
 ):
     """
@@ -1574,24 +1847,24 @@ async def create_voice_diary_async_with_url(
     """
     try:
         # 验证audio_url
-        print("🚀 [Task] create_voice_diary_async_with_url hit", flush=True)
+        logger.debug("🚀 [Task] create_voice_diary_async_with_url hit")
         if not audio_url or not audio_url.startswith("https://"):
             raise HTTPException(status_code=400, detail="无效的音频URL")
         
-        print(f"🎤 优化版语音日记创建 - 使用已上传URL: {audio_url}")
-        print(f"   时长: {duration}秒")
+        logger.debug("🎤 优化版语音日记创建 - 使用已上传URL: %s", audio_url)
+        logger.debug("   时长: %s秒", duration)
+        ctx = build_user_context(user, request, user_lang)
         
         # 解析图片URL列表(如果有)
         parsed_image_urls = None
         if image_urls:
             try:
-                import json
-                parsed_image_urls = json.loads(image_urls)
+                parsed_image_urls = orjson.loads(image_urls)
                 if not isinstance(parsed_image_urls, list):
                     parsed_image_urls = None
-                print(f"📸 图片+语音模式,图片数量: {len(parsed_image_urls) if parsed_image_urls else 0}")
+                logger.debug("📸 图片+语音模式,图片数量: %s", len(parsed_image_urls) if parsed_image_urls else 0)
             except Exception as e:
-                print(f"⚠️ 解析图片URL失败: {e}")
+                logger.warning("⚠️ 解析图片URL失败: %s", e)
                 parsed_image_urls = None
         
         # 生成任务ID
@@ -1599,35 +1872,37 @@ async def create_voice_diary_async_with_url(
         
         # 初始化任务进度
         pending_image_upload = bool(expect_images) and not parsed_image_urls
-        task_data = {
-            "status": "processing",
-            "progress": 15,  # ✅ 音频已上传,直接从10%开始
-            "step": 1,
-            "step_name": "音频已上传",
-            "message": "音频上传完成,开始AI处理...",
-            "user_id": user['user_id'],
-            "image_urls": parsed_image_urls,
-            "pending_image_upload": pending_image_upload,
-            "created_at": datetime.now(timezone.utc).isoformat(),
-            "updated_at": datetime.now(timezone.utc).isoformat(),
-            "start_time": time.time(),
-            "user_name": get_display_name(user, request),
-            "audio_url": audio_url  # ✅ 保存音频URL
-        }
-        db_service.save_task_progress(task_id, task_data, user_id=user['user_id'])
-        task_progress[task_id] = task_data
+        now = datetime.now(timezone.utc)  # created_at / updated_at / start_time 共用同一个时间点
+        now_iso = now.isoformat()
+        task_data = TaskProgress(
+            status="processing",
+            progress=15,  # ✅ 音频已上传,直接从10%开始
+            step=1,
+            step_name="音频已上传",
+            message="音频上传完成,开始AI处理...",
+            user_id=ctx.user_id,
+            image_urls=parsed_image_urls,
+            pending_image_upload=pending_image_upload,
+            created_at=now_iso,
+            updated_at=now_iso,
+            start_time=now.timestamp(),
+            user_name=ctx.display_name,
+            audio_url=audio_url  # ✅ 保存音频URL
+        ).to_dict()
+        await register_new_task(task_id, task_data, ctx.user_id)
+        if pending_image_upload:
+            pending_image_events[task_id] = asyncio.Event()
         
         # ✅ 如果前端提供音频内容，优先使用（避免二次下载）
         audio_content = None
         if audio_content_base64:
             try:
-                import base64
-                audio_content = base64.b64decode(audio_content_base64)
-                print(f"✅ 使用直传音频内容，大小: {len(audio_content) / 1024:.1f} KB")
-                user_lang = get_user_language(request)
-                validate_audio_quality(duration, len(audio_content), language=user_lang)
+                # 🔥 几 MB 的 base64 解码是纯 CPU 工作，放到线程池，不阻塞其他 SSE / 轮询请求
+                audio_content = await asyncio.to_thread(base64.b64decode, audio_content_base64)
+                logger.info("✅ 使用直传音频内容，大小: %.1f KB", len(audio_content) / 1024)
+                validate_audio_quality(duration, len(audio_content), language=ctx.lang)
             except Exception as e:
-                print(f"⚠️ 解析 audio_content_base64 失败，将降级为URL下载: {type(e).__name__}: {e}")
+                logger.warning("⚠️ 解析 audio_content_base64 失败，将降级为URL下载: %s: %s", type(e).__name__, e)
                 audio_content = None
 
         # 启动后台异步任务
@@ -1637,9 +1912,9 @@ async def create_voice_diary_async_with_url(
         
         if has_images or has_text_content or pending_images:
             # 混合媒体模式
-            print(f"📸 混合媒体模式 - 图片: {len(parsed_image_urls) if parsed_image_urls else 0}, 文字: {bool(has_text_content)}, 等待图片: {pending_images}")
+            logger.debug("📸 混合媒体模式 - 图片: %s, 文字: %s, 等待图片: %s", len(parsed_image_urls) if parsed_image_urls else 0, bool(has_text_content), pending_images)
             if audio_content:
-                asyncio.create_task(
+                spawn_background(
                     process_voice_diary_async(
                         task_id=task_id,
                         audio_content=audio_content,
@@ -1647,29 +1922,29 @@ async def create_voice_diary_async_with_url(
                         audio_content_type=audio_content_type or "audio/m4a",
                         duration=duration,
                         user=user,
-                        request=request,
+                        ctx=ctx,
                         image_urls=parsed_image_urls,
                         content=content,
                         audio_url=audio_url
                     )
                 )
             else:
-                asyncio.create_task(
+                spawn_background(
                     process_voice_diary_with_url_async(
                         task_id=task_id,
                         audio_url=audio_url,
                         duration=duration,
                         user=user,
-                        request=request,
+                        ctx=ctx,
                         image_urls=parsed_image_urls,
                         content=content
                     )
                 )
         else:
             # 纯语音模式
-            print(f"🎤 纯语音模式 - 使用快速通道")
+            logger.debug("🎤 纯语音模式 - 使用快速通道")
             if audio_content:
-                asyncio.create_task(
+                spawn_background(
                     process_pure_voice_diary_async(
                         task_id=task_id,
                         audio_content=audio_content,
@@ -1677,22 +1952,22 @@ async def create_voice_diary_async_with_url(
                         audio_content_type=audio_content_type or "audio/m4a",
                         duration=duration,
                         user=user,
-                        request=request,
+                        ctx=ctx,
                         audio_url=audio_url
                     )
                 )
             else:
-                asyncio.create_task(
+                spawn_background(
                     process_pure_voice_diary_with_url_async(
                         task_id=task_id,
                         audio_url=audio_url,
                         duration=duration,
                         user=user,
-                        request=request
+                        ctx=ctx
                     )
                 )
         
-        print(f"✅ 优化版任务已创建: {task_id}")
+        logger.info("✅ 优化版任务已创建: %s", task_id)
         
         return {
             "task_id": task_id,
@@ -1703,9 +1978,7 @@ async def create_voice_diary_async_with_url(
     except HTTPException:
         raise
     except Exception as e:
-        print(f"❌ 创建优化版任务失败: {str(e)}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("❌ 创建优化版任务失败: %s", str(e))
         raise HTTPException(status_code=500, detail=f"创建任务失败: {str(e)}")
 
 
@@ -1740,11 +2013,11 @@ async def get_voice_diary_progress(
     - 这样可以让前端看到 60%→88% 的平滑虚拟进度
     """
     # ✅ 优先从内存缓存读取（实时性更好，能看到虚拟进度更新）
-    task_data = task_progress.get(task_id)
+    task_data = get_cached_task(task_id)
     
     # 如果内存缓存中没有，再从 DynamoDB 获取（任务可能已完成并从内存中清理）
     if not task_data:
-        task_data = db_service.get_task_progress(task_id, user_id=user['user_id'])
+        task_data = await asyncio.to_thread(db_service.get_task_progress, task_id, user_id=user['user_id'])
     
     if not task_data:
         raise HTTPException(status_code=404, detail="任务不存在或已过期")
@@ -1785,15 +2058,13 @@ async def add_images_to_task(
         image_urls: 图片URL列表
         user: 当前用户
     """
-    # 1. 优先从 DynamoDB 获取
-    task_data = db_service.get_task_progress(task_id, user_id=user['user_id'])
-    
-    # 2. 如果不存在，检查内存缓存（考虑刚创建还未写入 DB 的极端情况）
-    if not task_data:
-        task_data = task_progress.get(task_id)
+    # 1. 优先读内存缓存：处理任务的协程在本实例时，缓存比合并写入的 DynamoDB 记录更新，
+    #    避免用滞后的记录整条覆盖最新进度
+    # 2. 缓存未命中（任务在其他实例处理）再读 DynamoDB
+    task_data = get_cached_task(task_id) or await asyncio.to_thread(db_service.get_task_progress, task_id, user_id=user['user_id'])
         
     if not task_data:
-        print(f"❌ 任务不存在: {task_id}")
+        logger.error("❌ 任务不存在: %s", task_id)
         raise HTTPException(status_code=404, detail="任务不存在或已过期")
     
     # 检查任务是否属于当前用户
@@ -1804,13 +2075,17 @@ async def add_images_to_task(
     task_data["image_urls"] = image_urls if image_urls else []
     task_data["pending_image_upload"] = False
     
-    # 保存更新后的任务数据到 DynamoDB
-    db_service.save_task_progress(task_id, task_data, user_id=user['user_id'])
+    # 保存更新后的任务数据到 DynamoDB（写快照副本；任务已进入终态时由条件写入拦截）
+    await asyncio.to_thread(db_service.save_task_progress, task_id, dict(task_data), user_id=user['user_id'])
     # 同时更新内存缓存
-    task_progress[task_id] = task_data
+    cache_task(task_id, task_data)
+    # 唤醒同实例内正在等待图片的处理协程
+    image_event = pending_image_events.get(task_id)
+    if image_event is not None:
+        image_event.set()
     
-    print(f"✅ 任务 {task_id} 已补充图片URL，共 {len(image_urls)} 张")
-    print(f"📸 图片URLs: {image_urls}")
+    logger.info("✅ 任务 %s 已补充图片URL，共 %s 张", task_id, len(image_urls))
+    logger.debug("📸 图片URLs: %s", image_urls)
     
     return {
         "success": True,
@@ -1821,8 +2096,7 @@ async def add_images_to_task(
 
 @router.post("/audio/presigned-url", summary="✅ 获取音频直传预签名URL (优化上传速度)")
 async def get_audio_presigned_url(
-    file_name: str = Form("recording.m4a"),
-    content_type: str = Form("audio/m4a"),
+    presign: Annotated[AudioPresignRequest, Form()],
     user: Dict = Depends(get_current_user)
 ):
     """
@@ -1852,8 +2126,7 @@ async def get_audio_presigned_url(
     3. 上传完成后,使用final_url创建语音日记任务
     
     Args:
-        file_name: 音频文件名 (默认: recording.m4a)
-        content_type: 文件MIME类型 (默认: audio/m4a)
+        presign: 表单字段 file_name / content_type，content_type 已由模型校验为 audio/*
         user: 当前认证用户
     
     Returns:
@@ -1864,32 +2137,23 @@ async def get_audio_presigned_url(
         }
     """
     try:
-        print(f"🎤 生成音频预签名URL: {file_name}, type: {content_type}")
-        
-        # 验证content_type
-        if not content_type.startswith("audio/"):
-            raise HTTPException(
-                status_code=400,
-                detail=f"Invalid content type: {content_type}. Must be audio/*"
-            )
+        logger.debug("🎤 生成音频预签名URL: %s, type: %s", presign.file_name, presign.content_type)
         
         # 生成预签名URL (1小时过期)
         presigned_data = s3_service.generate_audio_presigned_url(
-            file_name=file_name,
-            content_type=content_type,
+            file_name=presign.file_name,
+            content_type=presign.content_type,
             expiration=3600  # 1小时
         )
         
-        print(f"✅ 音频预签名URL生成成功: {presigned_data['s3_key']}")
+        logger.info("✅ 音频预签名URL生成成功: %s", presigned_data['s3_key'])
         
         return presigned_data
         
     except HTTPException:
         raise
     except Exception as e:
-        print(f"❌ 生成音频预签名URL失败: {str(e)}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("❌ 生成音频预签名URL失败: %s", str(e))
         raise HTTPException(
             status_code=500,
             detail=f"生成预签名URL失败: {str(e)}"
@@ -1927,7 +2191,7 @@ async def create_chunk_session(
         会话信息
     """
     try:
-        print(f"📦 创建分块上传会话: session_id={session_id}, user={user['user_id']}")
+        logger.debug("📦 创建分块上传会话: session_id=%s, user=%s", session_id, user['user_id'])
         
         session_info = s3_service.create_chunk_session(session_id)
         
@@ -1937,7 +2201,7 @@ async def create_chunk_session(
         }
         
     except Exception as e:
-        print(f"❌ 创建分块会话失败: {str(e)}")
+        logger.error("❌ 创建分块会话失败: %s", str(e))
         raise HTTPException(status_code=500, detail=f"CREATE_SESSION_FAILED")
 
 
@@ -1963,7 +2227,7 @@ async def get_chunk_presigned_url(
         预签名 URL 信息
     """
     try:
-        print(f"📤 获取 chunk 预签名 URL: session={session_id}, index={chunk_index}")
+        logger.debug("📤 获取 chunk 预签名 URL: session=%s, index=%s", session_id, chunk_index)
         
         presigned_data = s3_service.generate_chunk_presigned_url(
             session_id=session_id,
@@ -1974,11 +2238,62 @@ async def get_chunk_presigned_url(
         return presigned_data
         
     except Exception as e:
-        print(f"❌ 获取 chunk 预签名 URL 失败: {str(e)}")
+        logger.error("❌ 获取 chunk 预签名 URL 失败: %s", str(e))
         raise HTTPException(status_code=500, detail=f"GET_CHUNK_URL_FAILED")
 
 
-@router.post("/audio/chunk-complete", summary="完成分块上传并创建日记任务")
+MAX_CHUNK_URLS_PER_REQUEST = 60
+
+
+@router.post("/audio/chunk-presigned-urls", summary="批量获取 chunk 的预签名 URL")
+async def get_chunk_presigned_urls(
+    session_id: str = Form(...),
+    start_index: int = Form(0),
+    count: int = Form(...),
+    content_type: str = Form("audio/m4a"),
+    user: Dict = Depends(get_current_user)
+):
+    """
+    批量获取连续 chunk 的预签名 URL
+    
+    🚀 前端上传前一次拿到所有 chunk 的上传地址，省去每个 chunk 一次的
+    鉴权 + 签名 + HTTP 往返；单个 URL 接口仍保留，用于重试时重新签名
+    
+    Args:
+        session_id: 会话 ID
+        start_index: 起始分块索引
+        count: 分块数量（1-60）
+        content_type: 文件类型
+        user: 当前认证用户
+    
+    Returns:
+        {"presigned_urls": [...], "count": N}，顺序与 chunk_index 一致
+    """
+    if start_index < 0 or not 1 <= count <= MAX_CHUNK_URLS_PER_REQUEST:
+        raise HTTPException(
+            status_code=400,
+            detail=f"start_index 不能为负，count 需在 1-{MAX_CHUNK_URLS_PER_REQUEST} 之间"
+        )
+    try:
+        logger.debug("📤 批量获取 chunk 预签名 URL: session=%s, start=%s, count=%s", session_id, start_index, count)
+        presigned_urls = await asyncio.to_thread(
+            s3_service.generate_chunk_presigned_urls,
+            session_id,
+            start_index,
+            count,
+            content_type
+        )
+        return {
+            "presigned_urls": presigned_urls,
+            "count": len(presigned_urls)
+        }
+        
+    except Exception as e:
+        logger.error("❌ 批量获取 chunk 预签名 URL 失败: %s", str(e))
+        raise HTTPException(status_code=500, detail="GET_CHUNK_URLS_FAILED")
+
+
+@router.post("/audio/chunk-complete", status_code=202, summary="完成分块上传并创建日记任务")
 async def complete_chunk_upload(
     session_id: str = Form(...),
     chunk_count: int = Form(...),
@@ -1987,6 +2302,7 @@ async def complete_chunk_upload(
     image_urls: str = Form(None),
     expect_images: bool = Form(False),
     user: Dict = Depends(get_current_user),
+    user_lang: str = Depends(user_language_dep),
     request: Request = None,
     x_user_name: Optional[str] = Header(None, alias="X-User-Name")
 ):
@@ -1994,9 +2310,9 @@ async def complete_chunk_upload(
     ✅ Phase 2: 完成分块上传，合并音频并创建日记处理任务
     
     录音结束后调用此 API:
-    1. 合并所有已上传的 chunks
-    2. 创建语音日记处理任务
-    3. 返回 task_id 用于轮询进度
+    1. 创建语音日记处理任务
+    2. 立即返回 task_id（202）用于轮询进度
+    3. 后台合并所有已上传的 chunks，再进入 AI 处理流程
     
     Args:
         session_id: 会话 ID
@@ -2014,58 +2330,54 @@ async def complete_chunk_upload(
     """
     try:
         total_start = time.perf_counter()
-        print(f"🔀 [ChunkComplete] 开始处理: session={session_id}, chunks={chunk_count}, duration={duration}s")
-        print(f"   - user_id: {user.get('user_id')}")
-        print(f"   - x_user_name: {x_user_name}")
-        print(f"   - content: {content[:50] if content and len(content) > 0 else 'None'}...")
-        print(f"   - image_urls: {image_urls}")
-        print(f"   - expect_images: {expect_images}")
-        
-        # Step 1: 合并 chunks
-        print(f"📦 [ChunkComplete] Step 1: 合并 chunks...")
-        merge_start = time.perf_counter()
-        merged_audio_url = s3_service.merge_chunks(
-            session_id=session_id,
-            chunk_count=chunk_count,
-            output_filename="recording.m4a"
+        logger.debug(
+            "🔀 [ChunkComplete] 开始处理: session=%s, chunks=%s, duration=%ss, user_id=%s, x_user_name=%s, "
+            "has_text=%s, image_urls=%s, expect_images=%s",
+            session_id, chunk_count, duration, user.get('user_id'), x_user_name,
+            bool(content), image_urls, expect_images
         )
-        _log_timing("合并 chunks 完成", merge_start)
-        print(f"✅ [ChunkComplete] 音频合并完成: {merged_audio_url}")
+        
+        # Step 1: 校验（合并本身放到后台任务里执行，不阻塞客户端拿到 task_id）
+        if chunk_count < 1:
+            raise ValueError("No chunks to merge")
         
         # Step 2: 创建任务 ID
         task_id = str(uuid.uuid4())
-        print(f"📋 [ChunkComplete] Step 2: 创建任务 ID: {task_id}")
+        logger.debug("📋 [ChunkComplete] Step 2: 创建任务 ID: %s", task_id)
+        ctx = build_user_context(user, request, user_lang)
         
         # Step 3: 解析 image_urls
         parsed_image_urls = None
         if image_urls:
             try:
-                parsed_image_urls = json.loads(image_urls)
-                print(f"📸 [ChunkComplete] Step 3: 解析到 {len(parsed_image_urls) if parsed_image_urls else 0} 张图片")
+                parsed_image_urls = orjson.loads(image_urls)
+                logger.debug("📸 [ChunkComplete] Step 3: 解析到 %s 张图片", len(parsed_image_urls) if parsed_image_urls else 0)
             except Exception as parse_err:
-                print(f"⚠️ [ChunkComplete] 解析 image_urls 失败: {parse_err}")
+                logger.warning("⚠️ [ChunkComplete] 解析 image_urls 失败: %s", parse_err)
                 parsed_image_urls = None
         
         # Step 4: 初始化任务进度
-        print(f"📊 [ChunkComplete] Step 4: 初始化任务进度...")
+        logger.debug("📊 [ChunkComplete] Step 4: 初始化任务进度...")
         pending_image_upload = bool(expect_images) and not parsed_image_urls
-        task_data = {
-            "status": "processing",
-            "progress": 15,  # 合并完成，进度 15%
-            "step": 1,
-            "step_name": "音频已准备",
-            "message": "音频已准备就绪，开始处理...",
-            "user_id": user['user_id'],
-            "image_urls": parsed_image_urls,
-            "pending_image_upload": pending_image_upload,
-            "created_at": datetime.now(timezone.utc).isoformat(),
-            "updated_at": datetime.now(timezone.utc).isoformat(),
-            "start_time": time.time(),
-            "user_name": x_user_name or get_display_name(user, request),
-            "audio_url": merged_audio_url
-        }
-        db_service.save_task_progress(task_id, task_data, user_id=user['user_id'])
-        task_progress[task_id] = task_data
+        now = datetime.now(timezone.utc)  # created_at / updated_at / start_time 共用同一个时间点
+        now_iso = now.isoformat()
+        task_data = TaskProgress(
+            status="processing",
+            progress=5,  # 后台合并中，合并完成后进入 15%
+            step=0,
+            step_name="合并音频",
+            message="正在合并音频...",
+            user_id=ctx.user_id,
+            image_urls=parsed_image_urls,
+            pending_image_upload=pending_image_upload,
+            created_at=now_iso,
+            updated_at=now_iso,
+            start_time=now.timestamp(),
+            user_name=x_user_name or ctx.display_name
+        ).to_dict()
+        await register_new_task(task_id, task_data, ctx.user_id)
+        if pending_image_upload:
+            pending_image_events[task_id] = asyncio.Event()
         
         # Step 5: 启动后台处理任务
         # ✅ 关键修复: 根据是否有图片/文字选择正确的处理函数
@@ -2073,60 +2385,49 @@ async def complete_chunk_upload(
         has_text_content = content and content.strip()
         pending_images = pending_image_upload
         
-        print(f"🔍 [ChunkComplete] Step 5: 选择处理函数...")
-        print(f"   - has_images: {has_images}")
-        print(f"   - has_text_content: {has_text_content}")
-        print(f"   - pending_images: {pending_images}")
+        logger.debug(
+            "🔍 [ChunkComplete] Step 5: 选择处理函数 - has_images=%s, has_text_content=%s, pending_images=%s",
+            has_images, bool(has_text_content), pending_images
+        )
         
-        if has_images or has_text_content or pending_images:
-            # 混合媒体模式：使用完整处理流程
-            print(f"📸 [ChunkComplete] 使用混合媒体处理流程 (process_voice_diary_with_url_async)")
-            asyncio.create_task(
-                process_voice_diary_with_url_async(
-                    task_id=task_id,
-                    audio_url=merged_audio_url,
-                    duration=int(duration),
-                    user=user,
-                    request=request,
-                    image_urls=parsed_image_urls,
-                    content=content
-                )
-            )
-        else:
-            # 纯语音模式：使用快速通道
-            print(f"🎤 [ChunkComplete] 使用纯语音快速通道 (process_pure_voice_diary_with_url_async)")
-            asyncio.create_task(
-                process_pure_voice_diary_with_url_async(
-                    task_id=task_id,
-                    audio_url=merged_audio_url,
-                    duration=int(duration),
-                    user=user,
-                    request=request
-                )
-            )
+        pure_voice = not (has_images or has_text_content or pending_images)
+        logger.debug(
+            "🎬 [ChunkComplete] 使用%s处理流程，合并在后台执行",
+            "纯语音快速通道" if pure_voice else "混合媒体"
+        )
+        spawn_background(
+            process_chunked_upload_async(
+                task_id=task_id,
+                session_id=session_id,
+                chunk_count=chunk_count,
+                duration=int(duration),
+                user=user,
+                ctx=ctx,
+                image_urls=parsed_image_urls,
+                content=content,
+                pure_voice=pure_voice
+            ),
+            name=f"chunk-complete-{task_id}"
+        )
         
-        print(f"✅ [ChunkComplete] 分块上传任务创建成功: task_id={task_id}")
+        logger.info("✅ [ChunkComplete] 分块上传任务创建成功: task_id=%s", task_id)
         _log_timing("分块合并入口完成", total_start)
         
         return {
             "task_id": task_id,
             "status": "processing",
-            "message": "Audio merged, processing started",
-            "audio_url": merged_audio_url
+            "message": "Upload received, merging and processing in background",
+            "audio_url": None  # 合并在后台完成，最终音频地址随日记结果返回
         }
         
     except ValueError as e:
         error_str = str(e)
-        print(f"❌ [ChunkComplete] ValueError: {error_str}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("❌ [ChunkComplete] ValueError: %s", error_str)
         if error_str.startswith("TRANSCRIPTION_") or error_str == "No chunks to merge":
             raise HTTPException(status_code=400, detail=error_str)
         raise HTTPException(status_code=500, detail="CHUNK_MERGE_FAILED")
     except Exception as e:
-        print(f"❌ [ChunkComplete] Exception: {str(e)}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("❌ [ChunkComplete] Exception: %s", str(e))
         raise HTTPException(status_code=500, detail="CHUNK_COMPLETE_FAILED")
 
 
@@ -2184,21 +2485,14 @@ async def get_presigned_urls(
                 detail="content_types length must match file_names length"
             )
         
-        print(f"📸 Generating {len(file_names)} presigned URL(s)...")
+        logger.debug("📸 Generating %s presigned URL(s)...", len(file_names))
         
-        presigned_urls = []
-        for idx, file_name in enumerate(file_names, 1):
-            content_type = content_types[idx - 1] or "image/jpeg"
-            
-            presigned_data = s3_service.generate_presigned_url(
-                file_name=file_name,
-                content_type=content_type
-            )
-            
-            presigned_urls.append(presigned_data)
-            print(f"  ✅ Generated presigned URL {idx}/{len(file_names)}: {presigned_data['s3_key']}")
+        # 🚀 签名是同步的 boto3 CPU 工作：整批放到一个线程里完成，不阻塞事件循环
+        presigned_urls = await asyncio.to_thread(
+            s3_service.generate_presigned_urls, file_names, content_types
+        )
         
-        print(f"✅ All {len(presigned_urls)} presigned URLs generated")
+        logger.info("✅ All %s presigned URLs generated", len(presigned_urls))
         
         return {
             "presigned_urls": presigned_urls,
@@ -2208,14 +2502,16 @@ async def get_presigned_urls(
     except HTTPException:
         raise
     except Exception as e:
-        print(f"❌ Failed to generate presigned URLs: {str(e)}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("❌ Failed to generate presigned URLs: %s", str(e))
         raise HTTPException(
             status_code=500,
             detail=f"Failed to generate presigned URLs: {str(e)}"
         )
 
+# 图片上传：单张上限 10MB，同一请求最多 4 张同时上传
+MAX_IMAGE_BYTES = 10 * 1024 * 1024
+IMAGE_UPLOAD_CONCURRENCY = 4
+
 @router.post("/images", summary="Upload images for diary")
 async def upload_diary_images(
     images: List[UploadFile] = File(...),
@@ -2250,45 +2546,50 @@ async def upload_diary_images(
                 detail="No images provided"
             )
         
-        print(f"📸 Uploading {len(images)} image(s)...")
+        logger.debug("📸 Uploading %s image(s)...", len(images))
         
-        uploaded_urls = []
-        
-        # Step 2: Upload each image
+        # Step 2: Validate every file before any upload starts (rejected files never take a thread)
         for idx, image in enumerate(images, 1):
-            # Validate image file type
             if not image.content_type or not image.content_type.startswith("image/"):
                 raise HTTPException(
                     status_code=400,
                     detail=f"File {idx} is not an image: {image.filename}"
                 )
-            
-            # Read image content
-            image_content = await image.read()
-            
-            # Validate image size (max 10MB per image)
-            image_size_mb = len(image_content) / (1024 * 1024)
-            if image_size_mb > 10:
+            if image.size is not None and image.size > MAX_IMAGE_BYTES:
                 raise HTTPException(
                     status_code=400,
-                    detail=f"Image {idx} too large ({image_size_mb:.1f}MB). Maximum size is 10MB per image"
+                    detail=f"Image {idx} too large ({image.size / (1024 * 1024):.1f}MB). Maximum size is 10MB per image"
+                )
+        
+        # Step 3: Upload concurrently, streaming each spooled upload file to S3 (never read into bytes);
+        # the semaphore bounds how many upload threads one request occupies
+        semaphore = asyncio.Semaphore(IMAGE_UPLOAD_CONCURRENCY)
+        
+        async def upload_one(idx: int, image: UploadFile) -> str:
+            async with semaphore:
+                image_size = image.size if image.size is not None else upload_source_size(image.file)
+                image_size_mb = image_size / (1024 * 1024)
+                if image_size > MAX_IMAGE_BYTES:
+                    raise HTTPException(
+                        status_code=400,
+                        detail=f"Image {idx} too large ({image_size_mb:.1f}MB). Maximum size is 10MB per image"
+                    )
+                logger.debug("  📤 Uploading image %s/%s: %s, size: %.2fMB", idx, len(images), image.filename, image_size_mb)
+                image.file.seek(0)
+                return await asyncio.to_thread(
+                    s3_service.upload_image,
+                    file_content=image.file,
+                    file_name=image.filename or f"photo{idx}.jpg",
+                    content_type=image.content_type or "image/jpeg"
                 )
-            
-            print(f"  📤 Uploading image {idx}/{len(images)}: {image.filename}, size: {image_size_mb:.2f}MB")
-            
-            # Upload to S3
-            image_url = s3_service.upload_image(
-                file_content=image_content,
-                file_name=image.filename or f"photo{idx}.jpg",
-                content_type=image.content_type or "image/jpeg"
-            )
-            
-            uploaded_urls.append(image_url)
-            print(f"  ✅ Image {idx} uploaded: {image_url}")
         
-        print(f"✅ All {len(uploaded_urls)} images uploaded successfully")
+        async with structured_tasks() as tg:
+            upload_tasks = [tg.create_task(upload_one(idx, image)) for idx, image in enumerate(images, 1)]
+        uploaded_urls = [task.result() for task in upload_tasks]
         
-        # Step 3: Return URLs
+        logger.info("✅ All %s images uploaded successfully", len(uploaded_urls))
+        
+        # Step 4: Return URLs
         return {
             "image_urls": uploaded_urls,
             "count": len(uploaded_urls)
@@ -2297,9 +2598,7 @@ async def upload_diary_images(
     except HTTPException:
         raise
     except Exception as e:
-        print(f"❌ Image upload failed: {str(e)}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("❌ Image upload failed: %s", str(e))
         raise HTTPException(
             status_code=500,
             detail=f"Failed to upload images: {str(e)}"
@@ -2344,7 +2643,7 @@ async def create_image_only_diary(
                 detail="No image URLs provided"
             )
         
-        print(f"📸 Creating image diary for user {user_id}, images: {len(image_urls)}, has_text: {bool(content)}")
+        logger.debug("📸 Creating image diary for user %s, images: %s, has_text: %s", user_id, len(image_urls), bool(content))
         
         # If content is provided, process it with AI (similar to text diary)
         if content and content.strip():
@@ -2352,9 +2651,9 @@ async def create_image_only_diary(
             
             # ✅ 使用统一的用户名字获取逻辑
             user_display_name = get_display_name(user, request)
-            print(f"👤 用户信息: user_id={user.get('user_id')}, display_name={user_display_name}")
+            logger.debug("👤 用户信息: user_id=%s, display_name=%s", user.get('user_id'), user_display_name)
             
-            print(f"✨ Processing text content with AI...")
+            logger.debug("✨ Processing text content with AI...")
             # ✅ 暂时去掉 Vision 模型，下个版本再加入
             # 只处理文字内容，不传递图片URL
             ai_result = await openai_service.polish_content_multilingual(
@@ -2364,7 +2663,8 @@ async def create_image_only_diary(
             )
             
             # Create diary with AI-processed content
-            diary = db_service.create_diary(
+            diary = await asyncio.to_thread(
+                db_service.create_diary,
                 user_id=user_id,
                 original_content=content,
                 polished_content=ai_result["polished_content"],
@@ -2376,13 +2676,14 @@ async def create_image_only_diary(
                 emotion_data=ai_result.get("emotion_data") # ✅ 传递情感数据
             )
             
-            print(f"✅ Image diary with text created: {diary['diary_id']}")
+            logger.info("✅ Image diary with text created: %s", diary['diary_id'])
         else:
             # Pure image diary - no AI processing
             title = ""
             content = ""
             
-            diary = db_service.create_diary(
+            diary = await asyncio.to_thread(
+                db_service.create_diary,
                 user_id=user_id,
                 original_content=content,
                 polished_content=content,
@@ -2393,48 +2694,76 @@ async def create_image_only_diary(
                 image_urls=image_urls
             )
             
-            print(f"✅ Image-only diary created: {diary['diary_id']}")
+            logger.info("✅ Image-only diary created: %s", diary['diary_id'])
         
         return diary
         
     except HTTPException:
         raise
     except Exception as e:
-        print(f"❌ Failed to create image diary: {str(e)}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("❌ Failed to create image diary: %s", str(e))
         raise HTTPException(
             status_code=500,
             detail=f"Failed to create diary: {str(e)}"
         )
 
+def _diary_list_etag(diaries: List[Dict]) -> str:
+    """
+    列表的弱 ETag：对整份响应内容做哈希
+    
+    不依赖 version 字段（并非每条写入路径都会递增它），任何字段变化都会改变 ETag
+    """
+    payload = orjson.dumps(diaries, option=orjson.OPT_SORT_KEYS, default=str)
+    return f'W/"{hashlib.blake2b(payload, digest_size=16).hexdigest()}"'
+
+
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """If-None-Match 弱比较（忽略 W/ 前缀，支持逗号分隔的多个值和 *）"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    bare = etag.removeprefix("W/")
+    return any(tag.strip().removeprefix("W/") == bare for tag in if_none_match.split(","))
+
+
 @router.get("/list", response_model=List[DiaryResponse], summary="获取日记列表")
 async def get_diaries(
-    user: Dict = Depends(get_current_user)
+    response: Response,
+    user: Dict = Depends(get_current_user),
+    if_none_match: Optional[str] = Header(None, alias="If-None-Match")
 ):
     """
     获取用户的所有日记列表（无数量限制）
 
+    🚀 条件请求：响应带 ETag；客户端回传 If-None-Match 且列表未变化时返回 304（无响应体），
+    省去整份列表的序列化和传输
+
     Args:
         user: 当前登录用户
+        if_none_match: 上次响应的 ETag（可选）
     """
     try:
-        print(f"📖 收到获取日记列表请求 - 用户ID: {user.get('user_id')}")
+        logger.debug("📖 收到获取日记列表请求 - 用户ID: %s", user.get('user_id'))
         
         # 检查用户ID是否存在
         user_id = user.get('user_id')
         if not user_id:
-            print(f"❌ 用户ID为空")
+            logger.error("❌ 用户ID为空")
             raise HTTPException(
                 status_code=401,
                 detail="用户ID无效"
             )
         
         # 尝试获取所有日记
-        diaries = db_service.get_user_diaries(user_id)
+        diaries = await asyncio.to_thread(db_service.get_user_diaries, user_id)
+        etag = _diary_list_etag(diaries)
+        if _etag_matches(if_none_match, etag):
+            return Response(status_code=304, headers={"ETag": etag})
         if diaries and len(diaries) > 0:
-            print(f"🔍 [DEBUG] 第一条日记情感数据: {diaries[0].get('emotion_data')}")
-        print(f"✅ 获取日记列表成功 - 用户: {user_id}, 数量: {len(diaries)}")
+            logger.debug("🔍 [DEBUG] 第一条日记情感数据: %s", diaries[0].get('emotion_data'))
+        logger.info("✅ 获取日记列表成功 - 用户: %s, 数量: %s", user_id, len(diaries))
+        response.headers["ETag"] = etag
         return diaries
         
     except HTTPException:
@@ -2442,12 +2771,7 @@ async def get_diaries(
         raise
     except Exception as e:
         # 记录详细错误信息
-        import traceback
-        error_trace = traceback.format_exc()
-        print(f"❌ 获取日记列表失败:")
-        print(f"   错误类型: {type(e).__name__}")
-        print(f"   错误信息: {str(e)}")
-        print(f"   错误堆栈:\n{error_trace}")
+        logger.exception("❌ 获取日记列表失败: %s: %s", type(e).__name__, str(e))
         
         # 根据错误类型返回不同的状态码
         error_message = str(e)
@@ -2476,17 +2800,22 @@ async def get_diaries(
 @router.get("/{diary_id}", response_model=DiaryResponse, summary="获取日记详情")
 async def get_diary_detail(
     diary_id: str,
-    user: Dict = Depends(get_current_user)
+    response: Response,
+    user: Dict = Depends(get_current_user),
+    if_none_match: Optional[str] = Header(None, alias="If-None-Match")
 ):
     """
     获取单篇日记的详细信息
     
+    ETag 与编辑接口一致，为日记版本号；版本未变化时返回 304
+    
     Args:
         diary_id: 日记 ID
         user: 当前登录用户
+        if_none_match: 上次响应的 ETag（可选）
     """
     try:
-        diary = db_service.get_diary_by_id(diary_id, user['user_id'])
+        diary = await asyncio.to_thread(db_service.get_diary_by_id, diary_id, user['user_id'])
         
         if not diary:
             raise HTTPException(
@@ -2494,13 +2823,18 @@ async def get_diary_detail(
                 detail="日记不存在"
             )
         
-        print(f"✅ 获取日记详情成功 - ID: {diary_id}")
+        etag = f'"{diary.get("version", 0)}"'
+        if _etag_matches(if_none_match, etag):
+            return Response(status_code=304, headers={"ETag": etag})
+        
+        logger.info("✅ 获取日记详情成功 - ID: %s", diary_id)
+        response.headers["ETag"] = etag
         return diary
         
     except HTTPException:
         raise
     except Exception as e:
-        print(f"❌ 获取日记详情失败: {str(e)}")
+        logger.error("❌ 获取日记详情失败: %s", str(e))
         raise HTTPException(
             status_code=500,
             detail=f"获取日记详情失败: {str(e)}"
@@ -2511,7 +2845,9 @@ async def get_diary_detail(
 async def update_diary(
     diary_id: str,
     diary: DiaryUpdate,
-    user: Dict = Depends(get_current_user)
+    response: Response,
+    user: Dict = Depends(get_current_user),
+    if_match: Optional[str] = Header(None, alias="If-Match")
 ):
     """
     编辑一篇日记
@@ -2519,75 +2855,93 @@ async def update_diary(
     注意：直接保存用户编辑的内容，不再调用 AI 润色
     支持更新图片列表，自动删除S3中被移除的图片
     
+    ✅ 乐观锁：客户端可通过 If-Match 传入日记的 version，
+    版本不一致时返回 412，防止并发编辑互相覆盖（不传则不校验）
+    
     Args:
         diary_id: 日记 ID
         diary: 更新内容（可包含 content, title, image_urls）
         user: 当前登录用户
+        if_match: 期望的日记版本号（可选，如 "3" 或 W/"3"）
     """
     try:
-        print(f"📝 更新日记请求 - ID: {diary_id}, 用户: {user['user_id']}")
+        logger.debug("📝 更新日记请求 - ID: %s, 用户: %s", diary_id, user['user_id'])
         
-        # ✅ 如果更新图片列表，先获取旧的图片URL以便删除S3文件
-        if diary.image_urls is not None:
-            # 获取当前日记的图片列表
-            current_diary = db_service.get_diary_by_id(diary_id, user['user_id'])
-            if current_diary:
-                old_image_urls = current_diary.get('image_urls', []) or []
-                new_image_urls = diary.image_urls or []
-                
-                # 找出被删除的图片URL
-                deleted_urls = set(old_image_urls) - set(new_image_urls)
-                
-                if deleted_urls:
-                    print(f"🗑️ 检测到 {len(deleted_urls)} 张图片被删除，开始从S3删除...")
-                    for url in deleted_urls:
-                        try:
-                            # 从S3删除图片
-                            s3_service.delete_image_by_url(url)
-                            print(f"  ✅ 已从S3删除: {url}")
-                        except Exception as e:
-                            print(f"  ⚠️ 删除S3图片失败 ({url}): {str(e)}")
-                            # 继续处理，不因为S3删除失败而中断整个更新
+        expected_version = None
+        if if_match:
+            try:
+                expected_version = int(if_match.strip().removeprefix("W/").strip('"'))
+            except ValueError:
+                raise HTTPException(status_code=400, detail=f"无效的 If-Match 版本号: {if_match}")
         
         # 构建更新字段
         update_fields = {}
         if diary.content is not None:
             update_fields['polished_content'] = diary.content
-            print(f"📝 更新内容: {diary.content[:50]}...")
+            logger.debug("📝 更新内容: %s...", diary.content[:50])
         if diary.title is not None:
             update_fields['title'] = diary.title
-            print(f"📝 更新标题: {diary.title}")
+            logger.debug("📝 更新标题: %s", diary.title)
         if diary.image_urls is not None:
             update_fields['image_urls'] = diary.image_urls
-            print(f"📝 更新图片数量: {len(diary.image_urls)}")
+            logger.debug("📝 更新图片数量: %s", len(diary.image_urls))
         
         if not update_fields:
             raise ValueError("至少需要提供 content, title 或 image_urls 之一")
         
-        # 直接保存用户编辑的内容
-        diary_obj = db_service.update_diary(
+        # 直接保存用户编辑的内容（一次写入同时拿回旧图片列表，无需预读）
+        diary_obj = await asyncio.to_thread(
+            db_service.update_diary,
             diary_id=diary_id,
             user_id=user['user_id'],
+            expected_version=expected_version,
             **update_fields
         )
         
-        print(f"✅ 日记更新成功 - ID: {diary_obj['diary_id']}")
+        # ✅ 找出被删除的图片URL，在后台从S3删除（不阻塞响应，失败由 spawn_background 记录日志）
+        old_image_urls = diary_obj.pop('previous_image_urls', None) or []
+        deleted_urls = set(old_image_urls) - set(diary.image_urls or [])
+        if diary.image_urls is not None and deleted_urls:
+            # 🚀 一次 DeleteObjects 请求删除全部被移除的图片（每批最多 1000 个 key）
+            logger.debug("🗑️ 检测到 %s 张图片被删除，后台从S3删除...", len(deleted_urls))
+            spawn_background(
+                asyncio.to_thread(s3_service.delete_objects_by_urls, list(deleted_urls)),
+                name=f"delete-images-{diary_id}"
+            )
+        
+        response.headers["ETag"] = f'"{diary_obj["version"]}"'
+        logger.info("✅ 日记更新成功 - ID: %s", diary_obj['diary_id'])
         return diary_obj
         
+    except HTTPException:
+        raise
+    except ClientError as e:
+        error_code = e.response.get("Error", {}).get("Code", "")
+        if error_code == "ConditionalCheckFailedException":
+            logger.warning("⚠️ 日记版本冲突 - ID: %s, If-Match: %s", diary_id, if_match)
+            raise HTTPException(
+                status_code=412,
+                detail="日记已被修改，请刷新后重试"
+            )
+        logger.error("❌ 更新日记失败: %s - %s", error_code, e)
+        raise HTTPException(
+            status_code=500,
+            detail=f"更新日记失败: {str(e)}"
+        )
     except ValueError as e:
-        print(f"❌ 日记不存在: {str(e)}")
+        logger.error("❌ 日记不存在: %s", str(e))
         raise HTTPException(
             status_code=404,
             detail=f"日记不存在: {str(e)}"
         )
     except PermissionError as e:
-        print(f"❌ 权限不足: {str(e)}")
+        logger.error("❌ 权限不足: %s", str(e))
         raise HTTPException(
             status_code=403,
             detail=f"无权修改此日记: {str(e)}"
         )
     except Exception as e:
-        print(f"❌ 更新日记失败: {str(e)}")
+        logger.error("❌ 更新日记失败: %s", str(e))
         raise HTTPException(
             status_code=500,
             detail=f"更新日记失败: {str(e)}"
@@ -2613,37 +2967,60 @@ async def delete_diary(
     """
     try:
         user_id = user['user_id']
-        logger.info(f"Delete diary request: diary_id={diary_id}, user_id={user_id}")
+        logger.info("Delete diary request: diary_id=%s, user_id=%s", diary_id, user_id)
         
         # Delete diary entry
-        db_service.delete_diary(
+        await asyncio.to_thread(
+            db_service.delete_diary,
             diary_id=diary_id,
             user_id=user_id
         )
         
-        logger.info(f"Diary deleted successfully: diary_id={diary_id}")
+        logger.info("Diary deleted successfully: diary_id=%s", diary_id)
         return {
             "message": "Diary deleted successfully",
             "diary_id": diary_id
         }
         
     except ValueError as e:
-        logger.warning(f"Diary not found or unauthorized: diary_id={diary_id}, error={str(e)}")
+        logger.warning("Diary not found or unauthorized: diary_id=%s, error=%s", diary_id, e)
         raise HTTPException(
             status_code=404,
             detail=str(e)
         )
     except Exception as e:
-        logger.error(f"Failed to delete diary: diary_id={diary_id}, error={str(e)}", exc_info=True)
+        logger.exception("Failed to delete diary: diary_id=%s, error=%s", diary_id, e)
         raise HTTPException(
             status_code=500,
             detail=f"Failed to delete diary: {str(e)}"
         )
 
 
+SEARCH_QUERY_PAGE_SIZE = 100  # 每次 Query 评估的条目数（FilterExpression 在此之后生效）
+
+
+def _encode_search_cursor(last_evaluated_key: Optional[Dict]) -> Optional[str]:
+    """把 DynamoDB LastEvaluatedKey 编码为前端可回传的游标"""
+    if not last_evaluated_key:
+        return None
+    return base64.urlsafe_b64encode(orjson.dumps(last_evaluated_key)).decode("ascii")
+
+
+def _decode_search_cursor(cursor: Optional[str]) -> Optional[Dict]:
+    """解析前端回传的游标，无效时返回 400"""
+    if not cursor:
+        return None
+    try:
+        return orjson.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="无效的分页游标")
+
+
 @router.get("/search", summary="搜索日记")
 async def search_diaries(
     q: str = Query(..., min_length=1, max_length=100, description="搜索关键词"),
+    limit: int = Query(20, ge=1, le=100, description="期望返回的结果数量"),
+    cursor: Optional[str] = Query(None, description="上一页返回的 next_cursor"),
     current_user: Dict = Depends(get_current_user),
 ):
     """
@@ -2652,56 +3029,49 @@ async def search_diaries(
     - 支持标题和内容的全文搜索
     - 支持中英文模糊匹配
     - 按创建时间倒序返回结果
+    - 分页：每次 Query 最多评估 100 条，凑够 limit 条结果即提前返回
     
     Args:
         q: 搜索关键词（1-100个字符）
+        limit: 期望返回的结果数量（1-100，可能略多于 limit）
+        cursor: 上一页返回的 next_cursor（可选）
         current_user: 当前登录用户
     
     Returns:
         {
-            "diaries": [...],  # 匹配的日记列表
-            "count": 3         # 结果数量
+            "diaries": [...],       # 匹配的日记列表
+            "count": 3,             # 结果数量
+            "next_cursor": "..."    # 还有更多结果时返回，否则为 null
         }
     
     注意：
-    生产环境建议使用 ElasticSearch 或 DynamoDB GSI 优化性能
-    当前实现使用 scan 会扫描整个表，数据量大时效率较低
+    只在当前用户的分区内 Query（不扫描整张表）；真正的全文检索建议接入 OpenSearch
     """
     try:
         user_id = current_user["user_id"]
-        print(f"🔍 用户 {user_id} 搜索: '{q}'")
-        
-        # 使用 DynamoDB scan 进行全文搜索
-        # 注意：scan 会扫描整个表，对于大数据量效率较低
-        # 生产环境建议使用 ElasticSearch 或创建 GSI
-        
-        response = db_service.diary_table.scan(
-            FilterExpression=(
-                Attr("user_id").eq(user_id) &
-                (
-                    Attr("title").contains(q) |
-                    Attr("polished_content").contains(q) |
-                    Attr("original_content").contains(q)
-                )
-            )
+        logger.debug("🔍 用户 %s 搜索: '%s' (limit=%s, cursor=%s)", user_id, q, limit, '有' if cursor else '无')
+        
+        diaries, last_evaluated_key = await asyncio.to_thread(
+            db_service.search_user_diaries,
+            user_id,
+            q,
+            limit,
+            _decode_search_cursor(cursor),
+            SEARCH_QUERY_PAGE_SIZE,
         )
         
-        diaries = response.get("Items", [])
-        
-        # 按创建时间倒序排序
-        diaries.sort(key=lambda x: x.get("created_at", ""), reverse=True)
-        
-        print(f"✅ 搜索到 {len(diaries)} 条日记")
+        logger.info("✅ 搜索到 %s 条日记", len(diaries))
         
         return {
             "diaries": diaries,
-            "count": len(diaries)
+            "count": len(diaries),
+            "next_cursor": _encode_search_cursor(last_evaluated_key)
         }
         
+    except HTTPException:
+        raise
     except Exception as e:
-        print(f"❌ 搜索日记失败: {str(e)}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("❌ 搜索日记失败: %s", str(e))
         raise HTTPException(
             status_code=500,
             detail=f"搜索失败: {str(e)}"
@@ -2712,6 +3082,41 @@ async def search_diaries(
 # Diary Sharing API (Intimate Circle Feature)
 # ============================================================================
 
+# 圈子成员关系缓存：只缓存「是成员」的结果（进程内 LRU + 短 TTL）
+# 🔒 不缓存否定结果，刚加入圈子的用户不会被误拒；被移出圈子的用户最多在 TTL 内仍可分享
+CIRCLE_MEMBERSHIP_CACHE_TTL = 60
+CIRCLE_MEMBERSHIP_CACHE_MAX_ENTRIES = 10_000
+_circle_membership_cache: "OrderedDict[Tuple[str, str], float]" = OrderedDict()
+
+async def is_circle_member_cached(circle_id: str, user_id: str) -> bool:
+    """先查进程内缓存，未命中时在线程池里查询 DynamoDB"""
+    key = (circle_id, user_id)
+    expires_at = _circle_membership_cache.get(key)
+    if expires_at is not None:
+        if expires_at > time.monotonic():
+            _circle_membership_cache.move_to_end(key)
+            return True
+        del _circle_membership_cache[key]
+
+    is_member = await asyncio.to_thread(circle_service.is_circle_member, circle_id, user_id)
+    if is_member:
+        _circle_membership_cache[key] = time.monotonic() + CIRCLE_MEMBERSHIP_CACHE_TTL
+        _circle_membership_cache.move_to_end(key)
+        while len(_circle_membership_cache) > CIRCLE_MEMBERSHIP_CACHE_MAX_ENTRIES:
+            _circle_membership_cache.popitem(last=False)
+    return is_member
+
+
+# 进行中的分享请求：(user_id, diary_id, circle_id) → Future
+_inflight_shares: Dict[Tuple[str, str, str], "asyncio.Future[Dict]"] = {}
+
+def _release_inflight_share(key: Tuple[str, str, str], task: "asyncio.Future[Dict]") -> None:
+    if _inflight_shares.get(key) is task:
+        del _inflight_shares[key]
+    if not task.cancelled():
+        task.exception()  # 所有等待方都断开时，避免 "exception was never retrieved" 警告
+
+
 @router.post("/{diary_id}/share", summary="Share diary to circle")
 async def share_diary(
     diary_id: str,
@@ -2743,18 +3148,38 @@ async def share_diary(
     - 400: Already shared to this circle
     - 500: Server error
     """
+    # 🚀 single-flight：同一用户对同一日记+圈子的并发请求（双击、客户端重试）共享同一次分享，
+    # 拿到同样的结果，而不是都穿过预检查后一个成功、一个 400/500
+    key = (user['user_id'], diary_id, circle_id)
+    inflight = _inflight_shares.get(key)
+    if inflight is None:
+        inflight = asyncio.ensure_future(_share_diary_once(diary_id, circle_id, user))
+        _inflight_shares[key] = inflight
+        inflight.add_done_callback(lambda task: _release_inflight_share(key, task))
+    # shield：某个请求断开时不取消其他请求正在等待的同一次分享
+    return await asyncio.shield(inflight)
+
+
+async def _share_diary_once(diary_id: str, circle_id: str, user: Dict) -> Dict:
+    """share_diary 的实际处理（由 single-flight 保证同一 key 同时只执行一次）"""
     try:
         user_id = user['user_id']
         
+        # 🚀 三个只读检查互不依赖，并发执行；结果仍按原顺序判定（403 → 404 → 403 → 400）
+        async with structured_tasks() as tg:
+            member_task = tg.create_task(is_circle_member_cached(circle_id, user_id))
+            diary_task = tg.create_task(asyncio.to_thread(db_service.get_diary_by_id, diary_id, user_id))
+            shared_task = tg.create_task(asyncio.to_thread(circle_service.is_diary_shared_to_circle, diary_id, circle_id))
+        
         # 1. Check if user is circle member
-        if not circle_service.is_circle_member(circle_id, user_id):
+        if not member_task.result():
             raise HTTPException(
                 status_code=403,
                 detail="Only circle members can share diaries"
             )
         
         # 2. Check if diary exists and belongs to user
-        diary = db_service.get_diary_by_id(diary_id)
+        diary = diary_task.result()
         if not diary:
             raise HTTPException(status_code=404, detail="Diary not found")
         
@@ -2765,14 +3190,15 @@ async def share_diary(
             )
         
         # 3. Check if already shared (prevent duplicates)
-        if circle_service.is_diary_shared_to_circle(diary_id, circle_id):
+        if shared_task.result():
             raise HTTPException(
                 status_code=400,
                 detail="Diary already shared to this circle"
             )
         
         # 4. Share diary (with denormalized fields for performance)
-        share_record = circle_service.share_diary_to_circle(
+        share_record = await asyncio.to_thread(
+            circle_service.share_diary_to_circle,
             diary_id=diary_id,
             circle_id=circle_id,
             user_id=user_id,
@@ -2780,7 +3206,7 @@ async def share_diary(
         )
         
         # Audit log for security tracking
-        logger.info(f"Diary shared: user_id={user_id}, diary_id={diary_id}, circle_id={circle_id}, share_id={share_record.get('shareId')}")
+        logger.info("Diary shared: user_id=%s, diary_id=%s, circle_id=%s, share_id=%s", user_id, diary_id, circle_id, share_record.get('shareId'))
         
         return {
             "message": "Diary shared successfully",
@@ -2790,7 +3216,7 @@ async def share_diary(
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"Failed to share diary: user_id={user_id}, diary_id={diary_id}, circle_id={circle_id}, error={str(e)}", exc_info=True)
+        logger.exception("Failed to share diary: user_id=%s, diary_id=%s, circle_id=%s, error=%s", user_id, diary_id, circle_id, e)
         raise HTTPException(
             status_code=500,
             detail=f"Failed to share diary: {str(e)}"
@@ -2822,8 +3248,8 @@ async def unshare_diary(
     try:
         user_id = user['user_id']
         
-        # 1. Verify diary ownership
-        diary = db_service.get_diary_by_id(diary_id)
+        # 1. Verify diary ownership（删除必须在校验之后，不能并发）
+        diary = await asyncio.to_thread(db_service.get_diary_by_id, diary_id, user_id)
         if not diary:
             raise HTTPException(status_code=404, detail="Diary not found")
         
@@ -2834,10 +3260,10 @@ async def unshare_diary(
             )
         
         # 2. Unshare
-        circle_service.unshare_diary_from_circle(diary_id, circle_id)
+        await asyncio.to_thread(circle_service.unshare_diary_from_circle, diary_id, circle_id)
         
         # Audit log for security tracking
-        logger.info(f"Diary unshared: user_id={user_id}, diary_id={diary_id}, circle_id={circle_id}")
+        logger.info("Diary unshared: user_id=%s, diary_id=%s, circle_id=%s", user_id, diary_id, circle_id)
         
         return {
             "message": "Diary unshared successfully",
@@ -2848,7 +3274,7 @@ async def unshare_diary(
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"Failed to unshare diary: user_id={user_id}, diary_id={diary_id}, circle_id={circle_id}, error={str(e)}", exc_info=True)
+        logger.exception("Failed to unshare diary: user_id=%s, diary_id=%s, circle_id=%s, error=%s", user_id, diary_id, circle_id, e)
         raise HTTPException(
             status_code=500,
             detail=f"Failed to unshare diary: {str(e)}"
@@ -2896,8 +3322,13 @@ async def get_diary_shares(
     try:
         user_id = user['user_id']
         
+        # 🚀 日记和分享记录都是只读查询，并发获取；校验所有权之前不返回任何分享数据
+        async with structured_tasks() as tg:
+            diary_task = tg.create_task(asyncio.to_thread(db_service.get_diary_by_id, diary_id, user_id))
+            shares_task = tg.create_task(asyncio.to_thread(circle_service.get_diary_shares, diary_id))
+        
         # 1. Verify diary ownership
-        diary = db_service.get_diary_by_id(diary_id)
+        diary = diary_task.result()
         if not diary:
             raise HTTPException(status_code=404, detail="Diary not found")
         
@@ -2908,7 +3339,7 @@ async def get_diary_shares(
             )
         
         # 2. Get share records
-        shares = circle_service.get_diary_shares(diary_id)
+        shares = shares_task.result()
         
         # 3. Extract circle info
         circles = []
@@ -2928,7 +3359,7 @@ async def get_diary_shares(
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"Failed to get diary shares: user_id={user_id}, diary_id={diary_id}, error={str(e)}", exc_info=True)
+        logger.exception("Failed to get diary shares: user_id=%s, diary_id=%s, error=%s", user_id, diary_id, e)
         raise HTTPException(
             status_code=500,
             detail=f"Failed to get diary shares: {str(e)}"
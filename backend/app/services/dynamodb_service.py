@@ -1,42 +1,103 @@
 import boto3
 from boto3.dynamodb.conditions import Key, Attr
-from typing import List, Optional, Any
+from boto3.dynamodb.types import TypeSerializer
+from botocore.config import Config
+from typing import List, Optional, Any, Tuple
 from ..config import get_settings, get_boto3_kwargs
+import time
 import uuid
+from functools import lru_cache
 from decimal import Decimal
 from datetime import datetime, timezone
+import logging
 
+logger = logging.getLogger(__name__)
+
+# 🔥 连接池配置：diary / auth / account 路由并发请求共享连接，避免 "Connection pool is full"
+# DynamoDB 单次请求是毫秒级：卡住的连接快速超时交给重试，而不是按默认 60 秒等待
+DYNAMODB_CLIENT_CONFIG = Config(
+    max_pool_connections=50,
+    retries={"max_attempts": 3, "mode": "adaptive"},
+    tcp_keepalive=True,
+    connect_timeout=2,
+    read_timeout=5,
+)
+
+# 🚀 搜索表达式预先拼好：每次请求只替换取值，不再经过 Key/Attr 条件 DSL 构建和序列化
+SEARCH_KEY_CONDITION = "#u = :u"
+# 早期日记没有 itemType 字段，与 get_user_diaries 一致按日记处理
+SEARCH_FILTER_EXPRESSION = (
+    "(attribute_not_exists(#it) OR #it = :diary) "
+    "AND (contains(#t, :q) OR contains(#pc, :q) OR contains(#oc, :q))"
+)
+SEARCH_ATTRIBUTE_NAMES = {
+    "#u": "userId",
+    "#it": "itemType",
+    "#t": "title",
+    "#pc": "polishedContent",
+    "#oc": "originalContent",
+}
+
+# processing 阶段刷盘写入的字段（diary / image_urls 等只在创建或终态时整条写入）
+# audio_url：分块上传在后台合并完成后才产生，随下一次进度刷盘写入
+TASK_PROGRESS_FIELDS = ("status", "progress", "step", "step_name", "message", "updated_at", "audio_url")
+TERMINAL_TASK_STATUSES = ("completed", "failed")
+# 非终态写入的条件：记录已是终态时拒绝写入，过期的 processing 快照不会覆盖 completed / failed
+# （由 DynamoDB 判定，不依赖进程内的锁，也对其他 Lambda 实例的写入生效）
+TASK_NOT_TERMINAL_CONDITION = "NOT #status IN (:completed, :failed)"
+TASK_NOT_TERMINAL_VALUES = {":completed": "completed", ":failed": "failed"}
 
 class DynamoDBService:
     """DynamoDB数据库服务"""
     def __init__(self):
         try:
             settings=get_settings()
-            print(f"🔍 DynamoDB初始化 - 区域: {settings.aws_region}, 表名: {settings.dynamodb_table_name}")
+            logger.debug("🔍 DynamoDB初始化 - 区域: %s, 表名: %s", settings.aws_region, settings.dynamodb_table_name)
             
             # 创建DynamoDB客户端
             # 在Lambda环境中，boto3会自动使用IAM角色凭证
             # 使用默认凭证链（IAM角色、环境变量等）
-            self.dynamodb = boto3.resource("dynamodb", **get_boto3_kwargs(settings))
+            self.dynamodb = boto3.resource(
+                "dynamodb",
+                config=DYNAMODB_CLIENT_CONFIG,
+                **get_boto3_kwargs(settings)
+            )
             # 获取表
             self.table=self.dynamodb.Table(settings.dynamodb_table_name)
             
             # 验证表是否存在（延迟加载，不实际访问）
-            print(f"✅ DynamoDB客户端初始化成功")
+            logger.info("✅ DynamoDB客户端初始化成功")
         except Exception as e:
-            print(f"❌ DynamoDB初始化失败: {str(e)}")
-            import traceback
-            traceback.print_exc()
+            logger.exception("❌ DynamoDB初始化失败: %s", str(e))
             raise
 
     def _convert_to_decimal(self, obj: Any) -> Any:
-        """递归将 float 转换为 Decimal (DynamoDB 不支持 float)"""
+        """
+        递归将 float 转换为 Decimal (DynamoDB 不支持 float)
+        
+        🚀 写时复制：不含 float 的 dict / list 原样返回，不重建容器；
+        不能原地修改——传入的可能是内存缓存中仍在返回给前端的任务 / 日记对象
+        """
         if isinstance(obj, float):
             return Decimal(str(obj))
-        elif isinstance(obj, dict):
-            return {k: self._convert_to_decimal(v) for k, v in obj.items()}
-        elif isinstance(obj, list):
-            return [self._convert_to_decimal(i) for i in obj]
+        if isinstance(obj, dict):
+            converted = None
+            for k, v in obj.items():
+                new_v = self._convert_to_decimal(v)
+                if new_v is not v:
+                    if converted is None:
+                        converted = dict(obj)
+                    converted[k] = new_v
+            return obj if converted is None else converted
+        if isinstance(obj, list):
+            converted = None
+            for i, v in enumerate(obj):
+                new_v = self._convert_to_decimal(v)
+                if new_v is not v:
+                    if converted is None:
+                        converted = list(obj)
+                    converted[i] = new_v
+            return obj if converted is None else converted
         return obj
 
     def create_diary(
@@ -62,10 +123,45 @@ class DynamoDBService:
         
         返回:
             创建的日记对象 """
+        item, diary = self.build_diary_record(
+            user_id=user_id,
+            original_content=original_content,
+            polished_content=polished_content,
+            ai_feedback=ai_feedback,
+            language=language,
+            title=title,
+            audio_url=audio_url,
+            audio_duration=audio_duration,
+            image_urls=image_urls,
+            emotion_data=emotion_data
+        )
+        self.put_diary_item(item)
+        return diary
+
+    def build_diary_record(
+        self,
+        user_id: str,
+        original_content: str,
+        polished_content: str,
+        ai_feedback: str,
+        language: str = "zh",
+        title: str = "日记",
+        audio_url: Optional[str] = None,
+        audio_duration: Optional[int] = None,
+        image_urls: Optional[List[str]] = None,
+        emotion_data: Optional[dict] = None
+    ) -> Tuple[dict, dict]:
+        """ 构造日记（不写库）
+        
+        diary_id 和时间戳在这里预先生成，调用方可以先把日记对象推给前端，再并行写库
+        
+        返回:
+            (DynamoDB item, 返回给前端的日记对象) """
         # 生成唯一ID和时间戳
         diary_id=str(uuid.uuid4())
-        create_at=datetime.now(timezone.utc).isoformat()
-        date=datetime.now(timezone.utc).strftime("%Y-%m-%d")
+        now=datetime.now(timezone.utc)
+        create_at=now.isoformat()
+        date=now.strftime("%Y-%m-%d")
         
         # 构造要保存的数据
         item={
@@ -78,7 +174,8 @@ class DynamoDBService:
             'title': title,                   # ← 新增：标题
             'originalContent':original_content,
             'polishedContent': polished_content,
-            'aiFeedback': ai_feedback
+            'aiFeedback': ai_feedback,
+            'version': 1                       # ✅ 乐观锁版本号
         }
          #✅ 如果有音频信息，添加到item
         if audio_url:
@@ -91,28 +188,53 @@ class DynamoDBService:
         # ✅ 如果有情感数据，添加到item (需转换 float -> Decimal)
         if emotion_data:
             item['emotionData'] = self._convert_to_decimal(emotion_data)
-        # 保存到DynamoDB
+        # 返回给前端的格式(转成下划线命名)
+        diary = {
+            'diary_id': diary_id,
+            'user_id': user_id,
+            'created_at': create_at,
+            'date': date,
+            'language': language,              # ← 新增：语言
+            'title': title,                   # ← 新增：标题
+            'original_content': original_content,
+            'polished_content': polished_content,
+            'ai_feedback': ai_feedback,
+            'audio_url':audio_url,
+            'audio_duration':audio_duration,
+            'image_urls': image_urls if image_urls else [],
+            'emotion_data': emotion_data,
+            'version': 1
+        }
+        return item, diary
+
+    def put_diary_item(self, item: dict) -> None:
+        """保存 build_diary_record 构造的日记 item 到DynamoDB"""
         try:
             self.table.put_item(Item=item)
-            # 返回给前端的格式(转成下划线命名)
-            return{ 
-                'diary_id': diary_id,
-                'user_id': user_id,
-                'created_at': create_at,
-                'date': date,
-                'language': language,              # ← 新增：语言
-                'title': title,                   # ← 新增：标题
-                'original_content': original_content,
-                'polished_content': polished_content,
-                'ai_feedback': ai_feedback,
-                'audio_url':audio_url,
-                'audio_duration':audio_duration,
-                'image_urls': image_urls if image_urls else [],
-                'emotion_data': emotion_data
-            }
         except Exception as e:
-            print(f"保存日记失败:{str(e)}")
+            logger.error("保存日记失败:%s", str(e))
             raise
+
+    @staticmethod
+    def _item_to_diary(item: dict) -> dict:
+        """DynamoDB 日记 item（驼峰命名）→ 返回给前端的日记对象（下划线命名）"""
+        return {
+            'diary_id': item.get('diaryId'),
+            'user_id': item.get('userId', ''),
+            'created_at': item.get('createdAt', ''),
+            'date': item.get('date', ''),
+            'language': item.get('language', 'zh'),
+            'title': item.get('title', '日记'),
+            'original_content': item.get('originalContent', ''),
+            'polished_content': item.get('polishedContent', ''),
+            'ai_feedback': item.get('aiFeedback', ''),
+            'audio_url': item.get('audioUrl'),
+            'audio_duration': item.get('audioDuration'),
+            'image_urls': item.get('imageUrls'),
+            'emotion_data': item.get('emotionData'),
+            'version': item.get('version', 0)
+        }
+
     def get_user_diaries(
         self,
         user_id: str
@@ -127,7 +249,7 @@ class DynamoDBService:
             所有日记列表
         """
         try:
-            print(f"🔍 DynamoDB查询 - 表名: {self.table.table_name}, 用户ID: {user_id}, 查询所有日记")
+            logger.debug("🔍 DynamoDB查询 - 表名: %s, 用户ID: %s, 查询所有日记", self.table.table_name, user_id)
             
             # 验证用户ID
             if not user_id or not user_id.strip():
@@ -153,7 +275,7 @@ class DynamoDBService:
                 
                 # 处理当前批次的数据
                 items = response.get('Items', [])
-                print(f"📊 DynamoDB响应 - 当前批次返回: {len(items)} 条")
+                logger.debug("📊 DynamoDB响应 - 当前批次返回: %s 条", len(items))
                 
                 for item in items:
                     item_type = item.get('itemType', 'diary').lower()
@@ -163,27 +285,13 @@ class DynamoDBService:
                     diary_id = item.get('diaryId')
                     if not diary_id or str(diary_id).lower() == 'unknown':
                         # ⚠️ 非日记数据或历史异常数据（无有效 diaryId），直接跳过
-                        print(f"⚠️ 跳过无效日记记录: {item.get('diaryId')} {item.get('itemType')}")
+                        logger.warning("⚠️ 跳过无效日记记录: %s %s", item.get('diaryId'), item.get('itemType'))
                         continue
 
                     if 'originalContent' not in item and 'polishedContent' not in item:
                         continue
 
-                    diaries.append({
-                        'diary_id': diary_id,
-                        'user_id': item.get('userId', ''),
-                        'created_at': item.get('createdAt', ''),
-                        'date': item.get('date', ''),
-                        'language': item.get('language', 'zh'),
-                        'title': item.get('title', '日记'),
-                        'original_content': item.get('originalContent', ''),
-                        'polished_content': item.get('polishedContent', ''),
-                        'ai_feedback': item.get('aiFeedback', ''),
-                        'audio_url': item.get('audioUrl'),
-                        'audio_duration': item.get('audioDuration'),
-                        'image_urls': item.get('imageUrls'),
-                        'emotion_data': item.get('emotionData')
-                    })
+                    diaries.append(self._item_to_diary(item))
                 
                 # 检查是否还有更多数据
                 last_evaluated_key = response.get('LastEvaluatedKey')
@@ -191,19 +299,51 @@ class DynamoDBService:
                     # 没有更多数据了,退出循环
                     break
                 
-                print(f"📄 继续查询下一页...")
+                logger.debug("📄 继续查询下一页...")
             
-            print(f"✅ DynamoDB查询成功 - 总共获取: {len(diaries)} 条日记")
+            logger.info("✅ DynamoDB查询成功 - 总共获取: %s 条日记", len(diaries))
             return diaries
         except Exception as e:
-            import traceback
-            error_trace = traceback.format_exc()
-            print(f"❌ 获取日记列表失败:")
-            print(f"   错误类型: {type(e).__name__}")
-            print(f"   错误信息: {str(e)}")
-            print(f"   错误堆栈:\n{error_trace}")
+            logger.exception("❌ 获取日记列表失败: %s: %s", type(e).__name__, str(e))
             raise
     
+    def search_user_diaries(
+        self,
+        user_id: str,
+        keyword: str,
+        limit: int,
+        exclusive_start_key: Optional[dict] = None,
+        page_size: int = 100
+    ) -> Tuple[List[dict], Optional[dict]]:
+        """
+        在用户自己的分区内搜索日记（标题 / 润色内容 / 原文包含关键词）
+        
+        🔥 Query 只读取该用户分区（userId 是表的 Partition Key），不再 scan 整张表；
+        按 createdAt 倒序返回，凑够 limit 条或分区读完即停止
+        
+        返回:
+            (日记列表, LastEvaluatedKey；为 None 表示没有更多结果)
+        """
+        query_kwargs = {
+            'KeyConditionExpression': SEARCH_KEY_CONDITION,
+            'FilterExpression': SEARCH_FILTER_EXPRESSION,
+            'ExpressionAttributeNames': SEARCH_ATTRIBUTE_NAMES,
+            'ExpressionAttributeValues': {':u': user_id, ':q': keyword, ':diary': 'diary'},
+            'ScanIndexForward': False,  # 倒序排列(最新的在前)
+            'Limit': page_size,
+        }
+        diaries = []
+        last_evaluated_key = exclusive_start_key
+        while True:
+            if last_evaluated_key:
+                query_kwargs['ExclusiveStartKey'] = last_evaluated_key
+            response = self.table.query(**query_kwargs)
+            diaries.extend(self._item_to_diary(item) for item in response.get('Items', []))
+            last_evaluated_key = response.get('LastEvaluatedKey')
+            # 整页返回，避免游标跳过结果
+            if len(diaries) >= limit or not last_evaluated_key:
+                return diaries, last_evaluated_key
+
     def get_diary_by_id(
         self,
         diary_id: str,
@@ -220,35 +360,31 @@ class DynamoDBService:
             日记对象或None
         """
         try:
-            # 使用scan查询，因为diary_id不是主键
-            response = self.table.scan(
-                FilterExpression=Attr('diaryId').eq(diary_id) & Attr('userId').eq(user_id)
+            # 🚀 先用 diaryId-index 定位主键（只取键，表主键在任何 GSI 中都会被投影），
+            # 再按主键 get_item 读完整日记；不再全表 scan（scan 只读第一页，大表里还会漏掉日记）
+            response = self.table.query(
+                IndexName='diaryId-index',
+                KeyConditionExpression=Key('diaryId').eq(diary_id),
+                ProjectionExpression='userId, createdAt'
             )
             
             items = response.get('Items', [])
-            if not items:
+            if not items or items[0].get('userId') != user_id:
                 return None
             
-            item = items[0]  # 取第一个匹配的项
+            item = self.table.get_item(
+                Key={
+                    'userId': user_id,
+                    'createdAt': items[0]['createdAt']
+                }
+            ).get('Item')
+            if not item:
+                return None
             
-            return {
-                'diary_id': item.get('diaryId', 'unknown'),
-                'user_id': item.get('userId', ''),
-                'created_at': item.get('createdAt', ''),
-                'date': item.get('date', ''),
-                'language': item.get('language', 'zh'),      # ← 新增：语言
-                'title': item.get('title', '日记'),           # ← 新增：标题
-                'original_content': item.get('originalContent', ''),
-                'polished_content': item.get('polishedContent', ''),
-                'ai_feedback': item.get('aiFeedback', ''),
-                'audio_url': item.get('audioUrl'),
-                'audio_duration': item.get('audioDuration'),
-                'image_urls': item.get('imageUrls'),
-                'emotion_data': item.get('emotionData') # ✅ 获取情感数据
-            }
+            return self._item_to_diary(item)
             
         except Exception as e:
-            print(f"获取日记失败: {str(e)}")
+            logger.error("获取日记失败: %s", str(e))
             raise
 
     def update_diary(
@@ -257,7 +393,8 @@ class DynamoDBService:
         user_id: str,
         polished_content: str = None,
         title: str = None,
-        image_urls: List[str] = None  # ✅ 新增：图片URL列表
+        image_urls: List[str] = None,  # ✅ 新增：图片URL列表
+        expected_version: Optional[int] = None  # ✅ 乐观锁：客户端 If-Match 传入的版本号
     ) -> dict:
         """
         更新日记内容和/或标题和/或图片列表
@@ -268,15 +405,17 @@ class DynamoDBService:
             polished_content: 新的润色内容（可选）
             title: 新的标题（可选）
             image_urls: 新的图片URL列表（可选）
+            expected_version: 期望的当前版本号（可选，不匹配时抛出 ConditionalCheckFailedException）
         
         返回:
-            更新后的日记对象
+            更新后的日记对象；更新图片时额外包含 previous_image_urls（旧图片列表）
         """
         try:
-            # 使用 GSI 通过 diaryId 直接查询
+            # 使用 GSI 通过 diaryId 直接查询（只取主键；旧数据由 update_item 的 ALL_OLD 返回）
             response = self.table.query(
                 IndexName='diaryId-index',
-                KeyConditionExpression=Key('diaryId').eq(diary_id)
+                KeyConditionExpression=Key('diaryId').eq(diary_id),
+                ProjectionExpression='userId, createdAt'
             )
             
             items = response.get('Items', [])
@@ -291,7 +430,7 @@ class DynamoDBService:
             if diary_item.get('userId') != user_id:
                 raise PermissionError("无权修改此日记")
             
-            print(f"🔍 找到日记 - ID: {diary_id}, 用户: {user_id}, 创建时间: {created_at}")
+            logger.debug("🔍 找到日记 - ID: %s, 用户: %s, 创建时间: %s", diary_id, user_id, created_at)
             
             # 构建动态更新表达式
             update_expressions = []
@@ -300,56 +439,78 @@ class DynamoDBService:
             if polished_content is not None:
                 update_expressions.append('polishedContent = :pc')
                 expression_values[':pc'] = polished_content
-                print(f"📝 将更新内容: {polished_content[:50]}...")
+                logger.debug("📝 将更新内容: %s...", polished_content[:50])
             
             if title is not None:
                 update_expressions.append('title = :t')
                 expression_values[':t'] = title
-                print(f"📝 将更新标题: {title}")
+                logger.debug("📝 将更新标题: %s", title)
             
             if image_urls is not None:
                 update_expressions.append('imageUrls = :iu')
                 expression_values[':iu'] = image_urls
-                print(f"📝 将更新图片数量: {len(image_urls)}")
+                logger.debug("📝 将更新图片数量: %s", len(image_urls))
             
             if not update_expressions:
                 raise ValueError("至少需要提供 polished_content, title 或 image_urls 之一")
             
-            # 更新日记
-            response = self.table.update_item(
-                Key={
+            # 每次更新版本号 +1（历史日记没有 version 字段，ADD 会从 0 开始）
+            expression_values[':inc'] = 1
+            update_kwargs = {
+                'Key': {
                     'userId': user_id,
                     'createdAt': created_at
                 },
-                UpdateExpression=f"SET {', '.join(update_expressions)}",
-                ExpressionAttributeValues=expression_values,
-                ReturnValues='ALL_NEW'
-            )
+                'UpdateExpression': f"SET {', '.join(update_expressions)} ADD version :inc",
+                'ExpressionAttributeValues': expression_values,
+                # ✅ 返回旧值：一次写入即可拿到旧图片列表，无需预先读取
+                'ReturnValues': 'ALL_OLD'
+            }
+            
+            if expected_version is not None:
+                if expected_version == 0:
+                    update_kwargs['ConditionExpression'] = Attr('version').not_exists() | Attr('version').eq(0)
+                else:
+                    update_kwargs['ConditionExpression'] = Attr('version').eq(expected_version)
+            
+            # 更新日记
+            response = self.table.update_item(**update_kwargs)
             
-            print(f"✅ DynamoDB更新成功")
+            logger.info("✅ DynamoDB更新成功")
             
-            # 获取更新后的数据
-            updated_item = response.get('Attributes', {})
+            # 旧数据 + 本次更新字段 = 更新后的数据
+            old_item = response.get('Attributes') or diary_item
+            updated_item = dict(old_item)
+            if polished_content is not None:
+                updated_item['polishedContent'] = polished_content
+            if title is not None:
+                updated_item['title'] = title
+            if image_urls is not None:
+                updated_item['imageUrls'] = image_urls
             
             # 返回更新后的数据
-            return {
+            result = {
                 'diary_id': diary_id,
                 'user_id': user_id,
                 'created_at': created_at,
-                'date': updated_item.get('date', diary_item.get('date', '')),
-                'language': updated_item.get('language', diary_item.get('language', 'zh')),
-                'title': updated_item.get('title', diary_item.get('title', '日记')),
-                'original_content': updated_item.get('originalContent', diary_item.get('originalContent', '')),
-                'polished_content': updated_item.get('polishedContent', diary_item.get('polishedContent', '')),
-                'ai_feedback': updated_item.get('aiFeedback', diary_item.get('aiFeedback', '')),
-                'audio_url': updated_item.get('audioUrl', diary_item.get('audioUrl')),
-                'audio_duration': updated_item.get('audioDuration', diary_item.get('audioDuration')),
-                'image_urls': updated_item.get('imageUrls', diary_item.get('imageUrls')),  # ✅ 返回更新后的图片列表
-                'emotion_data': updated_item.get('emotionData', diary_item.get('emotionData'))  # ✅ 添加情感数据
+                'date': updated_item.get('date', ''),
+                'language': updated_item.get('language', 'zh'),
+                'title': updated_item.get('title', '日记'),
+                'original_content': updated_item.get('originalContent', ''),
+                'polished_content': updated_item.get('polishedContent', ''),
+                'ai_feedback': updated_item.get('aiFeedback', ''),
+                'audio_url': updated_item.get('audioUrl'),
+                'audio_duration': updated_item.get('audioDuration'),
+                'image_urls': updated_item.get('imageUrls'),  # ✅ 返回更新后的图片列表
+                'emotion_data': updated_item.get('emotionData'),  # ✅ 添加情感数据
+                'version': int(old_item.get('version', 0)) + 1
             }
+            if image_urls is not None:
+                result['previous_image_urls'] = old_item.get('imageUrls') or []
+            return result
             
         except Exception as e:
-            print(f"更新日记失败: {str(e)}")
+            logger.error("更新日记失败: %s", str(e))
             raise
 
     def delete_diary(
@@ -365,10 +526,11 @@ class DynamoDBService:
             user_id: 用户ID
         """
         try:
-            # 使用 GSI 通过 diaryId 直接查询
+            # 使用 GSI 通过 diaryId 直接查询（只需要主键，表主键在任何 GSI 中都会被投影）
             response = self.table.query(
                 IndexName='diaryId-index',
-                KeyConditionExpression=Key('diaryId').eq(diary_id)
+                KeyConditionExpression=Key('diaryId').eq(diary_id),
+                ProjectionExpression='userId, createdAt'
             )
             
             items = response.get('Items', [])
@@ -392,7 +554,7 @@ class DynamoDBService:
             )
             
         except Exception as e:
-            print(f"删除日记失败: {str(e)}")
+            logger.error("删除日记失败: %s", str(e))
             raise
 
     def upsert_user_profile(self, user_id: str, name: str) -> None:
@@ -407,78 +569,148 @@ class DynamoDBService:
             }
             self.table.put_item(Item=profile_item)
         except Exception as e:
-            print(f"❌ 更新用户资料失败: {str(e)}")
+            logger.error("❌ 更新用户资料失败: %s", str(e))
             raise
 
     def delete_user_data(self, user_id: str) -> List[str]:
-        """删除用户的所有日记并返回需要删除的音频URL列表"""
+        """
+        删除用户的所有日记并返回需要删除的音频URL列表
+        
+        🚀 通过 batch_writer 批量删除（每次 BatchWriteItem 最多 25 条，UnprocessedItems 自动重试），
+        不再逐条 delete_item
+        """
         audio_urls: List[str] = []
         try:
             last_evaluated_key = None
-            while True:
-                query_kwargs = {
-                    'KeyConditionExpression': Key('userId').eq(user_id),
-                    'ScanIndexForward': False,
-                }
+            with self.table.batch_writer() as batch:
+                while True:
+                    query_kwargs = {
+                        'KeyConditionExpression': Key('userId').eq(user_id),
+                        # 只取删除和清理 S3 所需的字段，不传输日记正文
+                        'ProjectionExpression': 'createdAt, audioUrl',
+                        'ScanIndexForward': False,
+                    }
 
-                if last_evaluated_key:
-                    query_kwargs['ExclusiveStartKey'] = last_evaluated_key
+                    if last_evaluated_key:
+                        query_kwargs['ExclusiveStartKey'] = last_evaluated_key
 
-                response = self.table.query(**query_kwargs)
-                items = response.get('Items', [])
+                    response = self.table.query(**query_kwargs)
+                    items = response.get('Items', [])
 
-                if not items and not last_evaluated_key:
-                    break
+                    if not items and not last_evaluated_key:
+                        break
 
-                for item in items:
-                    created_at = item.get('createdAt')
-                    if not created_at:
-                        continue
+                    for item in items:
+                        created_at = item.get('createdAt')
+                        if not created_at:
+                            continue
 
-                    audio_url = item.get('audioUrl')
-                    if audio_url:
-                        audio_urls.append(audio_url)
+                        audio_url = item.get('audioUrl')
+                        if audio_url:
+                            audio_urls.append(audio_url)
 
-                    try:
-                        self.table.delete_item(
+                        batch.delete_item(
                             Key={
                                 'userId': user_id,
                                 'createdAt': created_at
                             }
                         )
-                    except Exception as delete_error:
-                        print(f"❌ 删除日记失败 (userId={user_id}, createdAt={created_at}): {delete_error}")
-                        raise
 
-                last_evaluated_key = response.get('LastEvaluatedKey')
-                if not last_evaluated_key:
-                    break
+                    last_evaluated_key = response.get('LastEvaluatedKey')
+                    if not last_evaluated_key:
+                        break
 
         except Exception as e:
-            print(f"❌ 删除用户日记失败: {str(e)}")
+            logger.error("❌ 删除用户日记失败: %s", str(e))
             raise
 
         return audio_urls
 
+    def _build_task_item(self, task_id: str, task_data: dict, user_id: str) -> dict:
+        """构造任务进度 item（使用用户 ID 作为 Partition Key，2小时 TTL）"""
+        item = dict(self._convert_to_decimal(task_data))  # 下面会追加主键字段，不能改到调用方的 task_data
+        item['userId'] = user_id
+        item['createdAt'] = f"TASK#{task_id}"
+        item['taskId'] = task_id
+        item['itemType'] = 'task'
+        item['ttl'] = int(time.time()) + 7200  # 2小时后过期
+        return item
+
     def save_task_progress(self, task_id: str, task_data: dict, user_id: str = "TASK_SYSTEM") -> None:
         """
-        保存异步任务进度到 DynamoDB
+        保存异步任务进度到 DynamoDB（整条 PutItem）
+        
+        终态直接写入；非终态只在记录不存在或尚未进入终态时写入
         """
+        condition = {}
+        if task_data.get("status") not in TERMINAL_TASK_STATUSES:
+            condition = {
+                "ConditionExpression": f"attribute_not_exists(userId) OR {TASK_NOT_TERMINAL_CONDITION}",
+                "ExpressionAttributeNames": {"#status": "status"},
+                "ExpressionAttributeValues": TASK_NOT_TERMINAL_VALUES,
+            }
         try:
-            item = self._convert_to_decimal(task_data)
-            
-            # 使用用户 ID 作为 Partition Key
-            item['userId'] = user_id
-            item['createdAt'] = f"TASK#{task_id}"
-            item['taskId'] = task_id
-            item['itemType'] = 'task'
-            
-            import time
-            item['ttl'] = int(time.time()) + 7200  # 2小时后过期
-            
-            self.table.put_item(Item=item)
+            self.table.put_item(Item=self._build_task_item(task_id, task_data, user_id), **condition)
+        except self.table.meta.client.exceptions.ConditionalCheckFailedException:
+            logger.debug("⏭️ 任务 %s 已进入终态，丢弃过期的进度快照", task_id)
         except Exception as e:
-            print(f"❌ 保存任务进度失败: {str(e)}")
+            logger.error("❌ 保存任务进度失败: %s", str(e))
+
+    def update_task_fields(self, task_id: str, task_data: dict, user_id: str = "TASK_SYSTEM") -> None:
+        """
+        只写入进度相关字段（UpdateItem），不重写整条任务记录
+        
+        任务记录不存在（如 TTL 已过期）时退回完整 PutItem；记录已是终态时丢弃本次写入
+        """
+        fields = self._convert_to_decimal({k: task_data[k] for k in TASK_PROGRESS_FIELDS if k in task_data})
+        condition = "attribute_exists(userId)"
+        names = {f"#{k}": k for k in fields}
+        values = {f":{k}": v for k, v in fields.items()}
+        if task_data.get("status") not in TERMINAL_TASK_STATUSES:
+            condition = f"{condition} AND {TASK_NOT_TERMINAL_CONDITION}"
+            names["#status"] = "status"
+            values.update(TASK_NOT_TERMINAL_VALUES)
+        try:
+            self.table.update_item(
+                Key={
+                    'userId': user_id,
+                    'createdAt': f"TASK#{task_id}"
+                },
+                UpdateExpression="SET " + ", ".join(f"#{k} = :{k}" for k in fields),
+                ConditionExpression=condition,
+                ExpressionAttributeNames=names,
+                ExpressionAttributeValues=values,
+                ReturnValuesOnConditionCheckFailure="ALL_OLD"
+            )
+        except self.table.meta.client.exceptions.ConditionalCheckFailedException as e:
+            if "Item" in e.response:
+                # 记录存在但已是终态：过期快照，丢弃
+                logger.debug("⏭️ 任务 %s 已进入终态，丢弃过期的进度更新", task_id)
+                return
+            self.save_task_progress(task_id, task_data, user_id=user_id)
+        except Exception as e:
+            logger.error("❌ 更新任务进度失败: %s", str(e))
+
+    def create_diary_and_complete_task(self, diary_item: dict, task_id: str, task_data: dict, user_id: str) -> None:
+        """
+        在一个 TransactWriteItems 中写入日记并把任务标记为完成
+        
+        完成阶段只需一次 DynamoDB 往返；两条记录要么都写入，要么都不写入
+        """
+        serializer = TypeSerializer()
+        table_name = self.table.table_name
+        transact_items = [
+            {"Put": {
+                "TableName": table_name,
+                "Item": {k: serializer.serialize(v) for k, v in item.items()}
+            }}
+            for item in (diary_item, self._build_task_item(task_id, task_data, user_id))
+        ]
+        try:
+            self.table.meta.client.transact_write_items(TransactItems=transact_items)
+        except Exception as e:
+            logger.error("❌ 保存日记并完成任务失败: %s", str(e))
+            raise
 
     def get_task_progress(self, task_id: str, user_id: str = "TASK_SYSTEM") -> Optional[dict]:
         """
@@ -493,7 +725,7 @@ class DynamoDBService:
             )
             return response.get('Item')
         except Exception as e:
-            print(f"❌ 获取任务进度失败: {str(e)}")
+            logger.error("❌ 获取任务进度失败: %s", str(e))
             return None
 
     def delete_task_progress(self, task_id: str, user_id: str = "TASK_SYSTEM") -> None:
@@ -508,4 +740,11 @@ class DynamoDBService:
                 }
             )
         except Exception as e:
-            print(f"❌ 删除任务进度失败: {str(e)}")
+            logger.error("❌ 删除任务进度失败: %s", str(e))
+
+
+# 🔥 单例：diary / auth / account 路由共用一个 boto3 resource 和连接池
+@lru_cache(maxsize=1)
+def get_dynamodb_service() -> DynamoDBService:
+    """获取 DynamoDB 服务单例"""
+    return DynamoDBService()
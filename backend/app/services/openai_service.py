@@ -14,19 +14,18 @@ AI 服务 - 混合模型优化版本
 3. 优雅但不炫技（Elegant but not showy）
 """
 
-import tempfile
 import os
 import json
 import asyncio  # 🔥 用于并行执行
 import re  # 用于文本处理
-import traceback  # 用于错误追踪
-from typing import Dict, Optional, List, Any
+from typing import Dict, Optional, List, Any, BinaryIO, Union
 from openai import OpenAI, AsyncOpenAI, APIError, RateLimitError, APIConnectionError
 import io
 import base64
 import requests
 import httpx  # ✅ 统一导入，用于异步 HTTP 请求
 import time as time_module
+from functools import lru_cache
 
 # ✅ Phase 1.4: 添加重试机制
 from tenacity import (
@@ -42,6 +41,28 @@ import logging
 logger = logging.getLogger(__name__)
 
 from ..config import get_settings
+from ..utils.concurrency import AdaptiveConcurrencyLimiter
+from ..utils.http_client import get_http_client
+
+# 🌍 Whisper 返回的语言（"en"/"english"/"zh"/"chinese"）→ 提示词语言名；提示词语言名 → 存库语言代码
+WHISPER_LANGUAGE_NAMES = {"en": "English", "english": "English", "zh": "Chinese", "chinese": "Chinese"}
+LANGUAGE_CODES = {"English": "en", "Chinese": "zh"}
+
+
+def resolve_language(whisper_detected_language: Optional[str], fallback: Optional[str] = None) -> Optional[str]:
+    """把 Whisper 检测结果映射为提示词语言名（English / Chinese），无法映射时返回 fallback"""
+    if whisper_detected_language:
+        name = WHISPER_LANGUAGE_NAMES.get(whisper_detected_language.lower())
+        if name:
+            return name
+    return fallback
+
+# 🚀 全局自适应并发：所有 Whisper / GPT 请求共享，遇到 429 自动减半并发，平稳后逐步恢复
+openai_limiter = AdaptiveConcurrencyLimiter(
+    initial_concurrency=8,
+    max_concurrency=64,
+    overload_exceptions=(RateLimitError,)
+)
 
 
 class OpenAIService:
@@ -72,6 +93,7 @@ class OpenAIService:
         "polish": "gpt-4o-mini",         # 润色 + 标题: 速度优先，优化提示词保证质量
         "emotion": "gpt-4o",             # 🔥 情绪分析: 准确度优先（影响情绪日历/幸福罐）
         "feedback": "gpt-4o-mini",       # 温暖反馈: 速度优先，优化提示词保证温度
+        "combined": "gpt-4o",            # 🔥 合并调用（润色+标题+情绪+反馈）: 情绪准确度优先
         
         # 🎤 为什么 Whisper？
         # ✅ OpenAI 官方语音转文字模型
@@ -131,8 +153,8 @@ class OpenAIService:
         # 预期性能提升：10秒 → 1-2秒
         http_client = httpx.AsyncClient(
             limits=httpx.Limits(
-                max_connections=50,           # 最大连接数
-                max_keepalive_connections=20, # 保持活跃连接数
+                max_connections=100,          # 最大连接数
+                max_keepalive_connections=50, # 保持活跃连接数（覆盖自适应并发上限附近的常驻连接）
                 keepalive_expiry=60.0         # 连接保持时间（秒）
             ),
             timeout=httpx.Timeout(
@@ -153,16 +175,17 @@ class OpenAIService:
         )
         self.openai_api_key = settings.openai_api_key
         
-        print(f"✅ AI 服务初始化完成（2026-01-30 连接池优化版）")
-        print(f"   - 连接池: max=50, keepalive=20, expiry=60s")
-        print(f"   - Whisper: 语音转文字")
-        print(f"   - gpt-4o-mini: 润色 + 标题 (polish)")
-        print(f"   - gpt-4o: 情绪分析 (emotion)")
-        print(f"   - gpt-4o-mini: AI 反馈 (feedback)")
+        logger.info("✅ AI 服务初始化完成（2026-01-30 连接池优化版）")
+        logger.debug("   - 连接池: max=100, keepalive=50, expiry=60s")
+        logger.debug("   - 自适应并发: 初始 %s, 上限 %s", openai_limiter.limit, openai_limiter.max_concurrency)
+        logger.debug("   - Whisper: 语音转文字")
+        logger.debug("   - gpt-4o-mini: 润色 + 标题 (polish)")
+        logger.debug("   - gpt-4o: 情绪分析 (emotion)")
+        logger.debug("   - gpt-4o-mini: AI 反馈 (feedback)")
 
     def _log_timing(self, label: str, start_time: float) -> None:
         elapsed = time_module.perf_counter() - start_time
-        print(f"⏱️ {label}: {elapsed:.2f} 秒")
+        logger.debug("⏱️ %s: %.2f 秒", label, elapsed)
     
     # ========================================================================
     # ✅ Phase 1.4: 带重试的 GPT-4o 调用辅助方法
@@ -199,25 +222,26 @@ class OpenAIService:
         """
         try:
             call_start = time_module.perf_counter()
-            if response_format:
-                response = await self.async_client.chat.completions.create(
-                    model=model,
-                    messages=messages,
-                    temperature=temperature,
-                    max_tokens=max_tokens,
-                    response_format=response_format
-                )
-            else:
-                response = await self.async_client.chat.completions.create(
-                    model=model,
-                    messages=messages,
-                    temperature=temperature,
-                    max_tokens=max_tokens
-                )
+            async with openai_limiter:
+                if response_format:
+                    response = await self.async_client.chat.completions.create(
+                        model=model,
+                        messages=messages,
+                        temperature=temperature,
+                        max_tokens=max_tokens,
+                        response_format=response_format
+                    )
+                else:
+                    response = await self.async_client.chat.completions.create(
+                        model=model,
+                        messages=messages,
+                        temperature=temperature,
+                        max_tokens=max_tokens
+                    )
             self._log_timing(f"GPT 调用完成 ({model})", call_start)
             return response
         except Exception as e:
-            print(f"⚠️ GPT-4o 调用失败，将重试: {type(e).__name__}: {str(e)}")
+            logger.warning("⚠️ GPT-4o 调用失败，将重试: %s: %s", type(e).__name__, str(e))
             raise  # 重新抛出，让 tenacity 处理重试
     
     # ========================================================================
@@ -226,7 +250,7 @@ class OpenAIService:
     
     async def transcribe_audio(
         self, 
-        audio_content: bytes, 
+        audio_content: Union[bytes, BinaryIO], 
         filename: str,
         expected_duration: Optional[int] = None
     ) -> str:
@@ -237,35 +261,29 @@ class OpenAIService:
         
         工作流程：
         1. 收到音频 → 检查大小
-        2. 创建临时文件 → 确保格式正确
-        3. 发送给 Whisper → 它是语音识别专家
-        4. 检查结果 → 确保不是空的
-        5. 清理临时文件 → 保持整洁
-        """
-        temp_file_path = None
+        2. 发送给 Whisper → 它是语音识别专家（文件对象直接流式上传，不再整体读入内存）
+        3. 检查结果 → 确保不是空的
         
+        audio_content 可以是 bytes，也可以是可 seek 的文件对象（如 UploadFile.file）
+        """
         try:
+            # 🔥 文件对象直接流式上传；bytes 只包一层 BytesIO（零拷贝重试）
+            if isinstance(audio_content, (bytes, bytearray)):
+                audio_stream = io.BytesIO(audio_content)
+            else:
+                audio_stream = audio_content
+            audio_stream.seek(0, os.SEEK_END)
+            audio_size_kb = audio_stream.tell() / 1024
+            
             # 检查音频大小
-            audio_size_kb = len(audio_content) / 1024
-            print(f"🎤 收到音频: {filename}, 大小: {audio_size_kb:.1f} KB")
+            logger.debug("🎤 收到音频: %s, 大小: %.1f KB", filename, audio_size_kb)
             
             if audio_size_kb < 1:
                 raise ValueError("音频文件太小，请说长一点")
             
-            # 准备临时文件
-            suffix = '.m4a' if not filename.endswith('.m4a') else ''
-            with tempfile.NamedTemporaryFile(
-                delete=False, 
-                suffix=suffix or os.path.splitext(filename)[1]
-            ) as temp_file:
-                temp_file.write(audio_content)
-                temp_file_path = temp_file.name
-            
-            print(f"✅ 临时文件准备完成")
-            
             # 🔥 Phase 2.0: 使用 AsyncOpenAI SDK 调用 Whisper（复用连接池）
             # ✅ 连接池优化：使用 self.async_client，避免每次创建新连接
-            print("📤 正在识别语音（verbose_json 模式 - SDK + 连接池）...")
+            logger.debug("📤 正在识别语音（verbose_json 模式 - SDK + 连接池）...")
             response_json = None
             max_retries = 3
             retry_delay = 2  # 秒
@@ -274,16 +292,16 @@ class OpenAIService:
             
             for attempt in range(max_retries):
                 try:
-                    # 🔥 使用 SDK 方法，复用连接池
-                    file_stream = io.BytesIO(audio_content)
-                    file_stream.name = filename or "recording.m4a"  # SDK 需要 name 属性
+                    # 🔥 使用 SDK 方法，复用连接池（每次重试前回到文件开头）
+                    audio_stream.seek(0)
                     
-                    transcription = await self.async_client.audio.transcriptions.create(
-                        model=self.MODEL_CONFIG["transcription"],
-                        file=file_stream,
-                        response_format="verbose_json",
-                        temperature=0,
-                    )
+                    async with openai_limiter:
+                        transcription = await self.async_client.audio.transcriptions.create(
+                            model=self.MODEL_CONFIG["transcription"],
+                            file=(filename or "recording.m4a", audio_stream),
+                            response_format="verbose_json",
+                            temperature=0,
+                        )
                     
                     # SDK 返回的是 TranscriptionVerbose 对象，转换为 dict
                     response_json = {
@@ -296,14 +314,14 @@ class OpenAIService:
                     }
                     
                     whisper_elapsed = time_module.time() - whisper_start_time
-                    print(f"⏱️ Whisper 转录完成，耗时: {whisper_elapsed:.2f} 秒")
+                    logger.debug("⏱️ Whisper 转录完成，耗时: %.2f 秒", whisper_elapsed)
                     break  # 成功，退出重试循环
                     
                 except (APIError, RateLimitError, APIConnectionError) as api_err:
                     # OpenAI API 错误
-                    print(f"❌ Whisper API 错误 (尝试 {attempt + 1}/{max_retries}): {type(api_err).__name__}: {api_err}")
+                    logger.error("❌ Whisper API 错误 (尝试 %s/%s): %s: %s", attempt + 1, max_retries, type(api_err).__name__, api_err)
                     if attempt < max_retries - 1:
-                        print(f"⏳ 等待 {retry_delay} 秒后重试...")
+                        logger.debug("⏳ 等待 %s 秒后重试...", retry_delay)
                         await asyncio.sleep(retry_delay)
                         retry_delay *= 2  # 指数退避
                     else:
@@ -311,9 +329,9 @@ class OpenAIService:
                         
                 except httpx.RequestError as transport_err:
                     # 网络传输错误
-                    print(f"❌ Whisper 网络传输错误 (尝试 {attempt + 1}/{max_retries}): {type(transport_err).__name__}: {transport_err}")
+                    logger.error("❌ Whisper 网络传输错误 (尝试 %s/%s): %s: %s", attempt + 1, max_retries, type(transport_err).__name__, transport_err)
                     if attempt < max_retries - 1:
-                        print(f"⏳ 等待 {retry_delay} 秒后重试...")
+                        logger.debug("⏳ 等待 %s 秒后重试...", retry_delay)
                         await asyncio.sleep(retry_delay)
                         retry_delay *= 2  # 指数退避
                     else:
@@ -321,9 +339,9 @@ class OpenAIService:
                         
                 except Exception as e:
                     # 其他错误
-                    print(f"❌ Whisper 未知错误 (尝试 {attempt + 1}/{max_retries}): {type(e).__name__}: {e}")
+                    logger.error("❌ Whisper 未知错误 (尝试 %s/%s): %s: %s", attempt + 1, max_retries, type(e).__name__, e)
                     if attempt < max_retries - 1:
-                        print(f"⏳ 等待 {retry_delay} 秒后重试...")
+                        logger.debug("⏳ 等待 %s 秒后重试...", retry_delay)
                         await asyncio.sleep(retry_delay)
                         retry_delay *= 2
                     else:
@@ -339,18 +357,18 @@ class OpenAIService:
             # 🔥 新增：语言白名单检查 - 防止背景音乐被误识别为韩语/日语等
             SUPPORTED_LANGUAGES = {"zh", "en", "chinese", "english"}
             if detected_language and detected_language not in SUPPORTED_LANGUAGES:
-                print(f"❌ 检测到不支持的语言: '{detected_language}'")
-                print(f"   识别文本: '{text[:100]}'")
-                print(f"   这可能是背景音乐或噪音被误识别")
+                logger.error("❌ 检测到不支持的语言: '%s'", detected_language)
+                logger.debug("   识别文本: '%s'", text[:100])
+                logger.debug("   这可能是背景音乐或噪音被误识别")
                 raise ValueError("TRANSCRIPTION_UNSUPPORTED_LANGUAGE")
             
             # 🔥 新增：检测韩语/日语字符 - 双重保险
             korean_chars = len(re.findall(r'[\uac00-\ud7af]', text))  # 韩语字符
             japanese_chars = len(re.findall(r'[\u3040-\u309f\u30a0-\u30ff]', text))  # 日语字符
             if korean_chars > 3 or japanese_chars > 3:
-                print(f"❌ 检测到韩语/日语字符: 韩语={korean_chars}, 日语={japanese_chars}")
-                print(f"   识别文本: '{text[:100]}'")
-                print(f"   这可能是背景音乐或噪音被误识别")
+                logger.error("❌ 检测到韩语/日语字符: 韩语=%s, 日语=%s", korean_chars, japanese_chars)
+                logger.debug("   识别文本: '%s'", text[:100])
+                logger.debug("   这可能是背景音乐或噪音被误识别")
                 raise ValueError("TRANSCRIPTION_UNSUPPORTED_LANGUAGE")
             
             # 🔥 新增：检测重复文本模式 - Whisper 幻觉的常见特征
@@ -368,15 +386,15 @@ class OpenAIService:
                 repetition_ratio = max_repetition / len(words) if len(words) > 0 else 0
                 
                 if repetition_ratio > 0.4:
-                    print(f"❌ 检测到高度重复的文本模式: 重复率={repetition_ratio:.1%}")
-                    print(f"   识别文本: '{text[:100]}'")
-                    print(f"   这可能是背景音乐或噪音被误识别")
+                    logger.error("❌ 检测到高度重复的文本模式: 重复率=%.1f%%", repetition_ratio * 100)
+                    logger.debug("   识别文本: '%s'", text[:100])
+                    logger.debug("   这可能是背景音乐或噪音被误识别")
                     raise ValueError("TRANSCRIPTION_CONTENT_TOO_SHORT")
             
             normalized_text = re.sub(r"\s+", "", text)
             
             if len(normalized_text) < self.LENGTH_LIMITS["min_audio_text"]:
-                print(f"❌ 转录内容过短: '{text}'")
+                logger.error("❌ 转录内容过短: '%s'", text)
                 raise ValueError("TRANSCRIPTION_CONTENT_TOO_SHORT")
             
             filler_tokens = {
@@ -403,8 +421,8 @@ class OpenAIService:
             
             unique_chars = len(set(normalized_text))
             if unique_chars <= 2 and len(normalized_text) > 2:
-                print(
-                    "❌ 转录结果包含大量重复字符，视为无效:",
+                logger.error(
+                    "❌ 转录结果包含大量重复字符，视为无效: %s",
                     {"text": text, "normalized": normalized_text},
                 )
                 raise ValueError("TRANSCRIPTION_CONTENT_TOO_SHORT")
@@ -478,8 +496,8 @@ class OpenAIService:
                     and (speech_ratio is None or speech_ratio < 0.15)
                     and total_confident_duration < 0.6
                 ):
-                    print(
-                        "❌ 检测到有效语音过少:",
+                    logger.error(
+                        "❌ 检测到有效语音过少: %s",
                         {
                             "expected_duration": expected_duration,
                             "total_confident_duration": total_confident_duration,
@@ -499,8 +517,8 @@ class OpenAIService:
                         len(cjk_chars) < 3
                         and len(normalized_text) < self.LENGTH_LIMITS["min_audio_text"]
                     ):
-                        print(
-                            "❌ 中文有效字符过少，判定为无意义内容:",
+                        logger.error(
+                            "❌ 中文有效字符过少，判定为无意义内容: %s",
                             {
                                 "cjk_chars": len(cjk_chars),
                                 "duration": reference_duration,
@@ -512,8 +530,8 @@ class OpenAIService:
                         len(meaningful_tokens) < 2
                         and len(normalized_text) < self.LENGTH_LIMITS["min_audio_text"] * 2
                     ):
-                        print(
-                            "❌ 有效词汇数量不足，判定为无意义内容:",
+                        logger.error(
+                            "❌ 有效词汇数量不足，判定为无意义内容: %s",
                             {
                                 "tokens": tokens,
                                 "meaningful_tokens": meaningful_tokens,
@@ -522,8 +540,8 @@ class OpenAIService:
                         )
                         raise ValueError("TRANSCRIPTION_CONTENT_TOO_SHORT")
             
-            print(f"✅ 语音识别成功: '{text[:50]}...'")
-            print(f"🌍 Whisper 检测到的语言: {detected_language}")
+            logger.info("✅ 语音识别成功: '%s...'", text[:50])
+            logger.debug("🌍 Whisper 检测到的语言: %s", detected_language)
             
             # 🔥 返回字典，包含文本和检测到的语言
             return {
@@ -532,7 +550,7 @@ class OpenAIService:
             }
             
         except Exception as e:
-            print(f"❌ 语音转文字失败: {str(e)}")
+            logger.error("❌ 语音转文字失败: %s", str(e))
             error_str = str(e)
             # ✅ 如果已经是 error code 格式，直接重新抛出
             if error_str.startswith("TRANSCRIPTION_"):
@@ -543,17 +561,8 @@ class OpenAIService:
                 raise ValueError("TRANSCRIPTION_FILE_TOO_LARGE")
             else:
                 # 记录详细错误用于调试，但返回通用 error code
-                print(f"📋 详细错误信息: {error_str}")
+                logger.debug("📋 详细错误信息: %s", error_str)
                 raise ValueError("TRANSCRIPTION_FAILED")
-        
-        finally:
-            # 清理临时文件
-            if temp_file_path and os.path.exists(temp_file_path):
-                try:
-                    os.unlink(temp_file_path)
-                    print(f"🧹 临时文件已清理")
-                except Exception as e:
-                    print(f"⚠️ 清理失败（不影响功能）: {e}")
     
     # ========================================================================
     # 🔥 核心改动：混合模型处理
@@ -594,23 +603,15 @@ class OpenAIService:
             if not text or not text.strip():
                 raise ValueError("内容为空")
             
-            print(f"✨ 开始AI处理（并行模式）: {text[:50]}...")
+            logger.debug("✨ 开始AI处理（并行模式）: %s...", text[:50])
             
-            # 🔥 优化语言检测：优先使用 Whisper 的检测结果
-            detected_lang = None
-            
-            # 方案1: 优先使用 Whisper 的检测结果（最准确）
-            if whisper_detected_language:
-                whisper_lang = whisper_detected_language.lower()
-                if whisper_lang in ["en", "english"]:
-                    detected_lang = "English"
-                    print(f"🌍 使用 Whisper 检测的语言: {whisper_detected_language} → English")
-                elif whisper_lang in ["zh", "chinese", "zh-cn", "zh-tw"]:
-                    detected_lang = "Chinese"
-                    print(f"🌍 使用 Whisper 检测的语言: {whisper_detected_language} → Chinese")
-                else:
-                    # 如果是其他语言，记录日志但继续使用统计检测
-                    print(f"⚠️ Whisper 检测到不支持的语言: {whisper_detected_language}，降级到统计检测")
+            # 🔥 优化语言检测：Whisper 已检测出语言时直接使用，不再做统计检测
+            detected_lang = resolve_language(whisper_detected_language)
+            if detected_lang:
+                logger.debug("🌍 使用 Whisper 检测的语言: %s → %s", whisper_detected_language, detected_lang)
+            elif whisper_detected_language:
+                # 如果是其他语言，记录日志但继续使用统计检测
+                logger.warning("⚠️ Whisper 检测到不支持的语言: %s，降级到统计检测", whisper_detected_language)
             
             # 方案2: 如果没有 Whisper 检测结果，使用统计检测（兜底）
             if not detected_lang:
@@ -622,7 +623,7 @@ class OpenAIService:
                 if not content_only:
                     # 如果只有空白和标点，默认使用英文（国际化优先）
                     detected_lang = "English"
-                    print(f"🌍 内容为空，默认使用: English")
+                    logger.debug("🌍 内容为空，默认使用: English")
                 else:
                     # 统计中文字符
                     chinese_chars = len(re.findall(r'[\u4e00-\u9fff]', content_only))
@@ -635,9 +636,9 @@ class OpenAIService:
                     
                     # 🔥 语言白名单检查：如果检测到大量非中英文字符，降级到英文（国际化优先）
                     if korean_chars > 5 or japanese_chars > 5:
-                        print(f"⚠️ 检测到非支持语言字符: 韩语={korean_chars}, 日语={japanese_chars}")
-                        print(f"   内容: '{text[:50]}'")
-                        print(f"   降级到系统默认语言: English")
+                        logger.warning("⚠️ 检测到非支持语言字符: 韩语=%s, 日语=%s", korean_chars, japanese_chars)
+                        logger.debug("   内容: '%s'", text[:50])
+                        logger.debug("   降级到系统默认语言: English")
                         detected_lang = "English"  # 降级到英文（国际化优先）
                     else:
                         # 计算中文字符占比
@@ -654,30 +655,30 @@ class OpenAIService:
                             # 🔥 修改默认值：优先英文（国际化优先）
                             detected_lang = "English" if chinese_chars < 3 else "Chinese"
                         
-                        print(f"🌍 统计检测语言: {detected_lang} (中文字符={chinese_chars}, 英文单词={english_words})")
+                        logger.debug("🌍 统计检测语言: %s (中文字符=%s, 英文单词=%s)", detected_lang, chinese_chars, english_words)
             
-            print(f"🌍 最终使用语言: {detected_lang}")
+            logger.debug("🌍 最终使用语言: %s", detected_lang)
             
             # 🔥 关键改动：Agent Orchestration架构
             # 策略: Polish独立并行 | Emotion & Feedback 并行
-            print(f"🚀 启动最优Agent并行架构...")
+            logger.debug("🚀 启动最优Agent并行架构...")
             if image_urls and len(image_urls) > 0:
-                print(f"   - 检测到 {len(image_urls)} 张图片，将使用 Vision 能力分析图片+文字")
-            print(f"   - 并行组1: Polish Agent (独立运行)")
-            print(f"   - 并行组2: Emotion Agent (独立)")
-            print(f"   - 并行组3: Feedback Agent (独立)")
-            print(f"   - 🎯 三组并行,总耗时 = max(Polish, Emotion, Feedback)")
+                logger.debug("   - 检测到 %s 张图片，将使用 Vision 能力分析图片+文字", len(image_urls))
+            logger.debug("   - 并行组1: Polish Agent (独立运行)")
+            logger.debug("   - 并行组2: Emotion Agent (独立)")
+            logger.debug("   - 并行组3: Feedback Agent (独立)")
+            logger.debug("   - 🎯 三组并行,总耗时 = max(Polish, Emotion, Feedback)")
             
             # 🔥 性能优化：预先下载并编码所有图片，避免在并行任务中重复下载
             encoded_images = []
             if image_urls and len(image_urls) > 0:
-                print(f"🖼️ 预处理 {len(image_urls)} 张图片...")
+                logger.debug("🖼️ 预处理 %s 张图片...", len(image_urls))
                 # 并行下载图片
                 download_tasks = [self._download_and_encode_image(url) for url in image_urls]
                 results = await asyncio.gather(*download_tasks, return_exceptions=True)
                 for i, img_data in enumerate(results):
                     if isinstance(img_data, Exception):
-                        print(f"⚠️ 图片下载失败 ({image_urls[i]}): {img_data}")
+                        logger.warning("⚠️ 图片下载失败 (%s): %s", image_urls[i], img_data)
                     else:
                         encoded_images.append(img_data)
             
@@ -697,7 +698,7 @@ class OpenAIService:
             )
             
             # 🔥 三组并行执行 - ✅ 关键修复：添加 return_exceptions=True
-            print(f"   🚀 启动三组并行...")
+            logger.debug("   🚀 启动三组并行...")
             results = await asyncio.gather(
                 polish_task,                # 组1: Polish独立
                 emotion_task,               # 组2: Emotion
@@ -712,8 +713,8 @@ class OpenAIService:
             
             # 处理Polish结果
             if isinstance(polish_result, Exception):
-                print(f"❌ Polish Agent失败: {polish_result}")
-                print(f"   使用兜底：原文 + 默认标题")
+                logger.error("❌ Polish Agent失败: %s", polish_result)
+                logger.debug("   使用兜底：原文 + 默认标题")
                 # 🔥 修复：兜底标题也不能用"今日记录"，使用"心情随记"
                 polish_result = {
                     "title": "心情随记" if detected_lang == "Chinese" else "A Moment Captured",
@@ -722,26 +723,26 @@ class OpenAIService:
             
             # 处理Emotion结果
             if isinstance(emotion_result, Exception):
-                print(f"❌ Emotion Agent失败: {emotion_result}")
+                logger.error("❌ Emotion Agent失败: %s", emotion_result)
                 emotion_result = {"emotion": "Thoughtful", "confidence": 0.5, "rationale": "默认情绪"}
 
             # 处理Feedback结果
             if isinstance(feedback_data, Exception):
-                print(f"❌ Feedback Agent失败: {feedback_data}")
+                logger.error("❌ Feedback Agent失败: %s", feedback_data)
                 feedback_data = "感谢分享你的故事。" if detected_lang == "Chinese" else "Thanks for sharing your story."
                 if user_name:
                     separator = "，" if detected_lang == "Chinese" else ", "
                     feedback_data = f"{user_name}{separator}{feedback_data}"
 
-            print(f"✅ 三组并行完成")
+            logger.info("✅ 三组并行完成")
             
             # 🔥 最终兜底检查：确保变量不为None
             if emotion_result is None:
-                print(f"⚠️ emotion_result为None，使用默认值")
+                logger.warning("⚠️ emotion_result为None，使用默认值")
                 emotion_result = {"emotion": "Thoughtful", "confidence": 0.5, "rationale": "默认情绪"}
             
             if feedback_data is None:
-                print(f"⚠️ feedback_data为None，使用默认值")
+                logger.warning("⚠️ feedback_data为None，使用默认值")
                 feedback_data = "感谢分享你的故事。" if detected_lang == "Chinese" else "Thanks for sharing your story."
                 if user_name:
                     separator = "，" if detected_lang == "Chinese" else ", "
@@ -763,30 +764,29 @@ class OpenAIService:
             
             # 质量检查 - ✅ 修复: 传递 user_name 以支持反馈降级时添加用户称呼
             result = self._validate_and_fix_result(result, text, user_name=user_name)
+            # 🌍 语言由调用方确定（Whisper / 统计检测），不依赖模型输出
+            result["language"] = LANGUAGE_CODES.get(detected_lang, "zh")
             
             ai_total_elapsed = time_module.time() - ai_total_start
-            print(f"✅ 处理完成:")
-            print(f"  - 标题: {result['title']}")
-            print(f"  - 内容长度: {len(result['polished_content'])} 字")
-            print(f"  - 反馈长度: {len(result['feedback'])} 字")
-            print(f"  - 情绪: {result.get('emotion_data', {}).get('emotion', 'Unknown')}")
-            print(f"  ⏱️ AI 总耗时: {ai_total_elapsed:.2f} 秒")
+            logger.info("✅ 处理完成:")
+            logger.debug("  - 标题: %s", result['title'])
+            logger.debug("  - 内容长度: %s 字", len(result['polished_content']))
+            logger.debug("  - 反馈长度: %s 字", len(result['feedback']))
+            logger.debug("  - 情绪: %s", result.get('emotion_data', {}).get('emotion', 'Unknown'))
+            logger.debug("  ⏱️ AI 总耗时: %.2f 秒", ai_total_elapsed)
             
             return result
         
         except Exception as e:
             error_type = type(e).__name__
             error_msg = str(e)
-            print(f"❌ AI处理失败: {error_type}: {error_msg}")
-            error_trace = traceback.format_exc()
-            print(f"📍 完整错误堆栈:")
-            print(error_trace)
+            logger.exception("❌ AI处理失败: %s: %s", error_type, error_msg)
             
             # 检查是否是并行任务中的错误
             if isinstance(e, (asyncio.TimeoutError, asyncio.CancelledError)):
-                print(f"⚠️ 并行任务超时或取消")
+                logger.warning("⚠️ 并行任务超时或取消")
             elif isinstance(e, Exception):
-                print(f"⚠️ 并行任务执行失败: {e}")
+                logger.warning("⚠️ 并行任务执行失败: %s", e)
             
             return self._create_fallback_result(text, user_name=user_name)
     
@@ -818,7 +818,7 @@ class OpenAIService:
             }
         """
         try:
-            print(f"🎨 GPT-4o: 开始润色和生成标题...")
+            logger.debug("🎨 GPT-4o: 开始润色和生成标题...")
             
             # 🔥 优化：根据传入的 language 参数构建更严格的 prompt
             # 核心原则：标题语言必须与用户输入内容的主要语言完全一致
@@ -1066,7 +1066,7 @@ Output: {{"title": "Tired but Determined", "polished_content": "Today I was real
             
             # 如果有图片，添加图片到消息中（使用vision能力）
             if encoded_images and len(encoded_images) > 0:
-                print(f"🖼️ 添加 {len(encoded_images)} 张图片到 Vision 请求 (Low-res 模式)...")
+                logger.debug("🖼️ 添加 %s 张图片到 Vision 请求 (Low-res 模式)...", len(encoded_images))
                 for image_data in encoded_images:
                     user_content.append({
                         "type": "image_url",
@@ -1098,12 +1098,12 @@ Output: {{"title": "Tired but Determined", "polished_content": "Today I was real
             # 但不要超过 OpenAI 的限制（GPT-4o-mini 支持 16384 tokens）
             max_tokens = min(max_tokens, 16000)
             
-            print(f"📤 GPT-4o-mini: 发送请求到 OpenAI...")
-            print(f"   模型: {self.MODEL_CONFIG['polish']}")
-            print(f"   原始文本长度: {original_length} 字符")
-            print(f"   图片数量: {len(encoded_images) if encoded_images else 0}")
-            print(f"   估算输出长度: {estimated_output_length} 字符")
-            print(f"   设置 max_tokens: {max_tokens}")
+            logger.debug("📤 GPT-4o-mini: 发送请求到 OpenAI...")
+            logger.debug("   模型: %s", self.MODEL_CONFIG['polish'])
+            logger.debug("   原始文本长度: %s 字符", original_length)
+            logger.debug("   图片数量: %s", len(encoded_images) if encoded_images else 0)
+            logger.debug("   估算输出长度: %s 字符", estimated_output_length)
+            logger.debug("   设置 max_tokens: %s", max_tokens)
             
             # 构建消息
             if encoded_images and len(encoded_images) > 0:
@@ -1134,8 +1134,8 @@ Output: {{"title": "Tired but Determined", "polished_content": "Today I was real
             if not content:
                 raise ValueError("OpenAI 返回空响应")
             
-            print(f"✅ GPT-4o-mini: 收到响应")
-            print(f"📝 GPT-4o-mini: 响应内容长度: {len(content)} 字符")
+            logger.info("✅ GPT-4o-mini: 收到响应")
+            logger.debug("📝 GPT-4o-mini: 响应内容长度: %s 字符", len(content))
             
             # 解析 JSON
             try:
@@ -1147,8 +1147,8 @@ Output: {{"title": "Tired but Determined", "polished_content": "Today I was real
                 polished_length = len(polished_content)
                 length_ratio = polished_length / original_length if original_length > 0 else 0
                 
-                print(f"✅ GPT-4o-mini: 润色完成")
-                print(f"📊 长度对比: 原始={original_length} 字符, 润色后={polished_length} 字符, 比例={length_ratio:.2%}")
+                logger.info("✅ GPT-4o-mini: 润色完成")
+                logger.debug("📊 长度对比: 原始=%s 字符, 润色后=%s 字符, 比例=%.2f%%", original_length, polished_length, length_ratio * 100)
                 
                 # 🔥 2026-01-27 优化：移除长度比较检查
                 # 
@@ -1164,18 +1164,18 @@ Output: {{"title": "Tired but Determined", "polished_content": "Today I was real
                 # 🔥 后处理：确保内容不以标题开头（避免重复）
                 title = result.get("title", "A Moment Captured")
                 if polished_content.strip().startswith(title):
-                    print(f"⚠️ 检测到内容以标题开头，自动移除重复")
+                    logger.warning("⚠️ 检测到内容以标题开头，自动移除重复")
                     # 移除标题和可能的换行符
                     polished_content = polished_content.strip()[len(title):].lstrip('\n').lstrip()
-                    print(f"   移除后内容开头: {polished_content[:50]}...")
+                    logger.debug("   移除后内容开头: %s...", polished_content[:50])
                 
                 return {
                     "title": title,
                     "polished_content": polished_content
                 }
             except json.JSONDecodeError as e:
-                print(f"⚠️ GPT-4o-mini: JSON 解析失败: {e}")
-                print(f"   原始响应: {content[:200]}...")
+                logger.warning("⚠️ GPT-4o-mini: JSON 解析失败: %s", e)
+                logger.debug("   原始响应: %s...", content[:200])
                 # 尝试从文本中提取 JSON
                 json_match = re.search(r'\{.*?"title".*?"polished_content".*?\}', content, re.DOTALL)
                 if json_match:
@@ -1189,7 +1189,7 @@ Output: {{"title": "Tired but Determined", "polished_content": "Today I was real
                         pass
                 
                 # 降级方案
-                print(f"⚠️ GPT-4o-mini: 使用降级方案")
+                logger.warning("⚠️ GPT-4o-mini: 使用降级方案")
                 return {
                     "title": "A Moment Captured" if language == "English" else "心情随记",
                     "polished_content": text
@@ -1198,21 +1198,16 @@ Output: {{"title": "Tired but Determined", "polished_content": "Today I was real
         except Exception as e:
             error_type = type(e).__name__
             error_msg = str(e)
-            print(f"❌ GPT-4o-mini 调用失败: {error_type}: {error_msg}")
-            
-            # 详细错误信息
-            error_trace = traceback.format_exc()
-            print(f"📍 GPT-4o-mini 完整错误堆栈:")
-            print(error_trace)
+            logger.exception("❌ GPT-4o-mini 调用失败: %s: %s", error_type, error_msg)
             
             # 检查常见错误类型
             if "RateLimitError" in error_type or "rate_limit" in error_msg.lower():
-                print(f"⚠️ OpenAI API 限流: 请求频率过高")
-                print(f"💡 建议: 稍后重试，或检查 OpenAI 账户的配额限制")
+                logger.warning("⚠️ OpenAI API 限流: 请求频率过高")
+                logger.debug("💡 建议: 稍后重试，或检查 OpenAI 账户的配额限制")
             elif "AuthenticationError" in error_type or "InvalidApiKey" in error_type:
-                print(f"⚠️ OpenAI API Key 错误: 请检查 OPENAI_API_KEY 环境变量")
+                logger.warning("⚠️ OpenAI API Key 错误: 请检查 OPENAI_API_KEY 环境变量")
             elif "APIConnectionError" in error_type:
-                print(f"⚠️ OpenAI API 连接错误: 请检查网络连接")
+                logger.warning("⚠️ OpenAI API 连接错误: 请检查网络连接")
             
             # 降级方案
             return {
@@ -1258,9 +1253,9 @@ Output: {{"title": "Tired but Determined", "polished_content": "Today I was real
                 emotion_from_agent = "Auto"
                 emotion_rationale = ""
             
-            print(f"💬 GPT-4o-mini: 开始生成反馈...")
-            print(f"👤 用户名字: {user_name if user_name else '未提供'}")
-            print(f"🎯 使用 Emotion Agent 分析结果: {emotion_from_agent}")
+            logger.debug("💬 GPT-4o-mini: 开始生成反馈...")
+            logger.debug("👤 用户名字: %s", user_name if user_name else '未提供')
+            logger.debug("🎯 使用 Emotion Agent 分析结果: %s", emotion_from_agent)
             
             # ============================================================================
             # 🔥 动态长度计算 - 根据用户输入调整反馈长度
@@ -1281,7 +1276,7 @@ Output: {{"title": "Tired but Determined", "polished_content": "Today I was real
                 length_guidance = "EXTENDED"
                 length_desc = "2-3 sentences max"
             
-            print(f"📏 用户输入长度: {user_text_length} 字符 → 反馈策略: {length_guidance} ({length_desc})")
+            logger.debug("📏 用户输入长度: %s 字符 → 反馈策略: %s (%s)", user_text_length, length_guidance, length_desc)
             
             # ============================================================================
             # 🎯 GPT-4o-mini 优化版 Feedback 提示词 (2026-01-27 v3)
@@ -1309,7 +1304,7 @@ Context:
 - Response mode: {length_guidance} → {length_desc}
 
 Rules:
-- Same language as user (fallback: {language})
+- {f"Respond in {language} only" if language in LANGUAGE_CODES else f"Same language as user (fallback: {language})"}
 - {("Start with '"+user_name+("，" if language=="Chinese" else ", ")+"'") if user_name else "Start directly"}
 - No questions
 - Be specific to what they said
@@ -1356,10 +1351,10 @@ Output JSON only:
                 reply = result.get("reply", "").strip()
                 
                 # ✅ 添加调试日志
-                print(f"🔍 [DEBUG] 名字前缀检查:")
-                print(f"   user_name 参数: '{user_name}'")
-                print(f"   AI 原始回复: '{reply}'")
-                print(f"   使用情绪: {emotion_from_agent}")
+                logger.debug("🔍 [DEBUG] 名字前缀检查:")
+                logger.debug("   user_name 参数: '%s'", user_name)
+                logger.debug("   AI 原始回复: '%s'", reply)
+                logger.debug("   使用情绪: %s", emotion_from_agent)
                 
                 # 名字前缀检查
                 if user_name and user_name.strip():
@@ -1369,15 +1364,15 @@ Output JSON only:
                         separator = "，" if has_cjk else ", "
                         reply = f"{user_name}{separator}{trimmed_reply}"
                 
-                print(f"✅ 反馈生成: {reply[:30]}... (基于情绪: {emotion_from_agent})")
+                logger.info("✅ 反馈生成: %s... (基于情绪: %s)", reply[:30], emotion_from_agent)
                 return reply  # 🔥 直接返回字符串，情绪已经由 Emotion Agent 提供
                 
             except json.JSONDecodeError:
-                print("⚠️ JSON 解析失败，回退到纯文本处理")
+                logger.warning("⚠️ JSON 解析失败，回退到纯文本处理")
                 return content.strip()  # 🔥 直接返回纯文本
         
         except Exception as e:
-            print(f"❌ 反馈生成失败: {e}")
+            logger.error("❌ 反馈生成失败: %s", e)
             fallback_reply = "感谢分享你的这一刻。" if language == "Chinese" else "Thanks for sharing this moment."
             
             # ✅ 即使在失败的情况下，也尽量带上用户名字
@@ -1414,7 +1409,7 @@ Output JSON only:
             }
         """
         try:
-            print(f"🎯 Emotion Agent: 开始专业情绪分析...")
+            logger.debug("🎯 Emotion Agent: 开始专业情绪分析...")
             
             # ✅ Phase 1-3 优化: 对比表格 + 边缘案例 + Few-Shot + 温度0.3 + gpt-4o
             system_prompt = f"""You are an expert emotion analyst specializing in psychological assessment.
@@ -1553,7 +1548,7 @@ Response Format (JSON):
             
             # 如果有图片,添加图片
             if encoded_images and len(encoded_images) > 0:
-                print(f"🖼️ 添加 {len(encoded_images)} 张图片到情绪分析...")
+                logger.debug("🖼️ 添加 %s 张图片到情绪分析...", len(encoded_images))
                 for image_data in encoded_images:
                     user_content.append({
                         "type": "image_url",
@@ -1585,21 +1580,149 @@ Response Format (JSON):
             
             result = json.loads(response.choices[0].message.content)
             
-            print(f"✅ Emotion Agent 分析完成:")
-            print(f"   - 情绪: {result.get('emotion')}")
-            print(f"   - 置信度: {result.get('confidence')}")
-            print(f"   - 理由: {result.get('rationale')[:50]}...")
+            logger.info("✅ Emotion Agent 分析完成:")
+            logger.debug("   - 情绪: %s", result.get('emotion'))
+            logger.debug("   - 置信度: %s", result.get('confidence'))
+            logger.debug("   - 理由: %s...", result.get('rationale')[:50])
             
             return result
             
         except Exception as e:
-            print(f"❌ Emotion Agent 失败: {str(e)}")
+            logger.error("❌ Emotion Agent 失败: %s", str(e))
             # 返回默认值
             return {
                 "emotion": "Thoughtful",
                 "confidence": 0.5,
                 "rationale": "分析失败,使用默认情绪"
             }
+    
+    # ========================================================================
+    # 🔥 合并调用: 润色 + 标题 + 情绪 + 反馈 (一次请求完成)
+    # ========================================================================
+    
+    async def polish_emotion_feedback_combined(
+        self,
+        text: str,
+        language: str,
+        user_name: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """
+        一次 GPT-4o 调用同时完成润色、标题、情绪分析和温暖反馈
+        
+        相比三路并行（Polish | Emotion | Feedback）：
+        - 转录文本和系统提示只发送一次，输入 token 约减少 2/3
+        - 只有一次网络往返，不再受最慢 Agent 的长尾影响
+        
+        返回:
+            {
+                "polish": {"title": "...", "polished_content": "..."},
+                "emotion": {"emotion": "...", "confidence": 0.9, "rationale": "..."},
+                "feedback": "温暖的反馈文字"
+            }
+        
+        任何错误都会抛出，由调用方决定兜底策略
+        """
+        logger.debug("🧩 Combined Agent: 润色 + 标题 + 情绪 + 反馈 一次完成...")
+        
+        user_text_length = len(text.strip())
+        if user_text_length < 50:
+            length_desc = "1 sentence only"
+        elif user_text_length < 200:
+            length_desc = "1-2 sentences"
+        elif user_text_length < 600:
+            length_desc = "2 sentences max"
+        else:
+            length_desc = "2-3 sentences max"
+        
+        name_rule = (
+            f"Start with '{user_name}{'，' if language == 'Chinese' else ', '}'"
+            if user_name else "Start directly"
+        )
+        
+        system_prompt = f"""You are a professional diary editor, an expert emotion analyst and a warm companion.
+Complete ALL FOUR tasks below for the user's diary entry and return ONE JSON object.
+
+🎯 Respond in {language} only (title, polished_content and reply)
+
+## Task 1 - polished_content
+- Remove fillers (嗯、啊、那个、就是、然后 / um, uh, like, you know); fix grammar; add punctuation
+- Preserve ALL content and emotion; never add information; length ≤ 115% of original
+- For content > 100 characters add paragraph breaks (\\n\\n) on topic/time/emotion shifts
+- MUST NOT start with the title text
+
+## Task 2 - title
+- Core theme or key event, 4-12 Chinese chars or 3-8 English words
+- FORBIDDEN: "今日记录"、"今日感想"、any title starting with "今日" / "Today's"
+
+## Task 3 - emotion (pick exactly ONE of 24)
+Positive: Joyful, Grateful, Fulfilled, Proud, Surprised, Excited, Loved, Peaceful, Hopeful
+Neutral: Thoughtful, Reflective, Intentional, Inspired, Curious, Nostalgic, Calm
+Negative: Uncertain, Misunderstood, Lonely, Down, Anxious, Overwhelmed, Venting, Frustrated
+- Fulfilled=achievement vs Joyful=pure happiness; Loved=receiving care vs Grateful=expressing thanks
+- Anxious=worry about future vs Overwhelmed=too much now; Down=sadness vs Frustrated=anger
+- Short/neutral/unclear text → Thoughtful (0.4-0.6); mixed → dominant emotion
+- confidence in [0.4, 1.0]; rationale: one short sentence
+
+## Task 4 - reply (warm feedback)
+- Empathetic and specific to what they said, based on the emotion from Task 3
+- {name_rule}; no questions; {length_desc}
+
+Output JSON only:
+{{
+  "title": "...",
+  "polished_content": "...",
+  "emotion": "Fulfilled",
+  "confidence": 0.9,
+  "rationale": "...",
+  "reply": "..."
+}}"""
+        
+        messages = [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": f"Diary entry:\n\n{text}"}
+        ]
+        
+        # 润色内容 + 标题 + 情绪 + 反馈 + JSON 开销
+        estimated_output_length = int(len(text) * 1.15) + 50 + 100 + 500 + 500
+        max_tokens = min(max(2000, estimated_output_length), 16000)
+        
+        response = await self._call_gpt4o_with_retry(
+            model=self.MODEL_CONFIG["combined"],
+            messages=messages,
+            temperature=0.3,
+            max_tokens=max_tokens,
+            response_format={"type": "json_object"}
+        )
+        
+        content = response.choices[0].message.content
+        if not content:
+            raise ValueError("OpenAI 返回空响应")
+        result = json.loads(content)
+        
+        title = (result.get("title") or "").strip() or ("心情随记" if language == "Chinese" else "A Moment Captured")
+        polished_content = (result.get("polished_content") or "").strip() or text
+        # 🔥 后处理：确保内容不以标题开头（避免重复）
+        if polished_content.startswith(title):
+            polished_content = polished_content[len(title):].lstrip('\n').lstrip() or text
+        
+        reply = (result.get("reply") or "").strip()
+        if user_name and user_name.strip() and reply and not reply.lower().startswith(user_name.lower()):
+            has_cjk = bool(re.search(r'[\u4e00-\u9fff]', reply))
+            reply = f"{user_name}{'，' if has_cjk else ', '}{reply}"
+        
+        emotion = {
+            "emotion": result.get("emotion") or "Thoughtful",
+            "confidence": result.get("confidence", 0.5),
+            "rationale": result.get("rationale", "")
+        }
+        
+        logger.info("✅ Combined Agent 完成: 标题=%s, 情绪=%s", title, emotion['emotion'])
+        return {
+            "polish": {"title": title, "polished_content": polished_content},
+            "emotion": emotion,
+            "feedback": reply
+        }
+    
     # ========================================================================
     # 验证和降级逻辑（保持不变）
     # ========================================================================
@@ -1625,7 +1748,7 @@ Response Format (JSON):
         chinese_chars = len(re.findall(r'[\u4e00-\u9fff]', original_text))
         is_chinese = chinese_chars > len(original_text) * 0.2
         
-        print(f"📊 原文语言检测: 总长度={len(original_text)}, 中文字符={chinese_chars}, 判定={'中文' if is_chinese else '英文'}")
+        logger.debug("📊 原文语言检测: 总长度=%s, 中文字符=%s, 判定=%s", len(original_text), chinese_chars, '中文' if is_chinese else '英文')
         
         # 提取各部分
         title = (result.get("title", "") or "").strip()
@@ -1649,18 +1772,18 @@ Response Format (JSON):
                 # 检查是否是混合语言（例如："Project 完成"）
                 # 如果标题中有至少一个中文字符，就认为是正常的
                 title_language_mismatch = True
-                print(f"⚠️ 标题语言不一致！用户输入是中文，但标题是纯英文: '{title}'")
+                logger.warning("⚠️ 标题语言不一致！用户输入是中文，但标题是纯英文: '%s'", title)
         else:
             # 用户输入是英文，但标题100%是中文（没有一个英文字符）
             if not title_has_english and title_has_chinese and len(title) > 3:
                 title_language_mismatch = True
-                print(f"⚠️ 标题语言不一致！用户输入是英文，但标题是纯中文: '{title}'")
+                logger.warning("⚠️ 标题语言不一致！用户输入是英文，但标题是纯中文: '%s'", title)
         
         if title_language_mismatch:
             # 使用降级方案，确保语言一致
             title = "心情随记" if is_chinese else "A Moment Captured"
             used_fallback = True
-            print(f"✅ 已修正标题为: '{title}'")
+            logger.info("✅ 已修正标题为: '%s'", title)
         
         # 🔥 优化：反馈语言检查 - 更宽容的逻辑
         # 只有在反馈与原文语言完全相反时才fallback
@@ -1669,15 +1792,15 @@ Response Format (JSON):
             # 用户是中文，但反馈是纯英文（没有一个中文字符，但有英文）
             if not feedback_has_chinese and feedback_has_english and len(feedback) > 10:
                 feedback_language_mismatch = True
-                print(f"⚠️ 反馈语言不一致！用户输入是中文，但反馈是纯英文: '{feedback[:50]}'")
+                logger.warning("⚠️ 反馈语言不一致！用户输入是中文，但反馈是纯英文: '%s'", feedback[:50])
         else:
             # 用户是英文，但反馈是纯中文（没有一个英文字符，但有中文）
             if not feedback_has_english and feedback_has_chinese and len(feedback) > 10:
                 feedback_language_mismatch = True
-                print(f"⚠️ 反馈语言不一致！用户输入是英文，但反馈是纯中文: '{feedback[:50]}'")
+                logger.warning("⚠️ 反馈语言不一致！用户输入是英文，但反馈是纯中文: '%s'", feedback[:50])
         
         if feedback_language_mismatch:
-            print(f"⚠️ 使用语言不一致 fallback")
+            logger.warning("⚠️ 使用语言不一致 fallback")
             feedback = "感谢分享你的这一刻。" if is_chinese else "Thanks for sharing this moment."
             # ✅ 即使是 fallback，也要加上用户名字
             if user_name and user_name.strip():
@@ -1817,16 +1940,16 @@ Response Format (JSON):
         max_polished_len = int(orig_len * self.LENGTH_LIMITS["polished_ratio"])
         
         # ✅ 添加长度检查日志
-        print(f"📊 润色内容验证: 原始长度={orig_len}, 润色后长度={len(polished)}, 最大允许长度={max_polished_len}")
+        logger.debug("📊 润色内容验证: 原始长度=%s, 润色后长度=%s, 最大允许长度=%s", orig_len, len(polished), max_polished_len)
         
         # ⚠️ 如果润色后内容明显少于原始内容（小于80%），可能是被截断了，使用原始内容
         if len(polished) < orig_len * 0.8:
-            print(f"⚠️ 警告：润色后内容明显少于原始内容（{len(polished)} < {orig_len * 0.8}），使用原始内容")
+            logger.warning("⚠️ 警告：润色后内容明显少于原始内容（%s < %s），使用原始内容", len(polished), orig_len * 0.8)
             polished = original_text.strip()
         
         # 只有在超过最大长度时才截断（但这种情况不应该发生，因为提示词要求≤115%）
         if len(polished) > max_polished_len:
-            print(f"⚠️ 润色后内容超过最大长度（{len(polished)} > {max_polished_len}），按完整句子截断")
+            logger.warning("⚠️ 润色后内容超过最大长度（%s > %s），按完整句子截断", len(polished), max_polished_len)
             polished = trim_to_complete_sentences(polished, max_polished_len)
         
         # 修正反馈
@@ -1835,7 +1958,7 @@ Response Format (JSON):
         # ✅ 修复 #9 (2026-01-27): 移除最小长度检查，只检查空值
         # 原因：短反馈可能是最合适的回复，不应被通用 fallback 替换
         if not feedback or not feedback.strip():
-            print(f"⚠️ 反馈为空，使用降级")
+            logger.warning("⚠️ 反馈为空，使用降级")
             feedback = "感谢分享你的这一刻。" if is_chinese else "Thanks for sharing this moment."
         
         # ✅ 确保反馈始终以用户名开头（无论是 AI 生成还是 fallback）
@@ -1846,7 +1969,7 @@ Response Format (JSON):
                 feedback = f"{user_name}{separator}{feedback}"
         
         if len(feedback) > self.LENGTH_LIMITS["feedback_max"]:
-            print(f"📏 反馈过长，按完整句子截断")
+            logger.debug("📏 反馈过长，按完整句子截断")
             feedback = trim_to_complete_sentences(feedback, self.LENGTH_LIMITS["feedback_max"])
         
         is_english = any(ord(c) < 128 for c in original_text[:50])
@@ -1864,7 +1987,7 @@ Response Format (JSON):
         创建降级结果
         """
         
-        print(f"⚠️ 使用降级方案 (user_name={user_name})")
+        logger.warning("⚠️ 使用降级方案 (user_name=%s)", user_name)
         
         chinese_chars = len(re.findall(r'[\u4e00-\u9fff]', text))
         is_chinese = chinese_chars > len(text) * 0.2
@@ -1911,23 +2034,37 @@ Response Format (JSON):
             base64编码的图片数据
         """
         try:
-            print(f"📥 下载图片: {image_url[:50]}...")
+            logger.debug("📥 下载图片: %s...", image_url[:50])
             
             # ✅ Phase 1.1: 使用 httpx.AsyncClient 异步下载（提升性能）
-            async with httpx.AsyncClient(timeout=10.0) as client:
-                response = await client.get(image_url)
-                response.raise_for_status()
+            # 🔥 复用共享连接池，避免每张图片都重新握手
+            response = await get_http_client().get(image_url, timeout=10.0)
+            response.raise_for_status()
             
             # 转换为base64
             image_base64 = base64.b64encode(response.content).decode('utf-8')
             
-            print(f"✅ 图片下载并编码完成，大小: {len(image_base64)} 字符")
+            logger.info("✅ 图片下载并编码完成，大小: %s 字符", len(image_base64))
             return image_base64
             
         except Exception as e:
-            print(f"❌ 下载图片失败: {e}")
+            logger.error("❌ 下载图片失败: %s", e)
             raise
 
+# 🔥 单例模式：确保连接池在 Lambda 容器生命周期内复用
+@lru_cache(maxsize=1)
+def get_openai_service() -> OpenAIService:
+    """
+    获取 OpenAI 服务单例实例
+    
+    🔥 连接池优化关键：
+    - 整个进程共享一个 AsyncOpenAI + httpx 连接池，keep-alive 连接跨请求复用
+    - 在 Lambda 冷启动（lambda_handler 导入时）或本地 startup 事件中预先创建，首个请求不再付初始化成本
+    - 配合 EventBridge 5 分钟 warmup，可以保持热连接
+    """
+    return OpenAIService()
+
+
 # 🎯 使用示例
 """
 # 1. 初始化服务
@@ -7,12 +7,35 @@ S3文件上传服务
 - 生成预签名URL用于直传
 """
 
+import asyncio
 import boto3
+from botocore.config import Config
 from ..config import get_settings, get_boto3_kwargs
 from urllib.parse import urlparse
-from typing import List
+from typing import List, Union
 import uuid
+from functools import lru_cache
 from typing import BinaryIO
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+# ✅ 并发上传上限：防止大量语音日记同时上传时占满线程池和内存
+S3_UPLOAD_CONCURRENCY = 16
+_upload_semaphore = asyncio.Semaphore(S3_UPLOAD_CONCURRENCY)
+
+# 🔥 重试交给 botocore：adaptive 模式对 503/限流做指数退避 + 抖动，调用方无需手写重试
+# 连接池覆盖 S3_UPLOAD_CONCURRENCY 个并发上传（upload_fileobj 单次会开多个分片线程）
+# 加上图片并行上传、批量删除等突发请求，开启 TCP keep-alive
+# 连接超时设短：连不上时尽快交给重试，而不是等默认的 60 秒
+S3_CLIENT_CONFIG = Config(
+    max_pool_connections=64,
+    retries={"max_attempts": 5, "mode": "adaptive"},
+    tcp_keepalive=True,
+    connect_timeout=2,
+    read_timeout=15,
+)
 
 
 class S3Service:
@@ -25,14 +48,14 @@ class S3Service:
         
         # 创建S3客户端
         # 在Lambda环境中,boto3会自动使用IAM角色凭证
-        self.s3_client = boto3.client("s3", **get_boto3_kwargs(settings))
+        self.s3_client = boto3.client("s3", config=S3_CLIENT_CONFIG, **get_boto3_kwargs(settings))
         
         # S3桶名
         self.bucket_name = settings.s3_bucket_name
 
     def upload_audio(
         self,
-        file_content: bytes,
+        file_content: Union[bytes, BinaryIO],
         file_name: str,
         content_type: str = 'audio/m4a'
     ) -> str:
@@ -40,7 +63,7 @@ class S3Service:
         上传音频文件到S3
         
         参数:
-            file_content: 文件的二进制内容
+            file_content: 文件的二进制内容，或可读的文件对象(如 UploadFile.file)
             file_name: 原始文件名(如:recording.m4a)
             content_type: 文件类型(默认audio/m4a)
         
@@ -55,27 +78,55 @@ class S3Service:
         
         try:
             # 第2步:上传到S3(设置为公开可读)
-            self.s3_client.put_object(
-                Bucket=self.bucket_name,
-                Key=s3_key,
-                Body=file_content,
-                ContentType=content_type,
-            )
+            if isinstance(file_content, (bytes, bytearray)):
+                self.s3_client.put_object(
+                    Bucket=self.bucket_name,
+                    Key=s3_key,
+                    Body=file_content,
+                    ContentType=content_type,
+                )
+            else:
+                # 🚀 文件对象直接流式上传（大文件自动分片），不需要先读进内存
+                self.s3_client.upload_fileobj(
+                    file_content,
+                    self.bucket_name,
+                    s3_key,
+                    ExtraArgs={"ContentType": content_type},
+                )
             
             # 第3步:生成公开URL(不需要签名,直接访问)
             # 前提:Bucket策略允许公开读取
             url = f"https://{self.bucket_name}.s3.amazonaws.com/{s3_key}"
             
-            print(f"✅ 文件上传成功: {url}")
+            logger.info("✅ 文件上传成功: %s", url)
             return url
             
         except Exception as e:
-            print(f"❌ S3上传失败: {str(e)}")
+            logger.error("❌ S3上传失败: %s", str(e))
             raise
+
+    async def upload_audio_async(
+        self,
+        file_content: Union[bytes, BinaryIO],
+        file_name: str,
+        content_type: str = 'audio/m4a'
+    ) -> str:
+        """
+        异步上传音频（受全局并发上限保护）
+        
+        boto3 是同步库，这里在线程中执行上传，并用信号量限制同时进行的上传数量
+        """
+        async with _upload_semaphore:
+            return await asyncio.to_thread(
+                self.upload_audio,
+                file_content=file_content,
+                file_name=file_name,
+                content_type=content_type
+            )
     
     def upload_image(
         self,
-        file_content: bytes,
+        file_content: Union[bytes, BinaryIO],
         file_name: str,
         content_type: str = 'image/jpeg'
     ) -> str:
@@ -83,7 +134,7 @@ class S3Service:
         Upload image file to S3
         
         Args:
-            file_content: Binary content of the image file
+            file_content: Binary content of the image file, or a readable file object (e.g. UploadFile.file)
             file_name: Original filename (e.g., photo.jpg)
             content_type: File type (default: image/jpeg)
         
@@ -97,21 +148,30 @@ class S3Service:
         
         try:
             # Step 2: Upload to S3 (public readable)
-            self.s3_client.put_object(
-                Bucket=self.bucket_name,
-                Key=s3_key,
-                Body=file_content,
-                ContentType=content_type,
-            )
+            if isinstance(file_content, (bytes, bytearray)):
+                self.s3_client.put_object(
+                    Bucket=self.bucket_name,
+                    Key=s3_key,
+                    Body=file_content,
+                    ContentType=content_type,
+                )
+            else:
+                # File objects are streamed in chunks instead of being read into memory first
+                self.s3_client.upload_fileobj(
+                    file_content,
+                    self.bucket_name,
+                    s3_key,
+                    ExtraArgs={"ContentType": content_type},
+                )
             
             # Step 3: Generate public URL
             url = f"https://{self.bucket_name}.s3.amazonaws.com/{s3_key}"
             
-            print(f"✅ Image uploaded successfully: {url}")
+            logger.info("✅ Image uploaded successfully: %s", url)
             return url
             
         except Exception as e:
-            print(f"❌ S3 upload failed: {str(e)}")
+            logger.error("❌ S3 upload failed: %s", str(e))
             raise
 
     def generate_presigned_url(
@@ -156,7 +216,7 @@ class S3Service:
             # Final public URL (after upload)
             final_url = f"https://{self.bucket_name}.s3.amazonaws.com/{s3_key}"
             
-            print(f"✅ Generated presigned URL for: {s3_key}")
+            logger.info("✅ Generated presigned URL for: %s", s3_key)
             
             return {
                 "presigned_url": presigned_url,
@@ -165,9 +225,33 @@ class S3Service:
             }
             
         except Exception as e:
-            print(f"❌ Failed to generate presigned URL: {str(e)}")
+            logger.error("❌ Failed to generate presigned URL: %s", str(e))
             raise
 
+    def generate_presigned_urls(
+        self,
+        file_names: List[str],
+        content_types: List[str],
+        expiration: int = 3600
+    ) -> List[dict]:
+        """
+        Generate presigned upload URLs for a batch of images with one client
+        
+        SigV4 signing is local CPU work; callers run the whole batch in a single
+        worker thread (asyncio.to_thread) instead of signing on the event loop.
+        Most of the per-URL cost is botocore's endpoint resolution (cached per
+        object key), not the HMAC signing-key derivation, so the signer itself
+        is left to boto3 rather than re-implemented here.
+        """
+        return [
+            self.generate_presigned_url(
+                file_name=file_name,
+                content_type=content_type or "image/jpeg",
+                expiration=expiration
+            )
+            for file_name, content_type in zip(file_names, content_types)
+        ]
+
     def generate_audio_presigned_url(
         self,
         file_name: str,
@@ -215,7 +299,7 @@ class S3Service:
             # 最终公开URL (上传后)
             final_url = f"https://{self.bucket_name}.s3.amazonaws.com/{s3_key}"
             
-            print(f"✅ 生成音频预签名URL: {s3_key}")
+            logger.info("✅ 生成音频预签名URL: %s", s3_key)
             
             return {
                 "presigned_url": presigned_url,
@@ -224,9 +308,31 @@ class S3Service:
             }
             
         except Exception as e:
-            print(f"❌ 生成音频预签名URL失败: {str(e)}")
+            logger.error("❌ 生成音频预签名URL失败: %s", str(e))
             raise
 
+    def _key_from_url(self, url: str) -> str:
+        """从 S3 URL 解析对象 key（兼容不同的 S3 URL 格式），解析不到返回空字符串"""
+        parsed = urlparse(url)
+        path = parsed.path.lstrip('/')
+
+        if not path and parsed.netloc:
+            # 尝试从自定义域名解析
+            marker = f"{self.bucket_name}/"
+            if marker in url:
+                path = url.split(marker, 1)[1]
+        return path
+
+    def download_object_by_url(self, url: str) -> bytes:
+        """
+        通过 S3 API（IAM 凭证 + 复用 boto3 连接池）下载对象，不走公网 URL
+        """
+        key = self._key_from_url(url)
+        if not key:
+            raise ValueError(f"无法从URL解析S3路径: {url}")
+        response = self.s3_client.get_object(Bucket=self.bucket_name, Key=key)
+        return response["Body"].read()
+
     def delete_objects_by_urls(self, urls: List[str]) -> None:
         """根据URL删除对象"""
         if not urls:
@@ -238,23 +344,14 @@ class S3Service:
                 continue
 
             try:
-                parsed = urlparse(url)
-                # 兼容不同的 S3 URL 格式
-                path = parsed.path.lstrip('/')
-
-                if not path and parsed.netloc:
-                    # 尝试从自定义域名解析
-                    marker = f"{self.bucket_name}/"
-                    if marker in url:
-                        path = url.split(marker, 1)[1]
-
+                path = self._key_from_url(url)
                 if not path:
-                    print(f"⚠️ 无法从URL解析S3路径: {url}")
+                    logger.warning("⚠️ 无法从URL解析S3路径: %s", url)
                     continue
 
                 keys.append(path)
             except Exception as parse_error:
-                print(f"⚠️ 解析S3 URL失败: {url} - {parse_error}")
+                logger.warning("⚠️ 解析S3 URL失败: %s - %s", url, parse_error)
 
         if not keys:
             return
@@ -268,13 +365,16 @@ class S3Service:
                     'Objects': [{'Key': key} for key in chunk],
                     'Quiet': True
                 }
-                self.s3_client.delete_objects(
+                response = self.s3_client.delete_objects(
                     Bucket=self.bucket_name,
                     Delete=delete_payload
                 )
-                print(f"🗑️ 已删除S3对象: {chunk}")
+                # Quiet 模式下只返回失败的 key
+                for error in response.get('Errors', []):
+                    logger.warning("⚠️ 删除S3对象失败: %s - %s", error.get('Key'), error.get('Message'))
+                logger.debug("🗑️ 已删除S3对象: %s", chunk)
             except Exception as delete_error:
-                print(f"❌ 删除S3对象失败: {delete_error}")
+                logger.error("❌ 删除S3对象失败: %s", delete_error)
                 raise
 
     def delete_image_by_url(self, url: str) -> None:
@@ -305,7 +405,7 @@ class S3Service:
         Returns:
             会话信息
         """
-        print(f"📦 创建分块上传会话: {session_id}")
+        logger.debug("📦 创建分块上传会话: %s", session_id)
         return {
             "session_id": session_id,
             "chunk_prefix": f"audio-chunks/{session_id}/",
@@ -345,7 +445,7 @@ class S3Service:
                 ExpiresIn=expiration
             )
             
-            print(f"✅ 生成 chunk 预签名 URL: {s3_key}")
+            logger.info("✅ 生成 chunk 预签名 URL: %s", s3_key)
             
             return {
                 "presigned_url": presigned_url,
@@ -354,9 +454,30 @@ class S3Service:
             }
             
         except Exception as e:
-            print(f"❌ 生成 chunk 预签名 URL 失败: {str(e)}")
+            logger.error("❌ 生成 chunk 预签名 URL 失败: %s", str(e))
             raise
     
+    def generate_chunk_presigned_urls(
+        self,
+        session_id: str,
+        start_index: int,
+        count: int,
+        content_type: str = 'audio/m4a'
+    ) -> List[dict]:
+        """
+        批量为连续的 chunk 生成预签名 URL（chunk_index 从 start_index 开始）
+        
+        签名是本地 CPU 计算，整批在一个线程里完成，前端一次请求拿到全部上传地址
+        """
+        return [
+            self.generate_chunk_presigned_url(
+                session_id=session_id,
+                chunk_index=chunk_index,
+                content_type=content_type
+            )
+            for chunk_index in range(start_index, start_index + count)
+        ]
+    
     def merge_chunks(
         self,
         session_id: str,
@@ -370,6 +491,9 @@ class S3Service:
         对于 M4A，我们采用"取最后一个完整 chunk"的策略
         因为每个 chunk 实际上包含了从开始到当前的所有录音
         
+        🚀 合并是一次服务端 CopyObject，音频数据不经过后端
+        （无论 chunk 数量多少都只有这一次调用，单 chunk 录音不需要额外的短路分支）
+        
         Args:
             session_id: 会话 ID
             chunk_count: chunk 总数
@@ -378,7 +502,7 @@ class S3Service:
         Returns:
             合并后文件的 S3 URL
         """
-        print(f"🔀 开始合并 chunks: session={session_id}, count={chunk_count}")
+        logger.debug("🔀 开始合并 chunks: session=%s, count=%s", session_id, chunk_count)
         
         if chunk_count == 0:
             raise ValueError("No chunks to merge")
@@ -401,20 +525,27 @@ class S3Service:
             )
             
             final_url = f"https://{self.bucket_name}.s3.amazonaws.com/{output_key}"
-            print(f"✅ Chunks 合并完成: {final_url}")
-            
-            # 清理临时 chunks（异步，不阻塞）
-            self._cleanup_chunks_async(session_id, chunk_count)
+            logger.info("✅ Chunks 合并完成: %s", final_url)
             
+            # 临时 chunks 由调用方在后台调用 cleanup_chunks 清理，不占用合并的关键路径
             return final_url
             
         except Exception as e:
-            print(f"❌ 合并 chunks 失败: {str(e)}")
+            logger.error("❌ 合并 chunks 失败: %s", str(e))
             raise
     
-    def _cleanup_chunks_async(self, session_id: str, chunk_count: int) -> None:
+    def download_chunk(self, session_id: str, chunk_index: int) -> bytes:
+        """
+        通过 S3 API 读取单个 chunk 的内容（与 merge_chunks 的 CopyObject 并行执行，
+        让后台转录直接使用这份数据，不必再读一次合并后的文件）
+        """
+        chunk_key = f"audio-chunks/{session_id}/chunk_{chunk_index:04d}.m4a"
+        response = self.s3_client.get_object(Bucket=self.bucket_name, Key=chunk_key)
+        return response["Body"].read()
+    
+    def cleanup_chunks(self, session_id: str, chunk_count: int) -> None:
         """
-        异步清理临时 chunks（后台执行，不阻塞主流程）
+        清理临时 chunks（同步的 boto3 调用，调用方放到后台线程执行，不阻塞主流程）
         """
         try:
             chunk_keys = [
@@ -431,7 +562,14 @@ class S3Service:
                     Bucket=self.bucket_name,
                     Delete=delete_payload
                 )
-                print(f"🧹 已清理 {len(chunk_keys)} 个临时 chunks")
+                logger.debug("🧹 已清理 %s 个临时 chunks", len(chunk_keys))
         except Exception as e:
             # 清理失败不影响主流程
-            print(f"⚠️ 清理 chunks 失败（不影响功能）: {e}")
+            logger.warning("⚠️ 清理 chunks 失败（不影响功能）: %s", e)
+
+
+# 🔥 单例：diary / account 路由共用一个 S3 客户端和连接池
+@lru_cache(maxsize=1)
+def get_s3_service() -> S3Service:
+    """获取 S3 服务单例"""
+    return S3Service()
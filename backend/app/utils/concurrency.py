@@ -0,0 +1,104 @@
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from typing import Coroutine, Optional, Set, Tuple, Type
+
+logger = logging.getLogger(__name__)
+
+# 后台任务的强引用集合：事件循环只持有弱引用，不保存的话任务可能在运行中被 GC 回收
+_background_tasks: Set[asyncio.Task] = set()
+
+
+class AdaptiveConcurrencyLimiter:
+    """
+    AIMD 自适应并发限制器（类似 TCP 拥塞窗口）
+
+    - 每完成一整个窗口的成功调用，并发上限 +1（加性增长）
+    - 遇到过载异常（如 OpenAI 429）时，并发上限减半（乘性减少）
+
+    用法:
+        async with limiter:
+            await call_api()
+    """
+
+    def __init__(
+        self,
+        initial_concurrency: int = 8,
+        max_concurrency: int = 64,
+        min_concurrency: int = 1,
+        overload_exceptions: Tuple[Type[BaseException], ...] = (),
+    ):
+        self.limit = initial_concurrency
+        self.max_concurrency = max_concurrency
+        self.min_concurrency = min_concurrency
+        self.overload_exceptions = overload_exceptions
+        self.in_flight = 0
+        self._successes = 0
+        self._condition = asyncio.Condition()
+
+    async def __aenter__(self) -> "AdaptiveConcurrencyLimiter":
+        async with self._condition:
+            await self._condition.wait_for(lambda: self.in_flight < self.limit)
+            self.in_flight += 1
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb) -> bool:
+        # 计数和上限在第一个 await 之前同步更新：等待锁时被取消也不会泄漏 in_flight
+        self.in_flight -= 1
+        if exc_type is not None and issubclass(exc_type, self.overload_exceptions):
+            self.limit = max(self.min_concurrency, self.limit // 2)
+            self._successes = 0
+            logger.warning("⚠️ 检测到过载，并发上限降至 %s", self.limit)
+        elif exc_type is None:
+            self._successes += 1
+            if self._successes >= self.limit and self.limit < self.max_concurrency:
+                self.limit += 1
+                self._successes = 0
+        # shield：调用方被取消时唤醒照常完成，等待中的协程不会错过空出的名额
+        await asyncio.shield(self._notify_waiters())
+        return False
+
+    async def _notify_waiters(self) -> None:
+        async with self._condition:
+            self._condition.notify_all()
+
+
+@asynccontextmanager
+async def structured_tasks():
+    """
+    asyncio.TaskGroup 的薄封装（结构化并发）
+
+    - 任意子任务或主体代码失败时，其余子任务会被确定性地取消，不再在后台空跑
+    - TaskGroup 会把异常包装成 ExceptionGroup；这里还原为第一个原始异常，
+      这样调用方现有的 except HTTPException / except Exception 分支保持不变
+    """
+    try:
+        async with asyncio.TaskGroup() as tg:
+            yield tg
+    except BaseExceptionGroup as eg:
+        first = eg.exceptions[0]
+        while isinstance(first, BaseExceptionGroup):
+            first = first.exceptions[0]
+        raise first from eg
+
+
+def _on_background_task_done(task: asyncio.Task) -> None:
+    _background_tasks.discard(task)
+    if task.cancelled():
+        return
+    exc = task.exception()
+    if exc is not None:
+        logger.error("❌ 后台任务异常退出: %s", task.get_name(), exc_info=exc)
+
+
+def spawn_background(coro: Coroutine, name: Optional[str] = None) -> asyncio.Task:
+    """
+    启动一个不等待结果的后台任务（替代裸的 asyncio.create_task）
+
+    - 任务在完成前一直被强引用，不会中途被回收
+    - 未捕获的异常会立即记录日志，而不是变成 "Task exception was never retrieved"
+    """
+    task = asyncio.create_task(coro, name=name)
+    _background_tasks.add(task)
+    task.add_done_callback(_on_background_task_done)
+    return task
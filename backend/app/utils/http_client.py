@@ -0,0 +1,40 @@
+from typing import Optional
+
+import httpx
+
+
+# 🔥 共享的 httpx 连接池：公网降级下载 / 图片下载复用 keep-alive 连接，省去每次 TCP+TLS 握手
+# keepalive_expiry 与 S3/DynamoDB 的空闲连接保持时间对齐（90 秒）
+HTTP_CLIENT_LIMITS = httpx.Limits(
+    max_connections=256,
+    max_keepalive_connections=64,
+    keepalive_expiry=90.0,
+)
+HTTP_CLIENT_TIMEOUT = httpx.Timeout(30.0, connect=10.0)
+
+_http_client: Optional[httpx.AsyncClient] = None
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """
+    获取进程级共享的 httpx.AsyncClient（懒加载）
+
+    创建过程中没有 await，单个事件循环内不会并发初始化，无需加锁；
+    Lambda 容器复用时全局变量保留，后续调用直接复用热连接。
+    单次请求的超时通过 client.get(..., timeout=...) 覆盖。
+    """
+    global _http_client
+    if _http_client is None or _http_client.is_closed:
+        _http_client = httpx.AsyncClient(
+            limits=HTTP_CLIENT_LIMITS,
+            timeout=HTTP_CLIENT_TIMEOUT,
+        )
+    return _http_client
+
+
+async def close_http_client() -> None:
+    """关闭共享连接池（应用 shutdown 时调用）"""
+    global _http_client
+    if _http_client is not None:
+        await _http_client.aclose()
+        _http_client = None
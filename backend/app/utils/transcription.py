@@ -1,44 +1,62 @@
 import json
+import logging
 import re
-from typing import Optional
+from functools import lru_cache
+from typing import Dict, Optional
 
 from fastapi import HTTPException
 
+logger = logging.getLogger(__name__)
+
+
+# Audio / transcription thresholds
+MIN_DURATION_SEC = 5
+MAX_DURATION_SEC = 600
+MIN_AUDIO_BYTES = 1000
+MIN_TRANSCRIPT_CHARS = 3
+
+_AUDIO_MESSAGES = {
+    "English": {
+        "too_short": "Recording too short. Please record at least 5 seconds of content. Try saying a complete sentence.",
+        "too_long": "Recording too long. Please keep it under 10 minutes.",
+        "too_small": "Audio file too small. It might not contain valid audio.",
+    },
+    "Chinese": {
+        "too_short": "录音时间太短，请至少录制5秒以上的内容。建议说一个完整的句子。",
+        "too_long": "录音时间过长，请控制在10分钟以内",
+        "too_small": "音频文件太小，可能没有录制到有效内容",
+    },
+}
+
+_WHITESPACE_RE = re.compile(r"[\s\n\r\t]+")
+_PUNCTUATION_RE = re.compile(r"[.,!?;:，。！？；：\"''\"'\-_/\\…]+")
+_EMPTY_TRANSCRIPT_DETAIL = json.dumps({"code": "EMPTY_TRANSCRIPT", "message": "No valid speech detected."})
+
+
+@lru_cache(maxsize=8)
+def _audio_messages(language: str) -> Dict[str, str]:
+    """
+    Resolve the error-message set for a language (anything but English falls back to Chinese).
+    """
+    return _AUDIO_MESSAGES["English" if language == "English" else "Chinese"]
+
 
 def validate_audio_quality(duration: int, audio_size: int, language: str = "Chinese") -> None:
     """
     Validate audio length and size for basic quality.
     """
-    print(f"🔍 开始音频质量验证 - 时长: {duration}秒, 大小: {audio_size} bytes, 语言: {language}")
-
-    if duration < 5:
-        if language == "English":
-            message = "Recording too short. Please record at least 5 seconds of content. Try saying a complete sentence."
-        else:
-            message = "录音时间太短，请至少录制5秒以上的内容。建议说一个完整的句子。"
-            
-        raise HTTPException(
-            status_code=400,
-            detail=message,
-        )
-
-    if duration > 600:
-        if language == "English":
-            message = "Recording too long. Please keep it under 10 minutes."
-        else:
-            message = "录音时间过长，请控制在10分钟以内"
-            
-        raise HTTPException(status_code=400, detail=message)
-
-    if audio_size < 1000:
-        if language == "English":
-            message = "Audio file too small. It might not contain valid audio."
-        else:
-            message = "音频文件太小，可能没有录制到有效内容"
-            
-        raise HTTPException(status_code=400, detail=message)
-
-    print("✅ 音频质量验证通过")
+    logger.debug("🔍 开始音频质量验证 - 时长: %s秒, 大小: %s bytes, 语言: %s", duration, audio_size, language)
+
+    if duration < MIN_DURATION_SEC:
+        raise HTTPException(status_code=400, detail=_audio_messages(language)["too_short"])
+
+    if duration > MAX_DURATION_SEC:
+        raise HTTPException(status_code=400, detail=_audio_messages(language)["too_long"])
+
+    if audio_size < MIN_AUDIO_BYTES:
+        raise HTTPException(status_code=400, detail=_audio_messages(language)["too_small"])
+
+    logger.info("✅ 音频质量验证通过")
 
 
 def normalize_transcription(text: str) -> str:
@@ -48,8 +66,8 @@ def normalize_transcription(text: str) -> str:
     if not text:
         return ""
 
-    normalized = re.sub(r"[\s\n\r\t]+", "", text)
-    normalized = re.sub(r"[.,!?;:，。！？；：\"''\"'\-_/\\…]+", "", normalized)
+    normalized = _WHITESPACE_RE.sub("", text)
+    normalized = _PUNCTUATION_RE.sub("", normalized)
 
     return normalized
 
@@ -58,17 +76,14 @@ def validate_transcription(transcription: str, duration: Optional[int] = None) -
     """
     Validate transcription quality by normalized length and density.
     """
-    print("🔍 开始转录结果验证...")
-    print(f"🔍 原始转录结果: '{transcription}'")
+    logger.debug("🔍 开始转录结果验证...")
+    logger.debug("🔍 原始转录结果: '%s'", transcription)
 
     normalized = normalize_transcription(transcription)
-    print(f"🔍 标准化后转录结果: '{normalized}' (长度: {len(normalized)})")
+    logger.debug("🔍 标准化后转录结果: '%s' (长度: %s)", normalized, len(normalized))
 
-    if len(normalized) < 3:
-        print(f"❌ 转录内容为空或无效（标准化后长度: {len(normalized)}）")
-        raise HTTPException(
-            status_code=400,
-            detail=json.dumps({"code": "EMPTY_TRANSCRIPT", "message": "No valid speech detected."}),
-        )
+    if len(normalized) < MIN_TRANSCRIPT_CHARS:
+        logger.error("❌ 转录内容为空或无效（标准化后长度: %s）", len(normalized))
+        raise HTTPException(status_code=400, detail=_EMPTY_TRANSCRIPT_DETAIL)
 
-    print(f"✅ 转录结果验证通过 - 内容: {transcription[:50]}...")
+    logger.info("✅ 转录结果验证通过 - 内容: %s...", transcription[:50])
@@ -11,8 +11,18 @@ AWS Lambda处理器
 - lambda_handler再翻译回Lambda能理解的格式
 """
 
+import logging
 from mangum import Mangum
 from app.main import app
+from app.services.openai_service import get_openai_service
+
+logger = logging.getLogger(__name__)
+
+# 冷启动阶段就创建 AI 服务单例（连接池），首个请求不再付初始化成本
+try:
+    get_openai_service()
+except Exception:
+    logger.warning("⚠️ AI 服务预热失败（首个请求时再初始化）", exc_info=True)
 
 # Mangum是一个"适配器"
 # 它把ASGI应用(FastAPI)转换成Lambda能用的格式
@@ -20,4 +30,5 @@ handler = Mangum(app, lifespan="off")
 
 # 为什么lifespan="off"?
 # Lambda每次只处理一个请求,处理完就休眠
-# 不需要FastAPI的startup/shutdown事件
\ No newline at end of file
+# 启动工作（AI 服务预热）已在上面导入模块时完成，不依赖 FastAPI 的 lifespan；
+# 关闭阶段 Lambda 直接冻结/回收执行环境，也不会运行 lifespan 的收尾逻辑
\ No newline at end of file
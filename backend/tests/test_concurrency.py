@@ -0,0 +1,116 @@
+import asyncio
+import os
+import sys
+import unittest
+
+
+CURRENT_DIR = os.path.dirname(__file__)
+BACKEND_ROOT = os.path.abspath(os.path.join(CURRENT_DIR, ".."))
+if BACKEND_ROOT not in sys.path:
+    sys.path.insert(0, BACKEND_ROOT)
+
+from app.utils import concurrency  # noqa: E402
+from app.utils.concurrency import AdaptiveConcurrencyLimiter, spawn_background, structured_tasks  # noqa: E402
+
+
+class Overloaded(Exception):
+    pass
+
+
+class AdaptiveConcurrencyLimiterTests(unittest.TestCase):
+    def test_overload_halves_limit(self):
+        limiter = AdaptiveConcurrencyLimiter(initial_concurrency=8, overload_exceptions=(Overloaded,))
+
+        async def run():
+            with self.assertRaises(Overloaded):
+                async with limiter:
+                    raise Overloaded()
+
+        asyncio.run(run())
+        self.assertEqual(limiter.limit, 4)
+        self.assertEqual(limiter.in_flight, 0)
+
+    def test_successes_grow_limit_and_cap_in_flight(self):
+        limiter = AdaptiveConcurrencyLimiter(initial_concurrency=2, max_concurrency=3)
+        peak = 0
+
+        async def worker():
+            nonlocal peak
+            async with limiter:
+                peak = max(peak, limiter.in_flight)
+                await asyncio.sleep(0)
+
+        async def run():
+            await asyncio.gather(*(worker() for _ in range(10)))
+
+        asyncio.run(run())
+        self.assertLessEqual(peak, 3)
+        self.assertEqual(limiter.limit, 3)
+
+    def test_cancel_during_exit_does_not_leak_in_flight(self):
+        limiter = AdaptiveConcurrencyLimiter(initial_concurrency=1)
+
+        async def worker(release: asyncio.Event):
+            async with limiter:
+                await release.wait()
+
+        async def run():
+            release = asyncio.Event()
+            task = asyncio.create_task(worker(release))
+            await asyncio.sleep(0)
+            async with limiter._condition:
+                release.set()
+                await asyncio.sleep(0)
+                task.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await task
+            async with limiter:
+                pass
+
+        asyncio.run(asyncio.wait_for(run(), timeout=1))
+        self.assertEqual(limiter.in_flight, 0)
+
+
+class StructuredTasksTests(unittest.TestCase):
+    def test_failure_cancels_siblings_and_reraises_original_error(self):
+        cancelled = []
+
+        async def sibling():
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.append(True)
+                raise
+
+        async def run():
+            async with structured_tasks() as tg:
+                tg.create_task(sibling())
+                await asyncio.sleep(0)
+                raise Overloaded()
+
+        with self.assertRaises(Overloaded):
+            asyncio.run(run())
+        self.assertEqual(cancelled, [True])
+
+
+
+class SpawnBackgroundTests(unittest.TestCase):
+    def test_failed_task_is_logged_and_released(self):
+        async def boom():
+            raise Overloaded()
+
+        async def run():
+            task = spawn_background(boom(), name="boom")
+            self.assertIn(task, concurrency._background_tasks)
+            await asyncio.wait([task])
+            await asyncio.sleep(0)
+            return task
+
+        with self.assertLogs("app.utils.concurrency", level="ERROR") as logs:
+            task = asyncio.run(run())
+        self.assertNotIn(task, concurrency._background_tasks)
+        self.assertIn("boom", logs.output[0])
+
+
+if __name__ == "__main__":
+    unittest.main()
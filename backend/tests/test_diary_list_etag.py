@@ -0,0 +1,23 @@
+import os
+import sys
+import unittest
+
+
+CURRENT_DIR = os.path.dirname(__file__)
+BACKEND_ROOT = os.path.abspath(os.path.join(CURRENT_DIR, ".."))
+if BACKEND_ROOT not in sys.path:
+    sys.path.insert(0, BACKEND_ROOT)
+
+from app.routers import diary  # noqa: E402
+
+
+class DiaryListEtagTests(unittest.TestCase):
+    def test_content_edit_without_version_bump_changes_etag(self):
+        before = [{"diary_id": "d1", "version": 1, "title": "a"}]
+        after = [{"diary_id": "d1", "version": 1, "title": "b"}]
+        self.assertNotEqual(diary._diary_list_etag(before), diary._diary_list_etag(after))
+        self.assertEqual(diary._diary_list_etag(before), diary._diary_list_etag([dict(before[0])]))
+
+
+if __name__ == "__main__":
+    unittest.main()
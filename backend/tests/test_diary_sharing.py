@@ -0,0 +1,60 @@
+import asyncio
+import os
+import sys
+import unittest
+from unittest import mock
+
+
+CURRENT_DIR = os.path.dirname(__file__)
+BACKEND_ROOT = os.path.abspath(os.path.join(CURRENT_DIR, ".."))
+if BACKEND_ROOT not in sys.path:
+    sys.path.insert(0, BACKEND_ROOT)
+
+from app.routers import diary  # noqa: E402
+
+
+class CircleMembershipCacheTests(unittest.TestCase):
+    def tearDown(self):
+        diary._circle_membership_cache.clear()
+
+    def test_positive_membership_is_cached_and_negative_is_not(self):
+        async def run():
+            return [
+                await diary.is_circle_member_cached("c1", "u1"),
+                await diary.is_circle_member_cached("c1", "u1"),
+                await diary.is_circle_member_cached("c2", "u1"),
+                await diary.is_circle_member_cached("c2", "u1"),
+            ]
+
+        lookup = mock.Mock(side_effect=lambda circle_id, user_id: circle_id == "c1")
+        with mock.patch.object(diary.circle_service, "is_circle_member", lookup):
+            results = asyncio.run(run())
+        self.assertEqual(results, [True, True, False, False])
+        self.assertEqual(lookup.call_count, 3)
+
+
+class ShareSingleFlightTests(unittest.TestCase):
+    def test_concurrent_duplicate_shares_run_once(self):
+        calls = []
+
+        async def fake_share(diary_id, circle_id, user):
+            calls.append(diary_id)
+            await asyncio.sleep(0)
+            return {"share": {"shareId": "s1"}}
+
+        async def run():
+            user = {"user_id": "u1"}
+            return await asyncio.gather(
+                diary.share_diary("d1", circle_id="c1", user=user),
+                diary.share_diary("d1", circle_id="c1", user=user),
+            )
+
+        with mock.patch.object(diary, "_share_diary_once", fake_share):
+            results = asyncio.run(run())
+        self.assertEqual(calls, ["d1"])
+        self.assertEqual(results[0], results[1])
+        self.assertEqual(diary._inflight_shares, {})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,99 @@
+import os
+import sys
+import unittest
+from decimal import Decimal
+from unittest import mock
+
+
+CURRENT_DIR = os.path.dirname(__file__)
+BACKEND_ROOT = os.path.abspath(os.path.join(CURRENT_DIR, ".."))
+if BACKEND_ROOT not in sys.path:
+    sys.path.insert(0, BACKEND_ROOT)
+
+from app.services.dynamodb_service import DynamoDBService  # noqa: E402
+
+
+class DynamoDBServiceTests(unittest.TestCase):
+    def setUp(self):
+        self.service = object.__new__(DynamoDBService)
+        self.service.table = mock.MagicMock()
+
+    def test_update_task_fields_writes_only_progress_fields(self):
+        task_data = {"status": "processing", "progress": 40, "step": 1, "diary": {"id": "d1"}}
+        self.service.update_task_fields("t6", task_data, user_id="u1")
+        kwargs = self.service.table.update_item.call_args.kwargs
+        self.assertEqual(kwargs["Key"], {"userId": "u1", "createdAt": "TASK#t6"})
+        self.assertEqual(set(kwargs["ExpressionAttributeNames"].values()), {"status", "progress", "step"})
+        self.service.table.put_item.assert_not_called()
+
+    def test_stale_processing_update_is_fenced_by_terminal_status(self):
+        conflict = type("ConditionalCheckFailedException", (Exception,), {})
+        self.service.table.meta.client.exceptions.ConditionalCheckFailedException = conflict
+        error = conflict()
+        error.response = {"Item": {"status": {"S": "completed"}}}
+        self.service.table.update_item.side_effect = error
+        self.service.update_task_fields("t5", {"status": "processing", "progress": 90}, user_id="u1")
+        kwargs = self.service.table.update_item.call_args.kwargs
+        self.assertIn("NOT #status IN (:completed, :failed)", kwargs["ConditionExpression"])
+        self.service.table.put_item.assert_not_called()
+
+    def test_terminal_put_is_unconditional(self):
+        self.service.save_task_progress("t5", {"status": "failed", "progress": 0}, user_id="u1")
+        self.assertNotIn("ConditionExpression", self.service.table.put_item.call_args.kwargs)
+        self.service.save_task_progress("t5", {"status": "processing", "progress": 90}, user_id="u1")
+        self.assertIn("ConditionExpression", self.service.table.put_item.call_args.kwargs)
+
+    def test_search_queries_user_partition_until_limit(self):
+        item = {"diaryId": "d1", "userId": "u1", "createdAt": "2026-01-01", "title": "hello"}
+        self.service.table.query.side_effect = [
+            {"Items": [item], "LastEvaluatedKey": {"userId": "u1", "createdAt": "a"}},
+            {"Items": [item], "LastEvaluatedKey": {"userId": "u1", "createdAt": "b"}},
+        ]
+        diaries, last_key = self.service.search_user_diaries("u1", "hello", limit=2)
+        self.assertEqual([d["diary_id"] for d in diaries], ["d1", "d1"])
+        self.assertEqual(last_key, {"userId": "u1", "createdAt": "b"})
+        self.service.table.scan.assert_not_called()
+        kwargs = self.service.table.query.call_args.kwargs
+        self.assertFalse(kwargs["ScanIndexForward"])
+        self.assertIn("attribute_not_exists(#it)", kwargs["FilterExpression"])
+        self.assertEqual(kwargs["ExpressionAttributeValues"][":q"], "hello")
+
+    def test_delete_user_data_batches_deletes(self):
+        self.service.table.query.return_value = {"Items": [
+            {"userId": "u1", "createdAt": "2026-01-01", "audioUrl": "https://a/1.m4a"},
+            {"userId": "u1", "createdAt": "2026-01-02"},
+        ]}
+        batch = self.service.table.batch_writer.return_value.__enter__.return_value
+        audio_urls = self.service.delete_user_data("u1")
+        self.assertEqual(audio_urls, ["https://a/1.m4a"])
+        self.assertEqual(batch.delete_item.call_count, 2)
+        self.service.table.delete_item.assert_not_called()
+        self.assertEqual(self.service.table.query.call_args.kwargs["ProjectionExpression"], "createdAt, audioUrl")
+
+    def test_get_diary_by_id_uses_index_then_primary_key(self):
+        self.service.table.query.return_value = {"Items": [{"userId": "u1", "createdAt": "2026-01-01"}]}
+        self.service.table.get_item.return_value = {"Item": {"diaryId": "d1", "userId": "u1", "createdAt": "2026-01-01"}}
+        diary = self.service.get_diary_by_id("d1", "u1")
+        self.assertEqual(diary["diary_id"], "d1")
+        self.service.table.get_item.assert_called_once_with(Key={"userId": "u1", "createdAt": "2026-01-01"})
+        self.service.table.scan.assert_not_called()
+        self.assertIsNone(self.service.get_diary_by_id("d1", "someone-else"))
+
+    def test_convert_to_decimal_copies_only_when_floats_present(self):
+        plain = {"status": "completed", "diary": {"image_urls": ["a"]}}
+        self.assertIs(self.service._convert_to_decimal(plain), plain)
+
+        task = {"status": "completed", "diary": {"emotion_data": {"confidence": 0.5}}}
+        converted = self.service._convert_to_decimal(task)
+        self.assertEqual(converted["diary"]["emotion_data"]["confidence"], Decimal("0.5"))
+        self.assertEqual(task["diary"]["emotion_data"]["confidence"], 0.5)
+
+    def test_task_item_does_not_mutate_task_data(self):
+        task = {"status": "processing", "progress": 10}
+        item = self.service._build_task_item("t1", task, "u1")
+        self.assertEqual(item["createdAt"], "TASK#t1")
+        self.assertEqual(task, {"status": "processing", "progress": 10})
+
+
+if __name__ == "__main__":
+    unittest.main()
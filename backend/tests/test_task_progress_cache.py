@@ -0,0 +1,241 @@
+import asyncio
+import os
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+
+CURRENT_DIR = os.path.dirname(__file__)
+BACKEND_ROOT = os.path.abspath(os.path.join(CURRENT_DIR, ".."))
+if BACKEND_ROOT not in sys.path:
+    sys.path.insert(0, BACKEND_ROOT)
+
+from app.routers import diary  # noqa: E402
+
+
+class TaskProgressCacheTests(unittest.TestCase):
+    def setUp(self):
+        self._original_max = diary.TASK_PROGRESS_MAX_ENTRIES
+        diary.task_progress.clear()
+
+    def tearDown(self):
+        diary.TASK_PROGRESS_MAX_ENTRIES = self._original_max
+        diary.task_progress.clear()
+
+    def test_cache_task_evicts_oldest_beyond_cap(self):
+        diary.TASK_PROGRESS_MAX_ENTRIES = 2
+        diary.cache_task("a", {"progress": 1})
+        diary.cache_task("b", {"progress": 2})
+        diary.cache_task("c", {"progress": 3})
+        self.assertIsNone(diary.get_cached_task("a"))
+        self.assertEqual(list(diary.task_progress), ["b", "c"])
+
+    def test_get_cached_task_marks_entry_recently_used(self):
+        diary.TASK_PROGRESS_MAX_ENTRIES = 2
+        diary.cache_task("a", {"progress": 1})
+        diary.cache_task("b", {"progress": 2})
+        self.assertEqual(diary.get_cached_task("a"), {"progress": 1})
+        diary.cache_task("c", {"progress": 3})
+        self.assertIsNone(diary.get_cached_task("b"))
+        self.assertEqual(diary.get_cached_task("a"), {"progress": 1})
+
+    def test_terminal_task_is_evicted_after_ttl(self):
+        async def run():
+            diary.update_task_progress("t7", "failed", 0, user_id="u1")
+            self.assertIsNotNone(diary.get_cached_task("t7"))
+            await asyncio.sleep(0.01)
+
+        with mock.patch.object(diary.db_service, "save_task_progress"), \
+                mock.patch.object(diary.db_service, "get_task_progress", return_value=None), \
+                mock.patch.object(diary, "TERMINAL_TASK_CACHE_TTL", 0):
+            asyncio.run(run())
+        self.assertIsNone(diary.get_cached_task("t7"))
+
+
+class TaskProgressFlushTests(unittest.TestCase):
+    def setUp(self):
+        diary.task_progress.clear()
+        diary._dirty_progress.clear()
+
+    def tearDown(self):
+        diary.task_progress.clear()
+        diary._dirty_progress.clear()
+
+    def test_processing_updates_are_coalesced_into_one_write(self):
+        async def run():
+            for progress in (10, 20, 30):
+                diary.update_task_progress("t1", "processing", progress, user_id="u1")
+            await diary._progress_flusher
+
+        with mock.patch.object(diary.db_service, "update_task_fields") as save, \
+                mock.patch.object(diary.db_service, "get_task_progress", return_value=None), \
+                mock.patch.object(diary, "PROGRESS_FLUSH_INTERVAL", 0):
+            asyncio.run(run())
+        save.assert_called_once()
+        self.assertEqual(save.call_args.args[1]["progress"], 30)
+
+    def test_terminal_status_is_written_immediately(self):
+        with mock.patch.object(diary.db_service, "save_task_progress") as save, \
+                mock.patch.object(diary.db_service, "get_task_progress", return_value=None):
+            diary.update_task_progress("t2", "completed", 100, user_id="u1")
+        save.assert_called_once()
+        self.assertNotIn("t2", diary._dirty_progress)
+
+    def test_terminal_status_is_written_off_the_event_loop(self):
+        async def run():
+            diary.update_task_progress("t5", "completed", 100, user_id="u1")
+            save.assert_not_called()
+            await asyncio.wait_for(diary._progress_flusher, timeout=1)
+
+        with mock.patch.object(diary.db_service, "save_task_progress") as save, \
+                mock.patch.object(diary.db_service, "update_task_fields") as update, \
+                mock.patch.object(diary.db_service, "get_task_progress", return_value=None), \
+                mock.patch.object(diary, "PROGRESS_FLUSH_INTERVAL", 30):
+            asyncio.run(run())
+        save.assert_called_once()
+        self.assertEqual(save.call_args.args[1]["status"], "completed")
+        update.assert_not_called()
+
+    def test_new_task_is_put_before_register_returns(self):
+        async def run():
+            await diary.register_new_task("t8", {"status": "processing", "progress": 15, "user_id": "u1"}, "u1")
+            put.assert_called_once()
+            self.assertEqual(put.call_args.args[1]["progress"], 15)
+            diary.update_task_progress("t8", "processing", 20, user_id="u1")
+            await asyncio.wait_for(diary._progress_flusher, timeout=1)
+
+        with mock.patch.object(diary.db_service, "save_task_progress") as put, \
+                mock.patch.object(diary.db_service, "update_task_fields") as update, \
+                mock.patch.object(diary, "PROGRESS_FLUSH_INTERVAL", 0):
+            asyncio.run(run())
+        put.assert_called_once()
+        update.assert_called_once()
+        self.assertEqual(update.call_args.args[1]["progress"], 20)
+
+    def test_step_change_wakes_flusher_without_waiting_interval(self):
+        async def run():
+            diary.update_task_progress("t3", "processing", 60, 2, user_id="u1")
+            await asyncio.wait_for(diary._progress_flusher, timeout=1)
+
+        diary.cache_task("t3", {"status": "processing", "progress": 40, "step": 1})
+        with mock.patch.object(diary.db_service, "update_task_fields") as save, \
+                mock.patch.object(diary, "PROGRESS_FLUSH_INTERVAL", 30):
+            asyncio.run(run())
+        save.assert_called_once()
+        self.assertEqual(save.call_args.args[1]["step"], 2)
+        self.assertNotIn("t3", diary._dirty_progress)
+
+
+class PendingImageEventTests(unittest.TestCase):
+    def tearDown(self):
+        diary.task_progress.clear()
+        diary.pending_image_events.clear()
+
+    def test_add_images_wakes_waiting_task(self):
+        async def run():
+            event = diary.pending_image_events["t4"] = asyncio.Event()
+            await diary.add_images_to_task("t4", ["https://img/1.jpg"], user={"user_id": "u1"})
+            return event
+
+        task_data = {"status": "processing", "user_id": "u1", "pending_image_upload": True}
+        with mock.patch.object(diary.db_service, "get_task_progress", return_value=task_data), \
+                mock.patch.object(diary.db_service, "save_task_progress"):
+            event = asyncio.run(run())
+        self.assertTrue(event.is_set())
+        self.assertEqual(diary.get_cached_task("t4")["image_urls"], ["https://img/1.jpg"])
+
+
+class AudioCacheTests(unittest.TestCase):
+    def tearDown(self):
+        diary.task_progress.clear()
+        for url in list(diary._audio_cache):
+            diary.release_cached_audio(url)
+
+    def test_evicts_least_recently_used_beyond_byte_cap(self):
+        with mock.patch.object(diary, "AUDIO_CACHE_MAX_BYTES", 10):
+            diary._cache_audio("a", b"12345")
+            diary._cache_audio("b", b"12345")
+            diary._get_cached_audio("a")
+            diary._cache_audio("c", b"12345")
+        self.assertIsNone(diary._get_cached_audio("b"))
+        self.assertEqual(diary._get_cached_audio("a"), b"12345")
+        self.assertEqual(diary._audio_cache_bytes, 10)
+
+    def test_failed_task_releases_cached_audio(self):
+        async def run():
+            await diary.process_voice_diary_with_url_async("t10", "https://audio/1.m4a", 5, {"user_id": "u1"}, ctx)
+
+        ctx = diary.UserContext(user_id="u1", display_name=None, lang="zh")
+        diary._cache_audio("https://audio/1.m4a", b"12345")
+        with mock.patch.object(diary, "process_voice_diary_async", side_effect=RuntimeError("boom")), \
+                mock.patch.object(diary.db_service, "save_task_progress"), \
+                mock.patch.object(diary.db_service, "get_task_progress", return_value=None):
+            asyncio.run(run())
+        self.assertEqual(diary.get_cached_task("t10")["status"], "failed")
+        self.assertIsNone(diary._get_cached_audio("https://audio/1.m4a"))
+
+
+class IndependentReaderTests(unittest.TestCase):
+    def test_in_memory_spool_is_copied_without_rolling_over(self):
+        spool = tempfile.SpooledTemporaryFile(max_size=1024)
+        spool.write(b"audio")
+        reader = diary.open_independent_reader(spool)
+        self.assertFalse(spool._rolled)
+        self.assertEqual(reader.read(), b"audio")
+        self.assertEqual(spool.tell(), 5)
+
+    def test_falls_back_to_temp_copy_without_proc_fd(self):
+        with tempfile.TemporaryFile() as source:
+            source.write(b"audio")
+            with mock.patch("builtins.open", side_effect=OSError("no /proc")):
+                reader = diary.open_independent_reader(source)
+            with reader:
+                self.assertEqual(reader.read(), b"audio")
+            self.assertEqual(source.tell(), 5)
+
+
+class ChunkedUploadTests(unittest.TestCase):
+    def setUp(self):
+        self.ctx = diary.UserContext(user_id="u1", display_name=None, lang="zh")
+        diary.cache_task("t9", {"status": "processing", "progress": 5, "step": 0, "user_id": "u1"})
+
+    def tearDown(self):
+        diary.task_progress.clear()
+        for url in list(diary._audio_cache):
+            diary.release_cached_audio(url)
+
+    def _run(self, **s3_patches):
+        async def run():
+            await diary.process_chunked_upload_async(
+                "t9", "s1", 3, 10, {"user_id": "u1"}, self.ctx, pure_voice=True
+            )
+            await asyncio.sleep(0)
+
+        pipeline = mock.AsyncMock()
+        with mock.patch.multiple(diary.s3_service, cleanup_chunks=mock.DEFAULT, **s3_patches), \
+                mock.patch.object(diary, "process_pure_voice_diary_with_url_async", pipeline), \
+                mock.patch.object(diary.db_service, "save_task_progress"), \
+                mock.patch.object(diary.db_service, "update_task_fields") as self.update_fields, \
+                mock.patch.object(diary, "TERMINAL_TASK_CACHE_TTL", 10):
+            asyncio.run(run())
+        return pipeline
+
+    def test_merge_runs_in_background_and_primes_audio_cache(self):
+        pipeline = self._run(merge_chunks=mock.Mock(return_value="https://b/audio/x.m4a"),
+                             download_chunk=mock.Mock(return_value=b"audio"))
+        self.assertEqual(pipeline.await_args.kwargs["audio_url"], "https://b/audio/x.m4a")
+        self.assertEqual(diary._get_cached_audio("https://b/audio/x.m4a"), b"audio")
+        self.assertEqual(diary.get_cached_task("t9")["progress"], 15)
+        self.assertEqual(self.update_fields.call_args.args[1]["audio_url"], "https://b/audio/x.m4a")
+
+    def test_merge_failure_marks_task_failed(self):
+        pipeline = self._run(merge_chunks=mock.Mock(side_effect=RuntimeError("copy failed")),
+                             download_chunk=mock.Mock(return_value=b"audio"))
+        pipeline.assert_not_awaited()
+        self.assertEqual(diary.get_cached_task("t9")["status"], "failed")
+        self.assertEqual(diary.get_cached_task("t9")["error"], "CHUNK_MERGE_FAILED")
+
+
+if __name__ == "__main__":
+    unittest.main()
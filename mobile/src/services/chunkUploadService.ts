@@ -12,7 +12,7 @@
  * 工作流程:
  * 1. 录音完成后，生成 session_id
  * 2. 将音频文件分成多个 chunks
- * 3. 为每个 chunk 获取预签名 URL
+ * 3. 批量获取所有 chunk 的预签名 URL（一次请求）
  * 4. 并行上传所有 chunks
  * 5. 调用后端合并并开始处理
  */
@@ -26,6 +26,7 @@ const CHUNK_SIZE = 512 * 1024; // 512KB per chunk
 const MAX_PARALLEL_UPLOADS = 3; // 最多同时上传 3 个 chunks
 const CHUNK_UPLOAD_TIMEOUT = 30000; // 30 秒超时
 const MAX_RETRIES = 2; // 每个 chunk 最多重试 2 次
+const MAX_CHUNK_URLS_PER_REQUEST = 60; // 与后端批量签名接口上限一致
 
 // 类型定义
 interface ChunkInfo {
@@ -46,7 +47,7 @@ interface ChunkUploadProgress {
 
 interface ChunkUploadResult {
   taskId: string;
-  audioUrl: string;
+  audioUrl: string | null; // 服务端在后台合并，返回时还没有最终地址
   totalChunks: number;
   uploadTimeMs: number;
 }
@@ -164,6 +165,65 @@ async function getChunkPresignedUrl(
   };
 }
 
+/**
+ * 批量获取连续 chunks 的预签名 URL（一次请求，省去每个 chunk 一次往返）
+ */
+async function getChunkPresignedUrls(
+  sessionId: string,
+  startIndex: number,
+  count: number
+): Promise<{ presignedUrl: string; s3Key: string }[]> {
+  const accessToken = await getAccessToken();
+  if (!accessToken) {
+    throw new Error("AUTH_REQUIRED");
+  }
+  
+  const formData = new FormData();
+  formData.append("session_id", sessionId);
+  formData.append("start_index", startIndex.toString());
+  formData.append("count", count.toString());
+  formData.append("content_type", "audio/m4a");
+  
+  const response = await fetch(`${API_BASE_URL}/diary/audio/chunk-presigned-urls`, {
+    method: "POST",
+    headers: {
+      Authorization: `Bearer ${accessToken}`,
+    },
+    body: formData,
+  });
+  
+  if (!response.ok) {
+    throw new Error(`CHUNK_PRESIGNED_URLS_FAILED: ${response.status}`);
+  }
+  
+  const data = await response.json();
+  return data.presigned_urls.map((item: { presigned_url: string; s3_key: string }) => ({
+    presignedUrl: item.presigned_url,
+    s3Key: item.s3_key,
+  }));
+}
+
+/**
+ * 预先为所有 chunks 填充预签名 URL；失败时保持为空，由上传时逐个获取兜底
+ */
+async function prefetchChunkPresignedUrls(
+  sessionId: string,
+  chunkInfos: ChunkInfo[]
+): Promise<void> {
+  try {
+    for (let start = 0; start < chunkInfos.length; start += MAX_CHUNK_URLS_PER_REQUEST) {
+      const count = Math.min(MAX_CHUNK_URLS_PER_REQUEST, chunkInfos.length - start);
+      const urls = await getChunkPresignedUrls(sessionId, start, count);
+      urls.forEach((urlData, offset) => {
+        chunkInfos[start + offset].presignedUrl = urlData.presignedUrl;
+        chunkInfos[start + offset].s3Key = urlData.s3Key;
+      });
+    }
+  } catch (error) {
+    console.warn("⚠️ 批量获取预签名 URL 失败，改为逐个获取:", error);
+  }
+}
+
 /**
  * 上传单个 chunk 到 S3
  */
@@ -229,6 +289,9 @@ async function uploadChunksInParallel(
     retryCount: 0,
   }));
   
+  // 一次请求拿到所有 chunk 的上传地址
+  await prefetchChunkPresignedUrls(sessionId, chunkInfos);
+  
   let completedCount = 0;
   const totalChunks = chunks.length;
   
@@ -334,7 +397,7 @@ async function completeChunkUpload(
   imageUrls?: string[],
   expectImages?: boolean,
   userName?: string
-): Promise<{ taskId: string; audioUrl: string }> {
+): Promise<{ taskId: string; audioUrl: string | null }> {
   const accessToken = await getAccessToken();
   if (!accessToken) {
     throw new Error("AUTH_REQUIRED");
@@ -379,7 +442,7 @@ async function completeChunkUpload(
   const data = await response.json();
   return {
     taskId: data.task_id,
-    audioUrl: data.audio_url,
+    audioUrl: data.audio_url ?? null,
   };
 }
 